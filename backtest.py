@@ -0,0 +1,201 @@
+import numpy as np
+from scipy.signal import lfilter
+from indicators import SMA_WINDOWS, MACD_FAST, MACD_SLOW, MACD_SIGNAL
+
+STRATEGIES = ("sma_crossover", "macd", "transformer")
+PERIODS_PER_YEAR = 252  # Daily bars; use market_data.periods_per_year() for other timeframes
+METRICS = ("total_return", "buy_hold_return", "annualized_return", "sharpe_ratio", "max_drawdown", "win_rate")
+
+
+def load_closes(store, symbols, timeframe, window=None):
+    """(timestamps, close) per symbol from a MarketDataStore, plus an error message per missing symbol"""
+    series, errors = {}, {}
+    for symbol in symbols:
+        if not store.exists(symbol, timeframe):
+            errors[symbol] = f"No {timeframe} stock data for {symbol}"
+            continue
+        frame, _ = store.load(symbol, timeframe, window)
+        series[symbol] = (frame['timestamp'].to_numpy(), frame['close'].to_numpy())
+    return series, errors
+
+
+def align_panel(series):
+    """Stack per-symbol series into a (symbols, time) matrix on the timestamps every symbol has.
+
+    `series` maps symbol -> (timestamps, values); returns (symbols, timestamps, matrix).
+    """
+    symbols = list(series)
+    common = None
+    for timestamps, _ in series.values():
+        common = np.asarray(timestamps) if common is None else np.intersect1d(common, timestamps, assume_unique=True)
+    matrix = np.empty((len(symbols), len(common)))
+    for row, symbol in enumerate(symbols):
+        timestamps, values = series[symbol]
+        matrix[row] = np.asarray(values)[np.searchsorted(timestamps, common)]
+    return symbols, common, matrix
+
+
+def rolling_mean(close, window):
+    """Simple moving average along the time axis; NaN until `window` bars are available"""
+    cumsum = np.cumsum(close, axis=1)
+    out = np.full(close.shape, np.nan)
+    if close.shape[1] >= window:
+        out[:, window - 1] = cumsum[:, window - 1]
+        out[:, window:] = cumsum[:, window:] - cumsum[:, :-window]
+        out[:, window - 1:] /= window
+    return out
+
+
+def ema(values, span):
+    """ewm(span, adjust=False).mean() along the time axis, run for every row at once"""
+    alpha = 2.0 / (span + 1.0)
+    # y[t] = alpha * x[t] + (1 - alpha) * y[t-1], seeded so that y[0] = x[0]
+    initial = (1.0 - alpha) * values[:, :1]
+    out, _ = lfilter([alpha], [1.0, alpha - 1.0], values, axis=1, zi=initial)
+    return out
+
+
+def hold_positions(signals):
+    """Turn +1/-1 entry signals (0 = no change) into positions held until the next signal"""
+    signals = np.asarray(signals, dtype=np.float64)
+    index = np.where(signals != 0, np.arange(signals.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    return np.take_along_axis(signals, index, axis=1)
+
+
+def sma_positions(close, short=SMA_WINDOWS[0], long=SMA_WINDOWS[1]):
+    """Long while the short SMA is above the long SMA, flat otherwise"""
+    return (rolling_mean(close, short) > rolling_mean(close, long)).astype(np.float64)
+
+
+def crossover_signals(fast, slow):
+    """+1 where `fast` crosses above `slow`, -1 where it crosses below (same rule as the MACD endpoint)"""
+    signals = np.zeros(fast.shape)
+    above, below = fast > slow, fast < slow
+    signals[:, 1:][above[:, 1:] & (fast[:, :-1] <= slow[:, :-1])] = 1
+    signals[:, 1:][below[:, 1:] & (fast[:, :-1] >= slow[:, :-1])] = -1
+    return signals
+
+
+def macd_positions(close, fast=MACD_FAST, slow=MACD_SLOW, signal=MACD_SIGNAL):
+    """Long/short positions from MACD/signal-line crossovers"""
+    macd = ema(close, fast) - ema(close, slow)
+    return hold_positions(crossover_signals(macd, ema(macd, signal)))
+
+
+def transformer_positions(signals):
+    """Positions from Transformer BUY/SELL/HOLD labels (HOLD keeps the previous position)"""
+    numeric = np.select([signals == "BUY", signals == "SELL"], [1.0, -1.0], 0.0)
+    return hold_positions(numeric)
+
+
+def run_backtest(close, positions, cost_bps=0.0, periods_per_year=PERIODS_PER_YEAR):
+    """Vectorized backtest of a (symbols, time) position matrix.
+
+    The position held at the close of bar t earns bar t+1's return, and every
+    change in position costs `cost_bps` basis points of notional per unit
+    traded. Returns per-bar arrays and per-symbol risk metrics.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    returns = np.full(close.shape, np.nan)
+    returns[:, 1:] = close[:, 1:] / close[:, :-1] - 1
+
+    held = np.zeros(positions.shape)
+    held[:, 1:] = positions[:, :-1]
+    turnover = np.abs(np.diff(held, axis=1, prepend=0.0))
+    strategy_returns = held * returns - turnover * (cost_bps / 10000.0)
+    strategy_returns[:, 0] = np.nan
+
+    cumulative = np.cumprod(1 + np.nan_to_num(strategy_returns), axis=1)
+    buy_and_hold = np.cumprod(1 + np.nan_to_num(returns), axis=1)
+    return {
+        "returns": returns,
+        "strategy_returns": strategy_returns,
+        "cumulative_return": cumulative,
+        "buy_and_hold": buy_and_hold,
+        "turnover": turnover,
+        "metrics": risk_metrics(strategy_returns, cumulative, buy_and_hold, periods_per_year),
+    }
+
+
+def risk_metrics(strategy_returns, cumulative, buy_and_hold, periods_per_year=PERIODS_PER_YEAR):
+    """calculate_risk_metrics for every row at once; returns a dict of per-row arrays"""
+    n_bars = strategy_returns.shape[1]
+    total_return = cumulative[:, -1] - 1
+    body = strategy_returns[:, 1:]
+    mean = body.mean(axis=1) if n_bars > 1 else np.zeros(len(body))
+    std = body.std(axis=1, ddof=1) if n_bars > 2 else np.zeros(len(body))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), 0.0)
+        # Like the pandas version, drawdown is measured from the first bar that has a return
+        growth = cumulative[:, 1:] if n_bars > 1 else cumulative
+        drawdown = growth / np.maximum.accumulate(growth, axis=1) - 1
+        # Only bars with a finite, non-zero return count; the leading bar has none
+        traded = (np.isfinite(body) & (body != 0)).sum(axis=1)
+        win_rate = np.where(traded > 0, (body > 0).sum(axis=1) / traded, 0.0)
+    return {
+        "total_return": total_return,
+        "buy_hold_return": buy_and_hold[:, -1] - 1,
+        "annualized_return": (1 + total_return) ** (periods_per_year / n_bars) - 1,
+        "sharpe_ratio": sharpe,
+        "max_drawdown": drawdown.min(axis=1),
+        "win_rate": win_rate,
+    }
+
+
+def metrics_table(symbols, metrics):
+    """Per-symbol metric dicts (plain floats) from the arrays returned by risk_metrics"""
+    return {
+        symbol: {name: float(metrics[name][row]) for name in METRICS}
+        for row, symbol in enumerate(symbols)
+    }
+
+
+def portfolio_metrics(strategy_returns, close, periods_per_year=PERIODS_PER_YEAR):
+    """Metrics of an equal-weight, daily-rebalanced portfolio of every row"""
+    portfolio = np.full((1, close.shape[1]), np.nan)
+    portfolio[0, 1:] = strategy_returns[:, 1:].mean(axis=0)
+    benchmark = np.zeros((1, close.shape[1]))
+    benchmark[0, 1:] = (close[:, 1:] / close[:, :-1] - 1).mean(axis=0)
+    cumulative = np.cumprod(1 + np.nan_to_num(portfolio), axis=1)
+    buy_and_hold = np.cumprod(1 + benchmark, axis=1)
+    metrics = risk_metrics(portfolio, cumulative, buy_and_hold, periods_per_year)
+    return {name: float(metrics[name][0]) for name in METRICS}
+
+
+def calculate_risk_metrics(test_signals, bars_per_year=PERIODS_PER_YEAR):
+    """Calculate risk and performance metrics (`bars_per_year` is 252 for daily bars)"""
+    metrics = {}
+    
+    if test_signals.empty:
+        return {"error": "No data available for risk calculation"}
+    
+    # Assuming we have strategy returns and benchmark returns
+    if 'Strategy_Return' in test_signals.columns and 'Return' in test_signals.columns:
+        # Total return
+        metrics['total_return'] = float(test_signals['Cumulative_Return'].iloc[-1] - 1)
+        metrics['buy_hold_return'] = float(test_signals['Buy_and_Hold'].iloc[-1] - 1)
+        
+        # Annualized return from the number of bars
+        n_bars = len(test_signals)
+        metrics['annualized_return'] = float(((1 + metrics['total_return']) ** (bars_per_year / n_bars)) - 1)
+        
+        # Sharpe ratio (assuming risk-free rate of 0)
+        sharpe_ratio = (test_signals['Strategy_Return'].mean() / test_signals['Strategy_Return'].std() 
+                        * np.sqrt(bars_per_year) if test_signals['Strategy_Return'].std() > 0 else 0)
+        metrics['sharpe_ratio'] = float(sharpe_ratio)
+        
+        # Maximum drawdown
+        cum_returns = test_signals['Cumulative_Return']
+        running_max = cum_returns.cummax()
+        drawdown = (cum_returns / running_max) - 1
+        metrics['max_drawdown'] = float(drawdown.min())
+        
+        # Win rate (percentage of winning trades); bars without a return (NaN) are not trades
+        strategy_returns = test_signals['Strategy_Return']
+        winning_days = (strategy_returns > 0).sum()
+        total_days = (np.isfinite(strategy_returns) & (strategy_returns != 0)).sum()
+        metrics['win_rate'] = float(winning_days / total_days if total_days > 0 else 0)
+        
+    return metrics
@@ -0,0 +1,323 @@
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# name -> (timeframe, bars per symbol, symbols)
+DATASETS = {
+    "daily_1y": ("1d", 252, 1),
+    "daily_10y": ("1d", 2520, 1),
+    "daily_1y_50sym": ("1d", 252, 50),
+    "minute_1y": ("1m", 252 * 390, 1),
+    "daily_1y_500sym": ("1d", 252, 500),
+    "minute_10y": ("1m", 10 * 252 * 390, 1),
+}
+SUITES = {
+    "quick": {"datasets": ["daily_1y", "daily_10y", "daily_1y_50sym", "minute_1y"], "iterations": 20, "cold_iterations": 5},
+    "full": {"datasets": list(DATASETS), "iterations": 50, "cold_iterations": 10},
+}
+PREDICT_ENDPOINTS = ("/api/predict", "/api/predict-sentiment", "/api/predict-macd", "/api/predict-transformer")
+BATCH_MODELS = "moving_average,sentiment,macd"
+# The Transformer runs one forward pass per bar; beyond this many bars a cold pass is a model benchmark, not an endpoint one
+TRANSFORMER_MAX_BARS = 5000
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def synthetic_ohlcv(bars, timeframe, seed=0, start=1262304000000):
+    """Random-walk OHLCV columns with `bars` consecutive bars of `timeframe` starting at `start` (epoch ms)"""
+    from market_data import BAR_SECONDS
+
+    rng = np.random.default_rng(seed)
+    bar_seconds = BAR_SECONDS[timeframe]
+    volatility = 0.02 * np.sqrt(bar_seconds / 86400)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0002 * bar_seconds / 86400, volatility, bars)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, volatility / 2, bars))
+    return {
+        "timestamp": start + np.arange(bars, dtype=np.int64) * bar_seconds * 1000,
+        "open": open_,
+        "high": np.maximum(open_, close) * (1 + spread),
+        "low": np.minimum(open_, close) * (1 - spread),
+        "close": close,
+        "volume": rng.lognormal(14, 0.5, bars).round(),
+    }
+
+
+def build_dataset(root, name):
+    """Write one dataset into its own store under `root`; returns (store, timeframe, symbols)"""
+    from market_data import MarketDataStore
+
+    timeframe, bars, count = DATASETS[name]
+    store = MarketDataStore(os.path.join(root, name))
+    symbols = [f"SYM{index:03d}" for index in range(count)]
+    for index, symbol in enumerate(symbols):
+        store.append(symbol, timeframe, synthetic_ohlcv(bars, timeframe, seed=index))
+    return store, timeframe, symbols
+
+
+def measure(fn, iterations, warmup=2, before_each=None):
+    """Latency percentiles, throughput and peak allocations of `fn()`"""
+    for _ in range(warmup):
+        if before_each:
+            before_each()
+        fn()
+    gc.collect()
+    latencies = []
+    for _ in range(iterations):
+        if before_each:
+            before_each()
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+
+    # Peak memory from one extra call, traced separately so tracing does not skew the timings
+    if before_each:
+        before_each()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ms = np.asarray(latencies) * 1000
+    return {
+        "iterations": iterations,
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "min_ms": round(float(ms.min()), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "throughput_per_s": round(iterations / float(np.sum(latencies)), 2),
+        "peak_alloc_mb": round(peak / 2**20, 3),
+    }
+
+
+def load_server(root, with_transformer):
+    from instrumentation import configure_logging
+    # Per-request log lines would dominate the output
+    configure_logging(level="WARNING")
+    import server
+    from charts import ChartRenderer
+
+    server.chart_renderer = ChartRenderer(os.path.join(root, "public"))
+    preload = [name for name in server.models.names() if with_transformer or not name.startswith("transformer")]
+    app = server.create_app(preload=preload)
+    return server, app.test_client()
+
+
+def request_fn(client, method, url, body=None):
+    def call():
+        response = client.open(url, method=method, json=body)
+        if response.status_code != 200:
+            raise BenchmarkError(f"{method} {url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return call
+
+
+def run_suite(suite, iterations=None, cold_iterations=None, with_transformer=True, datasets=None):
+    """Run every benchmark of `suite`; returns {benchmark name: metrics or {"error"/"skipped": reason}}"""
+    settings = SUITES[suite]
+    iterations = iterations or settings["iterations"]
+    cold_iterations = cold_iterations or settings["cold_iterations"]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="algotrade-bench-") as root:
+        server, client = load_server(root, with_transformer)
+        transformer_ready = with_transformer and server.models.get("transformer") is not None
+
+        def reset_caches():
+            server.market_data.invalidate()
+            server.indicator_engine.clear()
+            server.transformer_forecaster.clear()
+            server.feature_store.invalidate()
+            server.result_cache.invalidate()
+
+        def record(name, fn, count, before_each=None):
+            try:
+                results[name] = measure(fn, count, before_each=before_each)
+            except Exception as e:
+                results[name] = {"error": str(e)}
+            print(_format_row(name, results[name]), flush=True)
+
+        for dataset in datasets or settings["datasets"]:
+            started = time.perf_counter()
+            store, timeframe, symbols = build_dataset(root, dataset)
+            server.market_data = store
+            reset_caches()
+            print(f"🔍 {dataset}: {len(symbols)} x {DATASETS[dataset][1]} {timeframe} bars "
+                  f"(generated in {time.perf_counter() - started:.1f}s)", flush=True)
+            query = f"symbol={symbols[0]}&timeframe={timeframe}"
+            frame, version = store.load(symbols[0], timeframe, server.default_window(timeframe))
+
+            for endpoint in PREDICT_ENDPOINTS:
+                if endpoint == "/api/predict-transformer":
+                    reason = ("Transformer model not loaded" if not transformer_ready
+                              else f"more than {TRANSFORMER_MAX_BARS} bars" if len(frame) > TRANSFORMER_MAX_BARS else None)
+                    if reason:
+                        results[f"{dataset}:{endpoint}"] = {"skipped": reason}
+                        print(_format_row(f"{dataset}:{endpoint}", results[f"{dataset}:{endpoint}"]), flush=True)
+                        continue
+                record(f"{dataset}:{endpoint}:cached", request_fn(client, "GET", f"{endpoint}?{query}"), iterations)
+                # Past the result cache, with the data, indicator and forecast caches warm
+                call = request_fn(client, "GET", f"{endpoint}?{query}&cache=0")
+                record(f"{dataset}:{endpoint}:warm", call, iterations)
+                record(f"{dataset}:{endpoint}:cold", call, cold_iterations, before_each=reset_caches)
+
+            if len(symbols) > 1:
+                body = {"symbols": symbols, "models": BATCH_MODELS, "timeframe": timeframe}
+                call = request_fn(client, "POST", "/api/predict-batch", body)
+                record(f"{dataset}:/api/predict-batch:warm", call, iterations)
+                record(f"{dataset}:/api/predict-batch:cold", call, cold_iterations, before_each=reset_caches)
+
+            # The pipeline pieces on their own
+            key = server.window_key(symbols[0], timeframe, server.default_window(timeframe))
+            indicators = server.indicator_engine.window(
+                server.partition_key(key), frame["timestamp"].to_numpy(), frame["close"].to_numpy()
+            )
+            record(f"{dataset}:time_series_split", lambda: server.time_series_split(frame, indicators), iterations)
+            record(f"{dataset}:time_series_split:reference", lambda: server.time_series_split(frame), cold_iterations)
+            test_signals = server.time_series_split(frame, indicators)[0]
+            bars_per_year = server.periods_per_year(timeframe)
+            record(f"{dataset}:calculate_risk_metrics",
+                   lambda: server.calculate_risk_metrics(test_signals, bars_per_year), iterations)
+
+            from sklearn.preprocessing import MinMaxScaler
+            from transformer_inference import build_windows
+            close = frame["close"].to_numpy().reshape(-1, 1)
+            scaler = server.models.get("transformer_scaler") if transformer_ready else MinMaxScaler().fit(close)
+            # Scaling plus the contiguous copy a model batch needs
+            record(f"{dataset}:transformer_windows",
+                   lambda: np.ascontiguousarray(build_windows(scaler.transform(close))), iterations)
+            if transformer_ready and len(frame) <= TRANSFORMER_MAX_BARS:
+                record(
+                    f"{dataset}:transformer_forecast:full",
+                    lambda: server.transformer_forecaster.forecast(
+                        server.partition_key(key), version, close.reshape(-1), server.transformer_batcher.predict, scaler,
+                        full=True, timestamps=frame["timestamp"].to_numpy()
+                    ),
+                    cold_iterations,
+                )
+            server.chart_renderer.shutdown()
+            from charts import ChartRenderer
+            server.chart_renderer = ChartRenderer(os.path.join(root, "public"))
+    return results
+
+
+def _format_row(name, result):
+    if "error" in result:
+        return f"  ❌ {name:<58} {result['error']}"
+    if "skipped" in result:
+        return f"  ⚠️ {name:<58} skipped ({result['skipped']})"
+    return (f"  {name:<60} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+            f"{result['throughput_per_s']:>9.1f}/s  peak {result['peak_alloc_mb']:>8.2f}MB")
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms, min_delta_mb):
+    """Benchmarks whose median latency or peak allocations grew past the tolerance"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "p50_ms" not in previous or "p50_ms" not in current:
+            continue
+        for metric, floor in (("p50_ms", min_delta_ms), ("peak_alloc_mb", min_delta_mb)):
+            before, after = previous[metric], current[metric]
+            if after > before * (1 + tolerance) and after - before > floor:
+                regressions.append(f"{name} {metric}: {before} -> {after} (+{100 * (after / before - 1) if before else 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prediction endpoints and indicator math on synthetic data")
+    parser.add_argument("--suite", choices=SUITES, default="quick")
+    parser.add_argument("--datasets", help=f"Comma separated subset of: {', '.join(DATASETS)}")
+    parser.add_argument("--iterations", type=int, help="Timed calls per warm benchmark")
+    parser.add_argument("--cold-iterations", type=int, help="Timed calls per cold (caches cleared) benchmark")
+    parser.add_argument("--no-transformer", action="store_true", help="Skip the Transformer (no TensorFlow import)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore latency changes smaller than this")
+    parser.add_argument("--min-delta-mb", type=float, default=1.0, help="Ignore memory changes smaller than this")
+    args = parser.parse_args(argv)
+
+    datasets = [name.strip() for name in args.datasets.split(",")] if args.datasets else None
+    unknown = [name for name in datasets or [] if name not in DATASETS]
+    if unknown:
+        parser.error(f"Unknown datasets: {', '.join(unknown)}")
+
+    started = time.perf_counter()
+    results = run_suite(args.suite, args.iterations, args.cold_iterations, not args.no_transformer, datasets)
+    report = {"suite": args.suite, "environment": environment(), "results": results}
+    if resource is not None:
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        divisor = 2**20 if sys.platform == "darwin" else 2**10
+        report["environment"]["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1)
+    report["elapsed_s"] = round(time.perf_counter() - started, 1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.output} ({report['elapsed_s']}s)")
+
+    failed = [name for name, result in results.items() if "error" in result]
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms, args.min_delta_mb)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            return 1
+        print(f"✅ No regressions against {args.baseline} (commit {baseline['environment'].get('commit')})")
+    else:
+        print(f"⚠️ No baseline at {args.baseline}; run with --save-baseline to create one")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
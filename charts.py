@@ -0,0 +1,278 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+# Object-oriented Agg canvases: no pyplot global state, safe to render from worker threads
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from instrumentation import metrics, stage
+
+logger = logging.getLogger(__name__)
+
+CHART_RENDER_SECONDS = metrics.histogram(
+    "algotrade_chart_render_seconds", "Time to draw and save a chart (background pool)", ("chart",)
+)
+
+CHART_FORMATS = ("png", "webp")
+DEFAULT_CHART_DPI = 300
+DEFAULT_CHART_FORMAT = "png"
+MIN_CHART_DPI, MAX_CHART_DPI = 50, 600
+CHART_DIR_NAME = "charts"
+
+
+def parse_chart_options(args):
+    """Read the optional chart_dpi/chart_format query parameters, raising ValueError when invalid"""
+    dpi = int(args.get("chart_dpi", DEFAULT_CHART_DPI))
+    fmt = args.get("chart_format", DEFAULT_CHART_FORMAT).lower()
+    if not MIN_CHART_DPI <= dpi <= MAX_CHART_DPI:
+        raise ValueError(f"chart_dpi must be between {MIN_CHART_DPI} and {MAX_CHART_DPI}")
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"chart_format must be one of: {', '.join(CHART_FORMATS)}")
+    return dpi, fmt
+
+
+def _digest_inputs(name, args, dpi, fmt):
+    """Hash of everything that ends up in the image, used as the chart's filename"""
+    digest = hashlib.sha256(f"{name}|{dpi}|{fmt}".encode())
+    for arg in args:
+        if isinstance(arg, (pd.DataFrame, pd.Series, pd.Index)):
+            if isinstance(arg, pd.DataFrame):
+                digest.update(repr(list(arg.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(arg).to_numpy().tobytes())
+        elif isinstance(arg, np.ndarray):
+            digest.update(f"{arg.dtype.str}{arg.shape}".encode())
+            digest.update(np.ascontiguousarray(arg).tobytes())
+        else:
+            digest.update(repr(arg).encode())
+    return digest.hexdigest()[:20]
+
+
+class ChartRenderer:
+    """Background worker pool producing content-addressed chart files under <output_dir>/charts.
+
+    Each distinct set of inputs is rendered once; the files form a bounded
+    on-disk LRU so old charts are evicted as new data arrives. A chart whose
+    filename was handed out in the last `hold_seconds` is never evicted, so its
+    URL keeps working until the client has fetched it.
+    """
+
+    def __init__(self, output_dir, max_workers=2, max_files=200, max_keys=1024, hold_seconds=600):
+        self.output_dir = output_dir
+        self.chart_dir = os.path.join(output_dir, CHART_DIR_NAME)
+        os.makedirs(self.chart_dir, exist_ok=True)
+        self.max_files = max_files
+        self.max_keys = max_keys
+        self.hold_seconds = hold_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chart")
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # (name, key, dpi, fmt) -> filename, skips re-hashing unchanged inputs
+        self._pending = {}  # filename -> future of an in-flight render
+        self._files = OrderedDict()  # filename -> size in bytes, least recently used first
+        self._handed_out = {}  # filename -> monotonic time it was last returned to a caller
+        self._scan()
+
+    def _scan(self):
+        # Pick up charts rendered by earlier runs, oldest first
+        entries = []
+        for entry in os.scandir(self.chart_dir):
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[f"{CHART_DIR_NAME}/{name}"] = size
+        self._evict()
+
+    @stage("chart_submit")
+    def submit(self, name, key, draw, *args, dpi=DEFAULT_CHART_DPI, fmt=DEFAULT_CHART_FORMAT):
+        """Queue `draw(ax, *args)` unless an identical chart exists or is in flight; returns its filename"""
+        memo_key = (name, key, dpi, fmt)
+        with self._lock:
+            filename = self._keys.get(memo_key)
+        if filename is None:
+            filename = f"{CHART_DIR_NAME}/{name}-{_digest_inputs(name, args, dpi, fmt)}.{fmt}"
+
+        with self._lock:
+            self._keys[memo_key] = filename
+            self._keys.move_to_end(memo_key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+            self._handed_out[filename] = time.monotonic()
+            if filename in self._files:
+                self._files.move_to_end(filename)
+            elif filename not in self._pending:
+                self._pending[filename] = self._executor.submit(self._render, filename, draw, args, dpi, fmt)
+        return filename
+
+    def _render(self, filename, draw, args, dpi, fmt):
+        started = time.perf_counter()
+        try:
+            fig = Figure(figsize=(12, 6))
+            FigureCanvasAgg(fig)
+            draw(fig.add_subplot(), *args)
+
+            # Write next to the target and rename, so readers never see a half-written image
+            image_path = os.path.join(self.output_dir, filename)
+            tmp_path = f"{image_path}.{threading.get_ident()}.tmp"
+            fig.savefig(tmp_path, dpi=dpi, format=fmt, bbox_inches='tight')
+            os.replace(tmp_path, image_path)
+            CHART_RENDER_SECONDS.observe(time.perf_counter() - started, chart=filename.split("/")[-1].rsplit("-", 1)[0])
+            logger.info(f"✅ Chart rendered at: {image_path}")
+
+            with self._lock:
+                self._pending.pop(filename, None)
+                self._files[filename] = os.path.getsize(image_path)
+                self._evict()
+            return filename
+        except Exception as e:
+            logger.error(f"❌ Error generating chart {filename}: {str(e)}")
+            with self._lock:
+                self._pending.pop(filename, None)
+            raise
+
+    def _evict(self):
+        # Caller holds the lock (or is still initialising). Recently handed out charts stay, even over the limit
+        held_since = time.monotonic() - self.hold_seconds
+        for filename, handed_out in list(self._handed_out.items()):
+            if handed_out < held_since:
+                del self._handed_out[filename]
+        for filename in list(self._files):
+            if len(self._files) <= self.max_files:
+                break
+            if filename in self._handed_out:
+                continue
+            del self._files[filename]
+            try:
+                os.remove(os.path.join(self.output_dir, filename))
+            except FileNotFoundError:
+                pass
+
+    def result(self, filename, timeout=None):
+        """Wait for a chart if it is still rendering; KeyError if it is neither pending nor on disk"""
+        with self._lock:
+            future = self._pending.get(filename)
+            if future is None:
+                if filename not in self._files:
+                    raise KeyError(filename)
+                self._files.move_to_end(filename)
+                self._handed_out[filename] = time.monotonic()
+                return filename
+        return future.result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": sum(self._files.values()),
+                "pending": len(self._pending),
+                "max_files": self.max_files,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def plot_moving_average(ax, plot_data, last_n_days):
+    ax.plot(plot_data.index, plot_data['close'], label='Closing Price', color='blue')
+    ax.plot(plot_data.index, plot_data['SMA_50'], label='SMA 50', color='orange')
+    ax.plot(plot_data.index, plot_data['SMA_200'], label='SMA 200', color='red')
+
+    # Add buy/sell markers
+    buy_indices = plot_data.index[plot_data['SMA_50'] > plot_data['SMA_200']]
+    sell_indices = plot_data.index[plot_data['SMA_50'] < plot_data['SMA_200']]
+
+    ax.scatter(
+        buy_indices,
+        plot_data.loc[buy_indices, 'close'],
+        color='green', label='Buy Signal', marker='^', alpha=1, s=100, zorder=5
+    )
+    ax.scatter(
+        sell_indices,
+        plot_data.loc[sell_indices, 'close'],
+        color='red', label='Sell Signal', marker='v', alpha=1, s=100, zorder=5
+    )
+
+    ax.set_title(f"Stock Price with Moving Average Crossover Signals (Last {last_n_days} days)", fontsize=14)
+    ax.legend()
+    ax.set_xlabel("Day")
+    ax.set_ylabel("Price ($)")
+    ax.grid(True, alpha=0.3)
+
+
+def plot_sentiment(ax, plot_data, prediction, recent_n_days):
+    ax.plot(plot_data.index, plot_data['close'], label='Closing Price', color='blue')
+
+    # shaded background based on sentiment
+    if prediction == 1:  # Positive sentiment
+        ax.axhspan(plot_data['close'].min(), plot_data['close'].max(),
+                   alpha=0.2, color='green', label='Positive Sentiment')
+    else:  # Negative sentiment
+        ax.axhspan(plot_data['close'].min(), plot_data['close'].max(),
+                   alpha=0.2, color='red', label='Negative Sentiment')
+
+    # Mark days where price movement aligned with sentiment
+    sentiment_direction = 1 if prediction == 1 else -1
+    aligned_days = plot_data.index[sentiment_direction * plot_data['price_change'] > 0]
+    ax.scatter(
+        aligned_days,
+        plot_data.loc[aligned_days, 'close'],
+        color='purple', label='Sentiment Confirmation', marker='o', s=80, zorder=5
+    )
+
+    ax.set_title(f"Stock Price with Sentiment Analysis (Last {recent_n_days} days)", fontsize=14)
+    ax.legend()
+    ax.set_xlabel("Day")
+    ax.set_ylabel("Price ($)")
+    ax.grid(True, alpha=0.3)
+
+    # Add text annotation for the sentiment prediction
+    y_position = plot_data['close'].min() + (plot_data['close'].max() - plot_data['close'].min()) * 0.1
+    ax.text(plot_data.index[0], y_position,
+            f"Sentiment: {'Positive' if prediction == 1 else 'Negative'}",
+            fontsize=14, color='black',
+            bbox=dict(facecolor='white', alpha=0.8))
+
+
+def plot_macd(ax, plot_data, symbol):
+    ax.plot(plot_data.index, plot_data['Cumulative_Return'], label='Model Strategy')
+    ax.plot(plot_data.index, plot_data['Buy_and_Hold'], label='Buy and Hold')
+    ax.set_title(f'{symbol} Trading Strategy Performance (MACD)')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Cumulative Return')
+    ax.legend()
+    ax.grid(True)
+
+
+def plot_transformer(ax, index, actual, predicted, signals):
+    ax.plot(index[-len(actual):], actual, label='Actual Price', color='blue')
+    ax.plot(index[-len(predicted):], predicted, label='Predicted Price', color='red', linestyle='--')
+
+    # Add buy/sell markers
+    signals = np.asarray(signals)
+    signal_index = index[-len(signals):]
+    buy_indices = np.flatnonzero(signals == "BUY")
+    sell_indices = np.flatnonzero(signals == "SELL")
+
+    ax.scatter(
+        signal_index[buy_indices],
+        actual[buy_indices],
+        color='green', label='Buy Signal', marker='^', s=100, zorder=5
+    )
+    ax.scatter(
+        signal_index[sell_indices],
+        actual[sell_indices],
+        color='red', label='Sell Signal', marker='v', s=100, zorder=5
+    )
+
+    ax.set_title("Transformer Model Price Prediction and Signals", fontsize=14)
+    ax.legend()
+    ax.set_xlabel("Day")
+    ax.set_ylabel("Price ($)")
+    ax.grid(True, alpha=0.3)
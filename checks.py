@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import traceback
+
+# name -> check function; each raises AssertionError (or any exception) when the check fails
+CHECKS = {}
+
+
+class CheckFailed(AssertionError):
+    pass
+
+
+def check(fn):
+    CHECKS[fn.__name__.replace("check_", "", 1)] = fn
+    return fn
+
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+@check
+def check_result_cache(with_transformer=True):
+    """A repeated identical prediction request is a cache HIT, also when the first request loaded the model"""
+    from benchmark import PREDICT_ENDPOINTS, synthetic_ohlcv
+    from instrumentation import configure_logging
+    from market_data import MarketDataStore
+    configure_logging(level="WARNING")
+    import server
+    from charts import ChartRenderer
+
+    with tempfile.TemporaryDirectory(prefix="algotrade-check-") as root:
+        server.chart_renderer = ChartRenderer(os.path.join(root, "public"))
+        store = MarketDataStore(os.path.join(root, "bars"))
+        store.append("CHECK", "1d", synthetic_ohlcv(300, "1d"))
+        server.market_data = store
+        server.result_cache.invalidate()
+        # No preload: the first request of each endpoint loads its models lazily
+        client = server.create_app(preload=[]).test_client()
+        try:
+            for endpoint in PREDICT_ENDPOINTS:
+                if endpoint == "/api/predict-transformer" and not with_transformer:
+                    continue
+                outcomes = []
+                for _ in range(2):
+                    response = client.get(f"{endpoint}?symbol=CHECK&timeframe=1d")
+                    expect(response.status_code == 200, f"{endpoint} returned {response.status_code}")
+                    outcomes.append(response.headers.get("X-Cache"))
+                expect(outcomes == ["MISS", "HIT"], f"{endpoint}: X-Cache went {', '.join(map(str, outcomes))}, expected MISS, HIT")
+        finally:
+            # Let queued charts finish before their directory goes away
+            server.chart_renderer.shutdown()
+
+
+@check
+def check_indicators():
+    """Indicators synced chunk by chunk equal a full pandas recompute, also after a bar mid-history is rewritten"""
+    import numpy as np
+    from benchmark import synthetic_ohlcv
+    from indicators import IndicatorEngine, SERIES, compute_reference_indicators
+
+    def expect_reference(indicators, close, when):
+        reference = compute_reference_indicators(close)
+        mismatched = [
+            name for name in SERIES
+            if not np.allclose(indicators[name], reference[name], rtol=1e-9, atol=1e-9, equal_nan=True)
+        ]
+        expect(not mismatched, f"{when}: {', '.join(mismatched)} differ from the full recompute")
+
+    close = synthetic_ohlcv(1500, "1d")["close"]
+    engine = IndicatorEngine()
+    # Chunks of one bar, a few bars and more than the longest window, as appends arrive
+    for stop in (1, 2, 3, 60, 199, 200, 201, 450, 451, 1000, 1500):
+        expect_reference(engine.sync("CHECK", close[:stop]), close[:stop], f"after syncing {stop} bars")
+
+    rewritten = close.copy()
+    rewritten[700] *= 1.05
+    expect_reference(engine.sync("CHECK", rewritten), rewritten, "after rewriting bar 700")
+    extended = np.append(rewritten, rewritten[-1] * 1.01)
+    extended[300] *= 0.95
+    expect_reference(engine.sync("CHECK", extended), extended, "after rewriting bar 300 and appending one")
+
+
+@check
+def check_indicator_windows():
+    """A "most recent N bars" window moving with new bars extends one state and matches a recompute over it"""
+    import numpy as np
+    import pandas as pd
+    from benchmark import synthetic_ohlcv
+    from indicators import IndicatorEngine, SERIES, compute_reference_indicators
+
+    frame = synthetic_ohlcv(1500, "1d")
+    timestamps, close = frame["timestamp"], frame["close"]
+    engine = IndicatorEngine()
+    bars, anchor = 400, 100
+    for stop in range(anchor + bars, len(close) + 1, 97):
+        start = stop - bars
+        window = engine.window("CHECK:1d", timestamps[start:stop], close[start:stop])
+        # Indicators carry on from the first window's bars; returns start over in each window
+        expected = {name: values[start - anchor:] for name, values in compute_reference_indicators(close[anchor:stop]).items()}
+        returns = pd.Series(close[start:stop]).pct_change()
+        expected["return"] = returns.to_numpy()
+        expected["strategy_return"] = (pd.Series(expected["position"]).shift(1) * returns).to_numpy()
+        expected["cumulative_return"] = (1 + pd.Series(expected["strategy_return"])).cumprod().to_numpy()
+        expected["buy_and_hold"] = (1 + returns).cumprod().to_numpy()
+        mismatched = [
+            name for name in SERIES
+            if not np.allclose(window[name], expected[name], rtol=1e-9, atol=1e-9, equal_nan=True)
+        ]
+        expect(not mismatched, f"window ending at bar {stop}: {', '.join(mismatched)} differ from the recompute")
+    state = engine._states["CHECK:1d"]
+    expect(state.count == stop - anchor, f"expected one state extended to {stop - anchor} bars, got {state.count}")
+
+
+@check
+def check_forecast_cache():
+    """Forecasts extended for appended bars equal a full pass, also after a bar mid-history is rewritten"""
+    import numpy as np
+    from sklearn.preprocessing import MinMaxScaler
+    from benchmark import synthetic_ohlcv
+    from transformer_inference import TransformerForecaster
+
+    def predict_fn(windows):
+        # Stand-in model: any per-window function shows whether stale windows were reused
+        return windows.mean(axis=1) + 0.1 * windows[:, -1]
+
+    close = synthetic_ohlcv(800, "1d")["close"]
+    scaler = MinMaxScaler().fit(close.reshape(-1, 1))
+    forecaster, reference = TransformerForecaster(), TransformerForecaster()
+
+    def expect_full_pass(values, version, when):
+        incremental = forecaster.forecast("CHECK", version, values, predict_fn, scaler)
+        full = reference.forecast("CHECK", version, values, predict_fn, scaler, full=True)
+        expect(all(np.allclose(a, b) if a.dtype.kind == "f" else np.array_equal(a, b) for a, b in zip(incremental, full)),
+               f"{when}: forecasts differ from a full pass")
+
+    expect_full_pass(close[:500], 1, "first 500 bars")
+    expect_full_pass(close, 2, "after appending 300 bars")
+    rewritten = np.append(close, close[-1] * 1.01)
+    rewritten[400] *= 1.1
+    expect_full_pass(rewritten, 3, "after rewriting bar 400 and appending one")
+    expect(forecaster.stats()["incremental"] == 1, f"expected one incremental extension, got {forecaster.stats()}")
+
+    # A window of the most recent 300 bars moving with new bars: only the new windows run
+    calls = []
+    windowed = TransformerForecaster()
+    timestamps = np.arange(len(close)) * 86_400_000
+    for version, stop in enumerate(range(400, len(close) + 1, 50)):
+        start = stop - 300
+        sliced = windowed.forecast(
+            "CHECK:1d", version, close[start:stop], lambda windows: calls.append(len(windows)) or predict_fn(windows),
+            scaler, timestamps=timestamps[start:stop],
+        )
+        full = TransformerForecaster().forecast("CHECK", version, close[start:stop], predict_fn, scaler, full=True)
+        expect(all(np.allclose(a, b) if a.dtype.kind == "f" else np.array_equal(a, b) for a, b in zip(sliced, full)),
+               f"window ending at bar {stop}: forecasts differ from a full pass over the window")
+    expect(calls[1:] == [50] * (len(calls) - 1), f"expected 50 new windows per step after the first pass, got {calls}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Standalone correctness checks (synthetic data, no network)")
+    parser.add_argument("checks", nargs="*", help=f"Subset of: {', '.join(CHECKS)} (default: all)")
+    parser.add_argument("--no-transformer", action="store_true", help="Skip checks that need the Transformer (no TensorFlow import)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"Unknown checks: {', '.join(unknown)}")
+
+    failed = 0
+    for name in args.checks or CHECKS:
+        fn = CHECKS[name]
+        started = time.perf_counter()
+        try:
+            if "with_transformer" in fn.__code__.co_varnames:
+                fn(with_transformer=not args.no_transformer)
+            else:
+                fn()
+            print(f"✅ {name} ({time.perf_counter() - started:.1f}s)", flush=True)
+        except CheckFailed as e:
+            failed += 1
+            print(f"❌ {name}: {str(e)}", flush=True)
+        except Exception:
+            failed += 1
+            print(f"❌ {name}: error\n{traceback.format_exc()}", flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from indicators import SERIES
+from market_data import partition_key
+
+# Pseudo-dependencies naming the series itself rather than a column or another feature
+SERIES_KEY, VERSION = "series_key", "version"
+
+
+class Feature:
+    """A derived series: `compute(*dependencies)` over the last `window` bars (all bars when None)"""
+
+    def __init__(self, name, compute, depends=("close",), window=None):
+        self.name = name
+        self.compute = compute
+        self.depends = tuple(depends)
+        self.window = window
+
+
+class FeatureStore:
+    """Declared features computed lazily, at most once per (series key, data version), for every model.
+
+    Bar columns of the frame (close, high, volume, ...) are available as features without
+    being declared. Only the latest version of each series is kept, for up to `max_series` series.
+    """
+
+    def __init__(self, max_series=256):
+        self.max_series = max_series
+        self._features = {}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # series key -> (version, values, lock)
+        self.hits = 0
+        self.computed = 0
+
+    def register(self, name, compute, depends=("close",), window=None):
+        if name in (SERIES_KEY, VERSION):
+            raise ValueError(f"{name} is reserved")
+        if name in depends:
+            raise ValueError(f"Feature {name} cannot depend on itself")
+        self._features[name] = Feature(name, compute, depends, window)
+        return self._features[name]
+
+    def names(self):
+        return list(self._features)
+
+    def view(self, series_key, version, frame):
+        """Features of one loaded frame; values computed by any earlier view of the same version are reused"""
+        with self._lock:
+            entry = self._entries.get(series_key)
+            if entry is None or entry[0] != version:
+                # A new version replaces the old one: appended bars change every derived series
+                entry = (version, {}, threading.RLock())
+                self._entries[series_key] = entry
+            self._entries.move_to_end(series_key)
+            while len(self._entries) > self.max_series:
+                self._entries.popitem(last=False)
+        return FeatureView(self, series_key, version, frame, entry[1], entry[2])
+
+    def invalidate(self, series_key=None):
+        with self._lock:
+            if series_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(series_key, None)
+
+    def stats(self):
+        with self._lock:
+            cached = sum(len(values) for _, values, _ in self._entries.values())
+            series = len(self._entries)
+        return {"features": self.names(), "series": series, "cached_values": cached, "hits": self.hits, "computed": self.computed}
+
+
+class FeatureView:
+    """Lazy mapping from feature name to value for one (series key, data version)"""
+
+    def __init__(self, store, series_key, version, frame, values, lock):
+        self.store = store
+        self.series_key = series_key
+        self.version = version
+        self.frame = frame
+        self._values = values
+        self._lock = lock
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __getitem__(self, name):
+        if name == SERIES_KEY:
+            return self.series_key
+        if name == VERSION:
+            return self.version
+        # Computed values are never removed from an entry, so a hit needs no entry lock
+        if name in self._values:
+            with self.store._lock:
+                self.store.hits += 1
+            return self._values[name]
+        feature = self.store._features.get(name)
+        if feature is None:
+            if name in self.frame.columns:
+                return self.frame[name].to_numpy()
+            raise KeyError(f"Unknown feature: {name}")
+        with self._lock:
+            if name not in self._values:
+                args = [self[dep] for dep in feature.depends]
+                if feature.window is not None:
+                    args = [arg[-feature.window:] if isinstance(arg, np.ndarray) else arg for arg in args]
+                self._values[name] = feature.compute(*args)
+                with self.store._lock:
+                    self.store.computed += 1
+            return self._values[name]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+
+def simple_returns(values):
+    """Bar-over-bar percent change (NaN for the first bar), same as pandas pct_change"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty(len(values))
+    out[:1] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(values[1:], values[:-1], out=out[1:])
+    out[1:] -= 1
+    return out
+
+
+def latest_quote(close):
+    """Latest price and its change (absolute, percent) from the previous bar"""
+    price_change = 0
+    percent_change = 0
+    if len(close) > 1:
+        price_change = close[-1] - close[-2]
+        percent_change = (price_change / close[-2]) * 100
+    return float(close[-1]), float(price_change), float(percent_change)
+
+
+def register_market_features(store, indicator_engine):
+    """The features shared by the prediction models"""
+    store.register("returns", simple_returns)
+    store.register("volatility", lambda high, low: high - low, depends=("high", "low"))
+    store.register("quote", latest_quote, window=2)
+    # Incremental SMA/EMA/MACD state lives in the indicator engine, one per symbol and timeframe whatever
+    # the window; the store keeps the window's slice of it per version
+    store.register(
+        "indicators",
+        lambda series_key, timestamps, close: indicator_engine.window(partition_key(series_key), timestamps, close),
+        depends=(SERIES_KEY, "timestamp", "close"),
+    )
+    for name in SERIES:
+        if name not in ("close", "return"):
+            store.register(name, lambda indicators, name=name: indicators[name], depends=("indicators",))
+    return store
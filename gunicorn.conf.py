@@ -0,0 +1,49 @@
+import gc
+import os
+import multiprocessing
+
+# Production server for the ML prediction API: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app (and the pickled models) is imported once in the master and workers are
+# forked from it, so model memory is shared copy-on-write. Keras/TensorFlow is not
+# fork-safe once it has run ops, so the Transformer is loaded in each worker after fork.
+# `kill -HUP <master pid>` reloads the pickled models in the master and replaces the
+# workers gracefully: old workers finish their in-flight requests before exiting.
+
+PRELOADED_MODELS = ["moving_average", "moving_average_scaler", "sentiment", "macd", "transformer_scaler"]
+WORKER_MODELS = ["transformer"]
+
+# Read by create_app() when wsgi.py is imported in the master
+os.environ.setdefault("MODEL_WARMUP", ",".join(PRELOADED_MODELS))
+
+bind = os.environ.get("BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = 120
+graceful_timeout = 60
+keepalive = 5
+accesslog = "-"
+
+
+def pre_fork(server, worker):
+    # Move everything imported so far out of the GC's reach, so collections in workers
+    # do not touch (and un-share) the pages holding the preloaded models
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from server import models, start_signal_feed_server
+    models.warmup([name for name in os.environ.get("WORKER_MODEL_WARMUP", ",".join(WORKER_MODELS)).split(",") if name])
+    # SSE clients on SIGNAL_FEED_PORT are spread over the workers (SO_REUSEPORT) without holding WSGI threads
+    start_signal_feed_server()
+
+
+def on_reload(server):
+    # Runs in the master on SIGHUP, before the replacement workers are forked
+    from server import reload_model_registry
+    results = reload_model_registry([name for name in PRELOADED_MODELS])
+    for name, error in results.items():
+        if error:
+            server.log.warning("Keeping previous %s model: %s", name, error)
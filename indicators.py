@@ -0,0 +1,277 @@
+import logging
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SMA_WINDOWS = (50, 200)
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+
+# Series kept per symbol, in the order they are produced for each bar
+SERIES = (
+    "close", "sma_50", "sma_200", "ema12", "ema26", "macd", "signal_line", "histogram",
+    "signal", "position", "return", "strategy_return", "cumulative_return", "buy_and_hold",
+)
+
+
+def compute_reference_indicators(close):
+    """Full-history pandas computation of every indicator series (the original per-request math)"""
+    close = pd.Series(np.asarray(close, dtype=np.float64))
+    out = {"close": close}
+    for window in SMA_WINDOWS:
+        out[f"sma_{window}"] = close.rolling(window=window).mean()
+
+    out["ema12"] = close.ewm(span=MACD_FAST, adjust=False).mean()
+    out["ema26"] = close.ewm(span=MACD_SLOW, adjust=False).mean()
+    out["macd"] = out["ema12"] - out["ema26"]
+    out["signal_line"] = out["macd"].ewm(span=MACD_SIGNAL, adjust=False).mean()
+    out["histogram"] = out["macd"] - out["signal_line"]
+
+    macd, signal_line = out["macd"], out["signal_line"]
+    signal = pd.Series(0, index=close.index)
+    signal[(macd > signal_line) & (macd.shift(1) <= signal_line.shift(1))] = 1
+    signal[(macd < signal_line) & (macd.shift(1) >= signal_line.shift(1))] = -1
+    out["signal"] = signal
+    out["position"] = signal.replace(0, np.nan).ffill().fillna(0)
+
+    out["return"] = close.pct_change()
+    out["strategy_return"] = out["position"].shift(1) * out["return"]
+    out["cumulative_return"] = (1 + out["strategy_return"]).cumprod()
+    out["buy_and_hold"] = (1 + out["return"]).cumprod()
+    return {name: out[name].to_numpy(dtype=np.float64) for name in SERIES}
+
+
+def align_window(known_timestamps, known_close, timestamps, close):
+    """Place a window of bars inside the bars a state already covers.
+
+    Returns (offset, overlap): the window's first bar is known bar `offset` and its first
+    `overlap` bars are known and unchanged (the rest follow the last known bar). None when
+    the window starts before the known bars or outside them, or a bar differs (history was rewritten).
+    """
+    if not len(known_timestamps) or not len(timestamps):
+        return None
+    offset = int(np.searchsorted(known_timestamps, timestamps[0]))
+    if offset == len(known_timestamps) or known_timestamps[offset] != timestamps[0]:
+        return None
+    overlap = min(len(known_timestamps) - offset, len(timestamps))
+    if not (np.array_equal(known_timestamps[offset:offset + overlap], timestamps[:overlap])
+            and np.array_equal(known_close[offset:offset + overlap], close[:overlap], equal_nan=True)):
+        return None
+    return offset, overlap
+
+
+def _cumprod_skipna(values):
+    # pandas' cumprod: NaN entries stay NaN and are skipped by the running product
+    missing = np.isnan(values)
+    out = np.cumprod(np.where(missing, 1.0, 1.0 + values))
+    out[missing] = np.nan
+    return out
+
+
+def _ema_step(previous, value, alpha):
+    # Same update pandas uses for ewm(adjust=False), so incremental values match a full recompute
+    old_weight = 1.0 - alpha
+    return (old_weight * previous + alpha * value) / (old_weight + alpha)
+
+
+class IndicatorState:
+    """Running SMA/EMA/MACD state for one symbol, updated in O(new bars)"""
+
+    def __init__(self):
+        self.count = 0
+        self._capacity = 0
+        self._series = {name: np.empty(0) for name in SERIES}
+        self._series["timestamp"] = np.empty(0, dtype=np.int64)  # Bar positions when none are given
+        self._window = deque(maxlen=max(SMA_WINDOWS))
+        self._sums = {window: 0.0 for window in SMA_WINDOWS}
+        self._since_resync = 0
+        self._products = {"cumulative_return": 1.0, "buy_and_hold": 1.0}
+
+    def _reserve(self, size):
+        if size <= self._capacity:
+            return
+        capacity = max(size, 2 * self._capacity, 256)
+        for name, values in self._series.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self.count] = values[:self.count]
+            self._series[name] = grown
+        self._capacity = capacity
+
+    def rebuild(self, close, timestamps=None):
+        """Vectorized full build, used on first sight of a symbol or when history was rewritten"""
+        close = np.asarray(close, dtype=np.float64)
+        reference = compute_reference_indicators(close)
+        # Fresh arrays, so snapshots already handed out keep their old values
+        self.count = 0
+        self._capacity = 0
+        self._reserve(len(close))
+        for name in SERIES:
+            self._series[name][:len(close)] = reference[name]
+        self._series["timestamp"][:len(close)] = np.arange(len(close)) if timestamps is None else timestamps
+        self.count = len(close)
+
+        self._window.clear()
+        self._window.extend(close[-max(SMA_WINDOWS):])
+        self._resync_sums()
+        for name in self._products:
+            # cumprod skips NaN entries, so carry on from the last finite value
+            finite = reference[name][~np.isnan(reference[name])]
+            self._products[name] = float(finite[-1]) if len(finite) else 1.0
+
+    def _resync_sums(self):
+        # Re-anchor the running sums from the window to stop floating point drift accumulating
+        window_values = np.fromiter(self._window, dtype=np.float64)
+        for window in SMA_WINDOWS:
+            self._sums[window] = float(window_values[-window:].sum())
+        self._since_resync = 0
+
+    def append(self, new_close, timestamps=None):
+        """Extend every series with newly arrived bars"""
+        new_close = np.asarray(new_close, dtype=np.float64)
+        if self.count == 0:
+            self.rebuild(new_close, timestamps)
+            return
+        self._reserve(self.count + len(new_close))
+        s = self._series
+        stop = self.count + len(new_close)
+        s["timestamp"][self.count:stop] = np.arange(self.count, stop) if timestamps is None else timestamps
+        alpha_fast = 2.0 / (MACD_FAST + 1)
+        alpha_slow = 2.0 / (MACD_SLOW + 1)
+        alpha_signal = 2.0 / (MACD_SIGNAL + 1)
+
+        for value in new_close:
+            i = self.count
+            prev = i - 1
+
+            # Rolling sums: add the new bar, drop the one that falls out of each window
+            for window in SMA_WINDOWS:
+                if len(self._window) >= window:
+                    self._sums[window] -= self._window[-window]
+                self._sums[window] += value
+            self._window.append(value)
+            self._since_resync += 1
+            if self._since_resync >= max(SMA_WINDOWS):
+                self._resync_sums()
+            filled = min(i + 1, max(SMA_WINDOWS))
+            for window in SMA_WINDOWS:
+                s[f"sma_{window}"][i] = self._sums[window] / window if filled >= window else np.nan
+
+            s["close"][i] = value
+            s["ema12"][i] = _ema_step(s["ema12"][prev], value, alpha_fast)
+            s["ema26"][i] = _ema_step(s["ema26"][prev], value, alpha_slow)
+            s["macd"][i] = s["ema12"][i] - s["ema26"][i]
+            s["signal_line"][i] = _ema_step(s["signal_line"][prev], s["macd"][i], alpha_signal)
+            s["histogram"][i] = s["macd"][i] - s["signal_line"][i]
+
+            macd, signal_line = s["macd"][i], s["signal_line"][i]
+            prev_macd, prev_signal_line = s["macd"][prev], s["signal_line"][prev]
+            if macd > signal_line and prev_macd <= prev_signal_line:
+                s["signal"][i] = 1
+            elif macd < signal_line and prev_macd >= prev_signal_line:
+                s["signal"][i] = -1
+            else:
+                s["signal"][i] = 0
+            s["position"][i] = s["signal"][i] if s["signal"][i] != 0 else s["position"][prev]
+
+            s["return"][i] = value / s["close"][prev] - 1
+            s["strategy_return"][i] = s["position"][prev] * s["return"][i]
+            self._products["cumulative_return"] *= 1 + s["strategy_return"][i]
+            self._products["buy_and_hold"] *= 1 + s["return"][i]
+            s["cumulative_return"][i] = self._products["cumulative_return"]
+            s["buy_and_hold"][i] = self._products["buy_and_hold"]
+            self.count += 1
+
+    def series(self, name):
+        """Read-only view of one series over all bars seen so far"""
+        view = self._series[name][:self.count].view()
+        view.flags.writeable = False
+        return view
+
+    def snapshot(self, start=0, stop=None):
+        """Equal-length read-only views of every series over bars [start, stop); later appends never touch them.
+
+        A window starting after the first bar has its returns (and their cumulative products)
+        taken from its own first bar, as a full recompute over the window would; the
+        indicators before them carry on from the earlier bars.
+        """
+        out = {name: self.series(name)[start:stop] for name in SERIES}
+        if start:
+            close, position = out["close"], out["position"]
+            returns = np.full(len(close), np.nan)
+            returns[1:] = close[1:] / close[:-1] - 1
+            strategy_returns = np.full(len(close), np.nan)
+            strategy_returns[1:] = position[:-1] * returns[1:]
+            out.update({
+                "return": returns,
+                "strategy_return": strategy_returns,
+                "cumulative_return": _cumprod_skipna(strategy_returns),
+                "buy_and_hold": _cumprod_skipna(returns),
+            })
+            for name in ("return", "strategy_return", "cumulative_return", "buy_and_hold"):
+                out[name].flags.writeable = False
+        return out
+
+    def latest(self):
+        return {name: float(self._series[name][self.count - 1]) for name in SERIES} if self.count else {}
+
+
+class IndicatorEngine:
+    """Per-series indicator states kept in step with the market data store.
+
+    One state per series (symbol and timeframe) covers every window requested from it:
+    a window inside the covered bars is sliced out, and bars after them are appended, so a
+    "most recent N bars" window that moves with each new bar costs O(new bars). Only bars
+    inside the window are checked for rewrites.
+    """
+
+    def __init__(self, verify=False):
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._states = {}
+        self._locks = {}
+
+    def window(self, key, timestamps, close):
+        """Bring the state for `key` up to date with a window of bars and return the window's series"""
+        close = np.asarray(close, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        with self._lock:
+            state = self._states.setdefault(key, IndicatorState())
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            placed = align_window(state.series("timestamp"), state.series("close"), timestamps, close)
+            if placed is None:
+                state.rebuild(close, timestamps)
+                offset = 0
+            else:
+                offset, overlap = placed
+                if overlap < len(close):
+                    state.append(close[overlap:], timestamps[overlap:])
+                    if self.verify:
+                        logger.info(verify_indicator_equivalence(state.snapshot(), state.series("close")))
+            return state.snapshot(offset, offset + len(close))
+
+    def sync(self, symbol, close):
+        """Bring the state for `symbol` up to date with `close` (its whole history) and return a snapshot of its series"""
+        close = np.asarray(close, dtype=np.float64)
+        return self.window(symbol, np.arange(len(close)), close)
+
+    def clear(self):
+        """Forget every indicator state; the next sync per symbol rebuilds from scratch"""
+        with self._lock:
+            self._states.clear()
+            self._locks.clear()
+
+
+def verify_indicator_equivalence(indicators, close, tolerance=1e-9):
+    """Compare incrementally maintained series against a full pandas recompute"""
+    reference = compute_reference_indicators(close)
+    mismatched = [
+        name for name in SERIES
+        if not np.allclose(indicators[name], reference[name], rtol=tolerance, atol=tolerance, equal_nan=True)
+    ]
+    if mismatched:
+        return f"Warning: incremental indicators differ from full recompute: {', '.join(mismatched)}"
+    return "Indicator equivalence check passed"
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+import urllib.request
+from urllib.parse import urlencode
+import numpy as np
+from instrumentation import configure_logging
+from market_data import (
+    BAR_COLUMNS, MarketDataStore, read_market_csv, normalize_symbol, normalize_timeframe, write_inbox_batch,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def notify(server_url, symbol, timeframe):
+    """Ask server.py to pick up new bars now (best effort, like server.js)"""
+    query = urlencode({"symbol": symbol, "timeframe": timeframe})
+    try:
+        urllib.request.urlopen(urllib.request.Request(f"{server_url}/api/refresh-data?{query}", method="POST"), timeout=5)
+    except OSError as e:
+        print(f"⚠️ Could not notify prediction server: {e}")
+
+
+def replay(path, symbol, timeframe, data_dir=DATA_DIR, batch_size=1, interval=0.0, direct=False, server_url=None):
+    """Feed the bars of a local CSV into the store batch by batch, as if they arrived live.
+
+    Bars at or before the last stored timestamp are skipped. By default each
+    batch is dropped into the inbox that server.js writes to; with `direct` it
+    is appended to the store straight away. Returns the number of bars sent.
+    """
+    store = MarketDataStore(data_dir)
+    columns = read_market_csv(path)
+    order = np.argsort(columns["timestamp"], kind="stable")
+    columns = {name: columns[name][order] for name in BAR_COLUMNS}
+    last = store.partition(symbol, timeframe).last_timestamp()
+    start = 0 if last is None else int(np.searchsorted(columns["timestamp"], last, side="right"))
+    total = len(columns["timestamp"]) - start
+    print(f"🔍 Replaying {total} {symbol} {timeframe} bars from {path} ({start} already stored)")
+
+    sent = 0
+    for offset in range(start, len(columns["timestamp"]), batch_size):
+        batch = {name: values[offset:offset + batch_size] for name, values in columns.items()}
+        if direct:
+            store.append(symbol, timeframe, batch)
+        else:
+            write_inbox_batch(data_dir, symbol, timeframe, batch)
+        sent += len(batch["timestamp"])
+        if server_url:
+            notify(server_url, symbol, timeframe)
+        if interval and sent < total:
+            time.sleep(interval)
+    print(f"✅ Replayed {sent} bars")
+    return sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay bars from a local CSV into the market data store")
+    parser.add_argument("file", help="CSV with timestamp,open,high,low,close,volume columns")
+    parser.add_argument("--symbol", default="AAPL")
+    parser.add_argument("--timeframe", default="1d")
+    parser.add_argument("--batch-size", type=int, default=1, help="Bars per batch")
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds to wait between batches")
+    parser.add_argument("--direct", action="store_true", help="Append to the store instead of the inbox")
+    parser.add_argument("--notify", metavar="URL", help="Prediction server to notify after each batch, e.g. http://localhost:5001")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    args = parser.parse_args(argv)
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    configure_logging()
+    replay(
+        args.file, normalize_symbol(args.symbol), normalize_timeframe(args.timeframe), args.data_dir,
+        args.batch_size, args.interval, args.direct, args.notify,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
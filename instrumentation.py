@@ -0,0 +1,322 @@
+import os
+import io
+import sys
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits up to a cold Transformer pass
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Set for the duration of a request (see instrument_app); stages timed elsewhere are labelled "-"
+_endpoint = contextvars.ContextVar("endpoint", default=None)
+_stage_totals = contextvars.ContextVar("stage_totals", default=None)
+
+
+# Structured logging
+
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with `extra=` become keys"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        endpoint = _endpoint.get()
+        if endpoint is not None:
+            entry["endpoint"] = endpoint
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, fmt=None):
+    """Log to stdout at LOG_LEVEL (default INFO) as text or, with LOG_FORMAT=json, one JSON object per line"""
+    root = logging.getLogger()
+    if getattr(root, "_algotrade_configured", False):
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if (fmt or os.environ.get("LOG_FORMAT", "text")).lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel((level or os.environ.get("LOG_LEVEL", "INFO")).upper())
+    root._algotrade_configured = True
+
+
+# Prometheus metrics
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., sum]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time from `collect()`, which returns {label values tuple: number}.
+
+    `kind="counter"` exposes totals that some other object already keeps (e.g. cache hits).
+    """
+
+    def __init__(self, name, documentation, labelnames, collect, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not collect {self.name}: {str(e)}")
+            values = {}
+        for key, value in sorted(values.items()):
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics of this process in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames, collect, kind="gauge"):
+        return self._register(Gauge(name, documentation, labelnames, collect, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter("algotrade_requests_total", "HTTP requests handled", ("endpoint", "method", "status"))
+REQUEST_SECONDS = metrics.histogram("algotrade_request_seconds", "Time to produce a response", ("endpoint",))
+STAGE_SECONDS = metrics.histogram("algotrade_stage_seconds", "Time spent per request stage", ("endpoint", "stage"))
+
+
+# Stage timing
+
+@contextmanager
+def stage(name):
+    """Time a block as stage `name` of the current request (histogram + Server-Timing header).
+
+    Also works as a decorator: @stage("predict").
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, endpoint=_endpoint.get() or "-", stage=name)
+        totals = _stage_totals.get()
+        if totals is not None:
+            totals[name] = totals.get(name, 0.0) + elapsed
+
+
+# Flask integration
+
+_profile_lock = threading.Lock()
+
+
+def _start_profiler(kind):
+    # One profiled request at a time: the interpreter only allows one active profiler
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            kind = "cprofile"
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return kind, profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return "cprofile", profiler
+
+
+def _stop_profiler(active, profile_dir, endpoint):
+    kind, profiler = active
+    try:
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{(endpoint or 'request').strip('/').replace('/', '_') or 'root'}"
+        os.makedirs(profile_dir, exist_ok=True)
+        if kind == "pyinstrument":
+            profiler.stop()
+            path = os.path.join(profile_dir, f"{name}.html")
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+            return path
+        profiler.disable()
+        path = os.path.join(profile_dir, f"{name}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(25)
+        logger.info(f"🔍 Profile of {endpoint} written to {path}\n{summary.getvalue()}")
+        return path
+    finally:
+        _profile_lock.release()
+
+
+def instrument_app(app, profile_dir, allow_profiling=False):
+    """Request counters/latency, per-stage Server-Timing headers and an access log line per request.
+
+    With `allow_profiling`, ?profile=1 (cProfile) or ?profile=pyinstrument
+    profiles that request and writes the result to `profile_dir`.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_request():
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g.instrumentation = {
+            "started": time.perf_counter(),
+            "tokens": (_endpoint.set(endpoint), _stage_totals.set({})),
+            "profiler": None,
+        }
+        kind = request.args.get("profile")
+        if allow_profiling and kind and kind != "0":
+            g.instrumentation["profiler"] = _start_profiler(kind)
+
+    @app.after_request
+    def _finish_request(response):
+        state = g.get("instrumentation")
+        if state is None:
+            return response
+        endpoint = _endpoint.get()
+        if state["profiler"] is not None:
+            response.headers["X-Profile"] = os.path.basename(_stop_profiler(state["profiler"], profile_dir, endpoint))
+            state["profiler"] = None
+        elapsed = time.perf_counter() - state["started"]
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        stages = _stage_totals.get() or {}
+        if stages:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{name};dur={1000 * seconds:.1f}" for name, seconds in stages.items()
+            )
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} {1000 * elapsed:.1f}ms",
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(1000 * elapsed, 2),
+                "stages_ms": {name: round(1000 * seconds, 2) for name, seconds in stages.items()},
+            },
+        )
+        return response
+
+    @app.teardown_request
+    def _end_request(error=None):
+        state = g.get("instrumentation")
+        if state is None:
+            return
+        if state["profiler"] is not None:  # The view raised before after_request ran
+            _stop_profiler(state["profiler"], profile_dir, _endpoint.get())
+        # Streamed responses (stream_with_context) run teardown again once the stream ends
+        tokens, state["tokens"] = state["tokens"], None
+        if tokens is not None:
+            _stage_totals.reset(tokens[1])
+            _endpoint.reset(tokens[0])
+
+    return app
@@ -0,0 +1,546 @@
+import os
+import re
+import json
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Explicit dtypes for the columns written by server.js (timestamp,open,high,low,close,volume)
+MARKET_DATA_DTYPES = {
+    "timestamp": "int64",
+    "open": "float64",
+    "high": "float64",
+    "low": "float64",
+    "close": "float64",
+    "volume": "float64",
+}
+BAR_COLUMNS = tuple(MARKET_DATA_DTYPES)
+
+# Bar length in seconds of each supported timeframe
+BAR_SECONDS = {"1d": 86400, "1h": 3600, "1m": 60, "1s": 1}
+TIMEFRAMES = tuple(BAR_SECONDS)
+DEFAULT_TIMEFRAME = "1d"
+TRADING_DAYS_PER_YEAR = 252
+TRADING_SECONDS_PER_DAY = 6.5 * 3600  # Regular US session
+# Intraday history is served as a window of the most recent bars unless a range is requested
+DEFAULT_WINDOW_BARS = {"1m": 100000, "1s": 100000}
+MAX_CACHED_WINDOWS = 16  # Windowed frames kept per symbol/timeframe
+MAX_SEGMENTS = 64  # Appends beyond this many segments compact the partition into one
+REJECTED_DIR_NAME = "rejected"  # Inbox batches that could not be parsed, kept for inspection
+SYMBOL_PATTERN = re.compile(r"^[A-Z][A-Z0-9.\-]{0,14}$")
+
+
+def normalize_symbol(symbol):
+    """Upper-case a ticker and reject anything that could escape its partition directory"""
+    symbol = (symbol or "").strip().upper()
+    if not SYMBOL_PATTERN.match(symbol):
+        raise ValueError(f"Invalid symbol: {symbol!r}")
+    return symbol
+
+
+def normalize_timeframe(timeframe):
+    timeframe = (timeframe or DEFAULT_TIMEFRAME).strip().lower()
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"timeframe must be one of: {', '.join(TIMEFRAMES)}")
+    return timeframe
+
+
+def periods_per_year(timeframe):
+    """Bars per year used to annualize returns and Sharpe ratios (252 for daily bars)"""
+    if BAR_SECONDS[timeframe] >= 86400:
+        return TRADING_DAYS_PER_YEAR * 86400 / BAR_SECONDS[timeframe]
+    return TRADING_DAYS_PER_YEAR * TRADING_SECONDS_PER_DAY / BAR_SECONDS[timeframe]
+
+
+def default_window(timeframe):
+    bars = DEFAULT_WINDOW_BARS.get(timeframe)
+    return None if bars is None else (None, None, bars)
+
+
+def parse_timestamp(value):
+    # Epoch milliseconds (as stored) or anything pandas reads as a date, taken as UTC
+    value = str(value).strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    try:
+        timestamp = pd.Timestamp(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.value // 1_000_000)
+
+
+def parse_window_options(args, timeframe):
+    """Read `start`, `end` (epoch ms or date) and `bars` (most recent N) from request args.
+
+    Returns a hashable (start, end, bars) window, or None for the full history;
+    intraday timeframes default to their most recent DEFAULT_WINDOW_BARS bars.
+    Raises ValueError when invalid.
+    """
+    start, end, bars = args.get("start"), args.get("end"), args.get("bars")
+    if start in (None, "") and end in (None, "") and bars in (None, ""):
+        return default_window(timeframe)
+    start = parse_timestamp(start) if start not in (None, "") else None
+    end = parse_timestamp(end) if end not in (None, "") else None
+    if bars not in (None, ""):
+        try:
+            bars = int(bars)
+        except (TypeError, ValueError):
+            raise ValueError("bars must be a positive integer")
+        if bars < 1:
+            raise ValueError("bars must be a positive integer")
+    else:
+        bars = None
+    if start is not None and end is not None and start > end:
+        raise ValueError("start must not be after end")
+    return (start, end, bars)
+
+
+def window_key(symbol, timeframe, window=None):
+    """Key for per-series caches (indicators, forecasts, charts); each window is its own series"""
+    if window is None:
+        return f"{symbol}:{timeframe}"
+    start, end, bars = window
+    return f"{symbol}:{timeframe}:{'' if start is None else start}-{'' if end is None else end}:{bars or ''}"
+
+
+def partition_key(series_key):
+    """The "symbol:timeframe" part of a window_key, for state shared by every window of one series"""
+    return ":".join(series_key.split(":")[:2])
+
+
+def parse_symbol_options(args, default_symbol):
+    """Read `symbol` and `timeframe` from request args; raises ValueError when invalid"""
+    return (
+        normalize_symbol(args.get("symbol") or default_symbol),
+        normalize_timeframe(args.get("timeframe")),
+    )
+
+
+def read_market_csv(path):
+    """Parse a market data CSV into plain column arrays"""
+    frame = pd.read_csv(path, dtype=MARKET_DATA_DTYPES)
+    missing = [name for name in BAR_COLUMNS if name not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return {name: frame[name].to_numpy() for name in BAR_COLUMNS}
+
+
+def write_inbox_batch(data_dir, symbol, timeframe, columns):
+    """Drop a batch of new bars into <data_dir>/inbox/<SYMBOL>_<timeframe>/ (same format as server.js).
+
+    The file is written under a temporary name and renamed, so readers never see it half-written.
+    """
+    inbox = os.path.join(data_dir, "inbox", f"{symbol}_{timeframe}")
+    os.makedirs(inbox, exist_ok=True)
+    timestamps = columns["timestamp"]
+    path = os.path.join(inbox, f"{int(timestamps[0])}-{int(timestamps[-1])}.csv")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    pd.DataFrame({name: columns[name] for name in BAR_COLUMNS}).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class BarPartition:
+    """Bars of one symbol/timeframe stored as immutable column segments (memory-mapped .npy files).
+
+    manifest.json lists the live segments and is replaced atomically, so a
+    reader always sees a complete set of segments.
+    """
+
+    def __init__(self, root, symbol, timeframe):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.path = os.path.join(root, symbol, timeframe)
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+
+    @contextmanager
+    def write_lock(self):
+        """Exclusive lock on the partition across processes (e.g. several gunicorn workers ingesting)"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def last_timestamp(self, manifest=None):
+        manifest = manifest if manifest is not None else self.read_manifest()
+        segments = manifest["segments"] if manifest else []
+        return segments[-1]["last_timestamp"] if segments else None
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def manifest_signature(self):
+        return tuple(_file_signature(self.manifest_path))
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _write_segment(self, columns, version):
+        # Columns go into a private directory that only becomes visible once complete
+        os.makedirs(self.path, exist_ok=True)
+        tmp_dir = os.path.join(self.path, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        for name in BAR_COLUMNS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(columns[name], dtype=MARKET_DATA_DTYPES[name]))
+        timestamps = columns["timestamp"]
+        segment = {
+            "name": f"seg-{version:06d}-{uuid.uuid4().hex[:8]}",
+            "rows": int(len(timestamps)),
+            "first_timestamp": int(timestamps[0]) if len(timestamps) else None,
+            "last_timestamp": int(timestamps[-1]) if len(timestamps) else None,
+        }
+        os.rename(tmp_dir, os.path.join(self.path, segment["name"]))
+        return segment
+
+    def replace(self, columns, source=None):
+        """Swap the whole partition for `columns` (e.g. after a full CSV import); call under write_lock()"""
+        old = self.read_manifest() or {"version": 0, "segments": []}
+        version = old["version"] + 1
+        segment = self._write_segment(columns, version)
+        self._write_manifest({"version": version, "segments": [segment], "source": source})
+        # Open memory maps keep working after unlink, so old segments can go straight away
+        for stale in old["segments"]:
+            shutil.rmtree(os.path.join(self.path, stale["name"]), ignore_errors=True)
+        return version
+
+    def append(self, columns, max_segments=MAX_SEGMENTS):
+        """Add bars newer than the last stored one as a new segment; call under write_lock().
+
+        Returns the number of bars appended. Existing segments are never
+        rewritten, except when the segment count passes `max_segments` and the
+        partition is compacted into a single segment.
+        """
+        manifest = self.read_manifest() or {"version": 0, "segments": [], "source": None}
+        timestamps = np.asarray(columns["timestamp"], dtype=np.int64)
+        order = np.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+        # Drop bars already stored and duplicates within the batch
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[1:] = timestamps[1:] != timestamps[:-1]
+        last = self.last_timestamp(manifest)
+        if last is not None:
+            keep &= timestamps > last
+        if not keep.any():
+            return 0
+        new = {name: np.asarray(columns[name])[order][keep] for name in BAR_COLUMNS}
+
+        if len(manifest["segments"]) + 1 > max_segments:
+            existing = self.load_columns(manifest)
+            merged = {name: np.concatenate([existing[name], new[name]]) for name in BAR_COLUMNS}
+            self.replace(merged, source=manifest.get("source"))
+            return int(keep.sum())
+
+        version = manifest["version"] + 1
+        segment = self._write_segment(new, version)
+        self._write_manifest({
+            "version": version,
+            "segments": manifest["segments"] + [segment],
+            "source": manifest.get("source"),
+        })
+        return int(keep.sum())
+
+    def size_bytes(self):
+        manifest = self.read_manifest() or {"segments": []}
+        return sum(
+            os.path.getsize(os.path.join(self.path, segment["name"], f"{name}.npy"))
+            for segment in manifest["segments"]
+            for name in BAR_COLUMNS
+        )
+
+    def open_columns(self, manifest):
+        """Memory-map every column of the segments listed in `manifest` (nothing is read yet)"""
+        segments = []
+        for segment in manifest["segments"]:
+            segment_dir = os.path.join(self.path, segment["name"])
+            segments.append({
+                name: np.load(os.path.join(segment_dir, f"{name}.npy"), mmap_mode="r") for name in BAR_COLUMNS
+            })
+        return BarColumns(segments, [segment["last_timestamp"] for segment in manifest["segments"]])
+
+    def load_columns(self, manifest):
+        columns = self.open_columns(manifest)
+        return columns.slice(0, len(columns))
+
+
+class BarColumns:
+    """Row-addressable view over the memory-mapped segments of one partition version.
+
+    Slicing only touches the segments (and pages) that overlap the requested
+    rows, so a window of recent bars costs the same however long the history is.
+    """
+
+    def __init__(self, segments, last_timestamps):
+        self._segments = segments
+        self._last_timestamps = np.asarray(last_timestamps, dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum([len(segment["timestamp"]) for segment in segments])]).astype(np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def locate(self, timestamp, side="left"):
+        """Row of the first bar at (`left`) or after (`right`) `timestamp`; a binary search per level"""
+        index = int(np.searchsorted(self._last_timestamps, timestamp, side=side))
+        if index == len(self._segments):
+            return len(self)
+        within = np.searchsorted(self._segments[index]["timestamp"], timestamp, side=side)
+        return int(self.offsets[index] + within)
+
+    def window(self, start=None, end=None, bars=None):
+        """(first row, stop row) of the bars in [start, end], keeping only the last `bars` of them"""
+        first = 0 if start is None else self.locate(start, "left")
+        stop = len(self) if end is None else self.locate(end, "right")
+        if bars is not None:
+            first = max(first, stop - bars)
+        return first, max(first, stop)
+
+    def slice(self, start, stop):
+        """Columns for rows [start, stop); a zero-copy memmap view when the rows lie in one segment"""
+        parts = {name: [] for name in BAR_COLUMNS}
+        for index, segment in enumerate(self._segments):
+            lo, hi = self.offsets[index], self.offsets[index + 1]
+            if hi <= start or lo >= stop:
+                continue
+            for name in BAR_COLUMNS:
+                parts[name].append(segment[name][max(start - lo, 0):min(stop, hi) - lo])
+        return {
+            name: (arrays[0] if len(arrays) == 1 else np.concatenate(arrays)) if arrays
+            else np.empty(0, dtype=MARKET_DATA_DTYPES[name])
+            for name, arrays in parts.items()
+        }
+
+
+class MarketDataStore:
+    """Process-wide cache of per-symbol bar partitions under <data_dir>/bars/<SYMBOL>/<timeframe>.
+
+    New bars arrive as small CSV batches in <data_dir>/inbox/<SYMBOL>_<timeframe>/
+    (written by server.js or the ingest.py replay tool) and are appended to the
+    partition on the next load. A full CSV at <data_dir>/csv/<SYMBOL>_<timeframe>.csv
+    that changed since it was last imported replaces the partition. Loading one
+    symbol never touches another symbol's files.
+    """
+
+    def __init__(self, data_dir, legacy_csv=None, legacy_symbol=None):
+        self.data_dir = data_dir
+        self.root = os.path.join(data_dir, "bars")
+        self.csv_dir = os.path.join(data_dir, "csv")
+        self.inbox_dir = os.path.join(data_dir, "inbox")
+        # Single-symbol CSV written by older versions of server.js, used until a per-symbol CSV exists
+        self.legacy_csv = legacy_csv
+        self.legacy_symbol = legacy_symbol
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._cache = {}  # (symbol, timeframe) -> (manifest signature, BarColumns, version, {window: frame})
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.imports = 0
+        self.appended_bars = 0
+        self.rejected_batches = 0
+
+    def partition(self, symbol, timeframe):
+        return BarPartition(self.root, symbol, timeframe)
+
+    def source_csv(self, symbol, timeframe):
+        path = os.path.join(self.csv_dir, f"{symbol}_{timeframe}.csv")
+        if os.path.exists(path):
+            return path
+        if self.legacy_csv and symbol == self.legacy_symbol and timeframe == DEFAULT_TIMEFRAME and os.path.exists(self.legacy_csv):
+            return self.legacy_csv
+        return None
+
+    def inbox(self, symbol, timeframe):
+        return os.path.join(self.inbox_dir, f"{symbol}_{timeframe}")
+
+    def _inbox_files(self, symbol, timeframe):
+        try:
+            names = os.listdir(self.inbox(symbol, timeframe))
+        except FileNotFoundError:
+            return []
+        # Named <first>-<last>.csv; oldest batch first
+        names = [name for name in names if name.endswith(".csv") and name.split("-")[0].isdigit()]
+        names.sort(key=lambda name: int(name.split("-")[0]))
+        return [os.path.join(self.inbox(symbol, timeframe), name) for name in names]
+
+    def exists(self, symbol, timeframe=DEFAULT_TIMEFRAME):
+        return (
+            self.source_csv(symbol, timeframe) is not None
+            or os.path.exists(self.partition(symbol, timeframe).manifest_path)
+            or bool(self._inbox_files(symbol, timeframe))
+        )
+
+    def _count(self, counter, amount=1):
+        # Counters are shared by every key, so they change under the store lock rather than a key lock
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _import_if_changed(self, partition):
+        source = self.source_csv(partition.symbol, partition.timeframe)
+        if source is None:
+            return
+        signature = _file_signature(source)
+        manifest = partition.read_manifest()
+        if manifest is not None and manifest.get("source") == signature:
+            return
+        with partition.write_lock():
+            # Another process may have imported it while we waited for the lock
+            manifest = partition.read_manifest()
+            if manifest is not None and manifest.get("source") == signature:
+                return
+            columns = read_market_csv(source)
+            version = partition.replace(columns, source=signature)
+        self._count("imports")
+        logger.info(f"✅ Imported {len(columns['close'])} {partition.symbol} {partition.timeframe} bars (version {version})")
+
+    def _ingest_inbox(self, partition):
+        files = self._inbox_files(partition.symbol, partition.timeframe)
+        if not files:
+            return
+        with partition.write_lock():
+            for path in files:
+                try:
+                    columns = read_market_csv(path)
+                    appended = partition.append(columns) if len(columns["timestamp"]) else 0
+                except FileNotFoundError:
+                    continue  # Ingested by another process
+                except ValueError as e:
+                    # A malformed or partial batch would fail every later load of the symbol; set it aside
+                    self._reject_batch(path, e)
+                    continue
+                os.remove(path)
+                self._count("appended_bars", appended)
+                logger.info(f"✅ Appended {appended} new {partition.symbol} {partition.timeframe} bars from {os.path.basename(path)}")
+
+    def _reject_batch(self, path, error):
+        rejected_dir = os.path.join(os.path.dirname(path), REJECTED_DIR_NAME)
+        os.makedirs(rejected_dir, exist_ok=True)
+        try:
+            os.replace(path, os.path.join(rejected_dir, os.path.basename(path)))
+        except FileNotFoundError:
+            return
+        self._count("rejected_batches")
+        logger.error(f"❌ Rejected inbox batch {path}: {str(error)} (moved to {rejected_dir})")
+
+    def append(self, symbol, timeframe, columns):
+        """Append bars directly (bars at or before the last stored timestamp are skipped); returns the count"""
+        partition = self.partition(symbol, timeframe)
+        with self._key_lock((symbol, timeframe)), partition.write_lock():
+            appended = partition.append(columns)
+        self._count("appended_bars", appended)
+        return appended
+
+    def load(self, symbol, timeframe=DEFAULT_TIMEFRAME, window=None):
+        """Return (frame, version) for one symbol/timeframe.
+
+        `window` is a (start, end, bars) tuple from parse_window_options; only
+        the rows it covers are read, however long the stored history is. The
+        frame is a shallow view over read-only memory-mapped columns: callers
+        may add columns to it but cannot modify the stored values.
+        """
+        key = (symbol, timeframe)
+        with self._key_lock(key):
+            columns, version, frames = self._open(key)
+            frame = frames.get(window)
+            if frame is not None:
+                self._count("hits")
+                return frame.copy(deep=False), version
+
+            self._count("misses")
+            start, stop = (0, len(columns)) if window is None else columns.window(*window)
+            frame = pd.DataFrame(columns.slice(start, stop), copy=False)
+            if len(frames) >= MAX_CACHED_WINDOWS:
+                frames.pop(next(iter(frames)))
+            frames[window] = frame
+            logger.info(f"✅ Market data loaded into memory ({symbol} {timeframe}, rows {start}-{stop} of {len(columns)}, version {version})")
+            return frame.copy(deep=False), version
+
+    def _open(self, key):
+        # Caller holds the key lock; picks up imports and inbox batches, then reuses or reopens the columns
+        partition = self.partition(*key)
+        self._import_if_changed(partition)
+        self._ingest_inbox(partition)
+        signature = partition.manifest_signature()
+
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2], cached[3]
+        if cached is not None:
+            self._count("reloads")
+        manifest = partition.read_manifest()
+        columns, version, frames = partition.open_columns(manifest), manifest["version"], {}
+        self._cache[key] = (signature, columns, version, frames)
+        return columns, version, frames
+
+    def bars_after(self, symbol, timeframe=DEFAULT_TIMEFRAME, timestamp=None):
+        """(columns, version) of the bars stored after `timestamp` (every bar when None).
+
+        Only the rows after it are read, and no frame is cached for them, so following a
+        growing series costs O(new bars) per call.
+        """
+        key = (symbol, timeframe)
+        with self._key_lock(key):
+            columns, version, _ = self._open(key)
+            start = 0 if timestamp is None else columns.locate(timestamp, "right")
+            return columns.slice(start, len(columns)), version
+
+    def rows(self, symbol, timeframe=DEFAULT_TIMEFRAME):
+        """Number of stored bars, without reading any of them"""
+        manifest = self.partition(symbol, timeframe).read_manifest()
+        return sum(segment["rows"] for segment in manifest["segments"]) if manifest else 0
+
+    def invalidate(self, symbol=None, timeframe=None):
+        """Drop cached frames (all, one symbol, or one symbol/timeframe) so the next load re-checks disk"""
+        with self._lock:
+            for key in list(self._cache):
+                if (symbol is None or key[0] == symbol) and (timeframe is None or key[1] == timeframe):
+                    del self._cache[key]
+
+    def stats(self):
+        with self._lock:
+            partitions = {
+                f"{symbol}:{timeframe}": {"rows": len(columns), "version": version, "windows": len(frames)}
+                for (symbol, timeframe), (_, columns, version, frames) in self._cache.items()
+            }
+        return {
+            "root": self.root,
+            "partitions": partitions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "imports": self.imports,
+            "appended_bars": self.appended_bars,
+            "rejected_batches": self.rejected_batches,
+        }
@@ -0,0 +1,116 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _ModelEntry:
+    def __init__(self, name, loader, warm):
+        self.name = name
+        self.loader = loader
+        self.warm = warm
+        self.lock = threading.Lock()
+        self.state = "not_loaded"
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.warm_seconds = None
+        self.loaded_at = None
+        self.generation = 0  # Bumped on every successful (re)load
+
+
+class ModelRegistry:
+    """Loads models on first use (or during warmup) and keeps them for the life of the process"""
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name, loader, warm=None):
+        """`loader()` returns the model; the optional `warm(model)` runs once after loading"""
+        self._entries[name] = _ModelEntry(name, loader, warm)
+
+    def names(self):
+        return list(self._entries)
+
+    def get(self, name):
+        """Return the loaded model, loading it now if needed; None if loading failed"""
+        entry = self._entries[name]
+        if entry.state in ("loaded", "failed"):
+            return entry.value
+        with entry.lock:
+            if entry.state not in ("loaded", "failed"):
+                self._load(entry)
+        return entry.value
+
+    def generation(self, name):
+        """How many times the model has been (re)loaded; lets callers key caches by model version"""
+        return self._entries[name].generation
+
+    def _load(self, entry, keep_previous=False):
+        if not keep_previous:
+            entry.state = "loading"
+        started = time.perf_counter()
+        try:
+            value = entry.loader()
+            entry.load_seconds = time.perf_counter() - started
+            if entry.warm is not None:
+                started = time.perf_counter()
+                entry.warm(value)
+                entry.warm_seconds = time.perf_counter() - started
+            # Single reference swap: requests already holding the old model finish with it
+            entry.value = value
+            entry.error = None
+            entry.loaded_at = time.time()
+            entry.generation += 1
+            entry.state = "loaded"
+            logger.info(f"✅ {entry.name} model loaded in {entry.load_seconds:.2f}s")
+        except FileNotFoundError as e:
+            entry.error = f"File not found: {e.filename or str(e)}"
+            if not keep_previous:
+                entry.state = "failed"
+            logger.warning(f"⚠️ Warning: {entry.name} model file not found: {entry.error}")
+        except Exception as e:
+            entry.error = str(e)
+            if not keep_previous:
+                entry.state = "failed"
+            logger.warning(f"⚠️ Warning: Error loading {entry.name} model: {str(e)}")
+
+    def reload(self, names=None):
+        """Load fresh copies of the given models (default: every loaded one) and swap them in.
+
+        The current model keeps serving while the new one loads, and stays in
+        place if loading fails. Returns {name: error or None}.
+        """
+        if names is None:
+            names = [name for name, entry in self._entries.items() if entry.state == "loaded"]
+        results = {}
+        for name in names:
+            entry = self._entries[name]
+            with entry.lock:
+                self._load(entry, keep_previous=entry.state == "loaded")
+            results[name] = entry.error
+        return results
+
+    def warmup(self, names):
+        """Eagerly load the given models ("all" loads every registered model)"""
+        if "all" in names:
+            names = self.names()
+        for name in names:
+            if name not in self._entries:
+                logger.warning(f"⚠️ Warning: Unknown model in warmup list: {name}")
+                continue
+            self.get(name)
+
+    def status(self):
+        return {
+            name: {
+                "state": entry.state,
+                "load_seconds": entry.load_seconds,
+                "warm_seconds": entry.warm_seconds,
+                "loaded_at": entry.loaded_at,
+                "generation": entry.generation,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from triggers import STOP_LOSS, TAKE_PROFIT, thresholds_from_percent, bar_fill_price
+
+# Exit reasons, stored as their index in the fill log
+REASONS = ("signal", STOP_LOSS, TAKE_PROFIT, "end")
+FILL_COLUMNS = {
+    "replay": np.int32,
+    "side": np.int8,  # 1 long, -1 short
+    "entry_time": np.int64,
+    "exit_time": np.int64,
+    "entry_price": np.float64,
+    "exit_price": np.float64,
+    "quantity": np.float64,
+    "pnl": np.float64,
+    "reason": np.int8,
+    "equity": np.float64,  # Realized equity of the replay after the fill
+}
+BAR_INPUTS = ("timestamp", "open", "high", "low", "close")
+MAX_REPLAYS = 5000
+
+
+def _next_index(indices, start):
+    # First of the sorted `indices` at or after `start`, or None
+    position = np.searchsorted(indices, start)
+    return int(indices[position]) if position < len(indices) else None
+
+
+def first_crossing(low, high, below, above, start, stop, chunk=64):
+    """First bar in [start, stop) whose low reaches `below` or whose high reaches `above`, or None.
+
+    Scans in doubling chunks, so a position closed soon after opening does not pay for the
+    bars up to its next opposite signal.
+    """
+    if below is None and above is None:
+        return None
+    while start < stop:
+        end = min(stop, start + chunk)
+        reached = np.zeros(end - start, dtype=bool)
+        if below is not None:
+            reached |= low[start:end] <= below
+        if above is not None:
+            reached |= high[start:end] >= above
+        hits = np.flatnonzero(reached)
+        if len(hits):
+            return start + int(hits[0])
+        start, chunk = end, chunk * 2
+    return None
+
+
+def replay(bars, signals, stop_loss_pct=None, take_profit_pct=None, investment=10000.0, max_trades=None, cost_bps=0.0):
+    """Trade one symbol through its bars the way auto-trading does; returns the fill columns.
+
+    `signals` holds +1 (buy), -1 (sell) or 0 (no signal) per bar, as the model saw it at
+    the bar's close. With no position a signal opens one at the close; an opposite signal
+    closes it and opens the reverse one, and a bar that reaches the stop loss or take profit
+    closes it like the server-side trigger engine. The loop advances from event to event
+    (entries, opposite signals, threshold crossings) instead of bar by bar.
+    """
+    timestamps, open_, high, low, close = (np.asarray(bars[name]) for name in BAR_INPUTS)
+    signals = np.asarray(signals, dtype=np.int8)
+    n_bars = len(close)
+    entries = {1: np.flatnonzero(signals == 1), -1: np.flatnonzero(signals == -1)}
+    any_signal = np.flatnonzero(signals != 0)
+    cost = cost_bps / 10000.0
+    fills = {name: [] for name in FILL_COLUMNS if name not in ("replay", "equity")}
+
+    trades = 0
+    entry_bar = _next_index(any_signal, 0)
+    while entry_bar is not None and (max_trades is None or trades < max_trades):
+        direction = int(signals[entry_bar])
+        side = "buy" if direction == 1 else "sell"
+        entry_price = float(close[entry_bar])
+        quantity = math.floor(investment / entry_price) if entry_price > 0 else 0
+        if quantity < 1:
+            entry_bar = _next_index(any_signal, entry_bar + 1)
+            continue
+        trades += 1
+        stop_loss, take_profit = thresholds_from_percent(side, entry_price, stop_loss_pct, take_profit_pct)
+        below, above = (stop_loss, take_profit) if side == "buy" else (take_profit, stop_loss)
+
+        opposite = _next_index(entries[-direction], entry_bar + 1)
+        # Thresholds are checked through the opposite signal's bar: they fire intrabar, before its close
+        hit = first_crossing(low, high, below, above, entry_bar + 1, n_bars if opposite is None else opposite + 1)
+        if hit is not None:
+            # The stop loss is assumed to come first when a bar reached both thresholds
+            if side == "buy":
+                stopped = below is not None and low[hit] <= below
+            else:
+                stopped = above is not None and high[hit] >= above
+            reason = STOP_LOSS if stopped else TAKE_PROFIT
+            exit_bar = hit
+            exit_price = bar_fill_price(side, reason, stop_loss if stopped else take_profit, float(open_[hit]))
+            # The exit bar's own signal may open the next position at its close
+            next_entry = _next_index(any_signal, hit)
+        elif opposite is not None:
+            exit_bar, exit_price, reason = opposite, float(close[opposite]), "signal"
+            next_entry = opposite
+        else:
+            exit_bar, exit_price, reason = n_bars - 1, float(close[-1]), "end"
+            next_entry = None
+
+        fills["side"].append(direction)
+        fills["entry_time"].append(int(timestamps[entry_bar]))
+        fills["exit_time"].append(int(timestamps[exit_bar]))
+        fills["entry_price"].append(entry_price)
+        fills["exit_price"].append(exit_price)
+        fills["quantity"].append(quantity)
+        fills["pnl"].append(quantity * (direction * (exit_price - entry_price) - cost * (entry_price + exit_price)))
+        fills["reason"].append(REASONS.index(reason))
+        entry_bar = next_entry
+
+    columns = {name: np.asarray(values, dtype=FILL_COLUMNS[name]) for name, values in fills.items()}
+    columns["equity"] = investment + np.cumsum(columns["pnl"])
+    return columns
+
+
+def summarize(fills, investment, n_bars):
+    """Trade count, PnL, win rate, drawdown of realized equity and exits per reason of one replay"""
+    pnl = fills["pnl"]
+    trades = len(pnl)
+    equity = np.concatenate([[investment], fills["equity"]])
+    peaks = np.maximum.accumulate(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = np.where(peaks > 0, equity / peaks - 1, 0.0)
+    return {
+        "bars": int(n_bars),
+        "trades": trades,
+        "pnl": float(pnl.sum()),
+        "return": float(pnl.sum() / investment) if investment else 0.0,
+        "win_rate": float((pnl > 0).sum() / trades) if trades else 0.0,
+        "max_drawdown": float(drawdown.min()),
+        "exits": {reason: int((fills["reason"] == code).sum()) for code, reason in enumerate(REASONS)},
+    }
+
+
+def replay_spec(inputs, spec):
+    """(summary, fills) of one replay spec against the bars/signals in `inputs[(symbol, model)]`"""
+    data = inputs[(spec["symbol"], spec["model"])]
+    fills = replay(
+        data, data["signals"], spec.get("stop_loss"), spec.get("take_profit"),
+        spec.get("investment", 10000.0), spec.get("max_trades"), spec.get("cost_bps", 0.0),
+    )
+    return dict(spec, **summarize(fills, spec.get("investment", 10000.0), len(data["close"]))), fills
+
+
+# Set in each worker process by _receive_inputs
+_inputs = {}
+
+
+def _receive_inputs(inputs):
+    _inputs.update(inputs)
+
+
+def _replay_chunk(specs):
+    return [replay_spec(_inputs, spec) for spec in specs]
+
+
+def _process_context():
+    # Never fork: this runs in request threads, and a child forked while another thread holds
+    # a lock (logging, a model session) can hang. Forkserver children fork from a single-threaded server.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Imported once by the fork server instead of by every worker (applies when it has not started yet)
+    context.set_forkserver_preload(["__main__", __name__])
+    return context
+
+
+def run_replays(inputs, specs, workers=None):
+    """Run every spec (symbol, model, stop_loss, take_profit, ...) and collect summaries and fills.
+
+    `inputs` maps (symbol, model) to the bar columns plus a `signals` array. Specs are
+    spread over a process pool whose workers receive `inputs` once, when they start; with
+    one worker they run in this process. Fills of all replays are concatenated, each row
+    tagged with its spec's index.
+    """
+    if len(specs) > MAX_REPLAYS:
+        raise ValueError(f"{len(specs)} replays requested (at most {MAX_REPLAYS} are allowed)")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(specs) or 1))
+    started = time.perf_counter()
+
+    if workers == 1:
+        results = [replay_spec(inputs, spec) for spec in specs]
+    else:
+        size = max(1, math.ceil(len(specs) / (workers * 4)))
+        chunks = [specs[start:start + size] for start in range(0, len(specs), size)]
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=_process_context(), initializer=_receive_inputs, initargs=(inputs,),
+        ) as pool:
+            results = [result for part in pool.map(_replay_chunk, chunks) for result in part]
+
+    fills = {
+        name: np.concatenate([part[name] for _, part in results]) if results else np.empty(0, dtype=dtype)
+        for name, dtype in FILL_COLUMNS.items() if name != "replay"
+    }
+    fills["replay"] = np.repeat(np.arange(len(results), dtype=np.int32), [len(part["pnl"]) for _, part in results])
+    elapsed = time.perf_counter() - started
+    bars = sum(summary["bars"] for summary, _ in results)
+    return {
+        "replays": [summary for summary, _ in results],
+        "fills": fills,
+        "workers": workers,
+        "elapsed_ms": round(1000 * elapsed, 1),
+        "bars_per_second": round(bars / elapsed) if elapsed > 0 else None,
+    }
+
+
+def write_fill_log(path, replays, fills):
+    """Write fills (one array per column) and their replay specs to a compressed .npz file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    try:
+        np.savez_compressed(
+            tmp_path,
+            reasons=np.array(REASONS),
+            replays=np.array(json.dumps(replays)),
+            **{name: fills[name] for name in FILL_COLUMNS},
+        )
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def read_fill_log(path):
+    """(replays, fills DataFrame) from a fill log, with the symbol, model and exit reason of each fill"""
+    with np.load(path) as stored:
+        replays = json.loads(str(stored["replays"]))
+        reasons = stored["reasons"]
+        fills = pd.DataFrame({name: stored[name] for name in FILL_COLUMNS})
+    fills["symbol"] = [replays[index]["symbol"] for index in fills["replay"]]
+    fills["model"] = [replays[index]["model"] for index in fills["replay"]]
+    fills["reason"] = reasons[fills["reason"].to_numpy()]
+    return replays, fills
+
+
+def replay_specs(symbols, model_names, stop_losses=(None,), take_profits=(None,), **options):
+    """Every symbol x model x stop loss x take profit combination as replay specs"""
+    return [
+        dict(symbol=symbol, model=model, stop_loss=stop_loss, take_profit=take_profit, **options)
+        for symbol in symbols for model in model_names for stop_loss in stop_losses for take_profit in take_profits
+    ]
+
+
+def _pct_list(text):
+    return [None if value.strip().lower() in ("", "none") else float(value) for value in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay stored bars through the prediction models with stop loss/take profit")
+    parser.add_argument("--symbols", default="AAPL", help="Comma separated tickers")
+    parser.add_argument("--models", default="macd", help="Comma separated: moving_average, sentiment, macd, transformer")
+    parser.add_argument("--timeframe", default="1d")
+    parser.add_argument("--start", help="First bar (epoch ms or date)")
+    parser.add_argument("--end", help="Last bar (epoch ms or date)")
+    parser.add_argument("--bars", type=int, help="Only the most recent N bars")
+    parser.add_argument("--stop-loss", type=_pct_list, default=[None], help="Stop loss percentages, e.g. 1,2,5")
+    parser.add_argument("--take-profit", type=_pct_list, default=[None], help="Take profit percentages, e.g. 2,4,10")
+    parser.add_argument("--investment", type=float, default=10000.0)
+    parser.add_argument("--max-trades", type=int)
+    parser.add_argument("--cost-bps", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="Write the fills to this .npz fill log")
+    parser.add_argument("--json", action="store_true", help="Print the replay summaries as JSON")
+    args = parser.parse_args(argv)
+
+    # The signals come from the prediction server's own models and indicator pipeline
+    import server
+    from instrumentation import configure_logging
+    from market_data import normalize_symbol, normalize_timeframe, parse_window_options
+    configure_logging()
+
+    timeframe = normalize_timeframe(args.timeframe)
+    symbols = [normalize_symbol(symbol) for symbol in args.symbols.split(",") if symbol.strip()]
+    model_names = [name.strip() for name in args.models.split(",") if name.strip()]
+    window = parse_window_options({"start": args.start, "end": args.end, "bars": args.bars}, timeframe)
+    inputs, errors = server.load_replay_inputs(symbols, model_names, timeframe, window)
+    for (symbol, model), error in errors.items():
+        print(f"⚠️ Skipping {symbol} {model}: {error}")
+    if not inputs:
+        print("❌ No replay inputs for the requested symbols and models")
+        return 1
+
+    specs = [
+        spec for spec in replay_specs(
+            symbols, model_names, args.stop_loss, args.take_profit,
+            investment=args.investment, max_trades=args.max_trades, cost_bps=args.cost_bps,
+        ) if (spec["symbol"], spec["model"]) in inputs
+    ]
+    result = run_replays(inputs, specs, args.workers)
+    if args.output:
+        write_fill_log(args.output, result["replays"], result["fills"])
+
+    if args.json:
+        print(json.dumps(result["replays"], indent=2))
+        return 0
+    print(f"✅ {len(specs)} replays, {len(result['fills']['pnl'])} trades in {result['elapsed_ms'] / 1000:.2f}s "
+          f"({result['bars_per_second']} bars/s, {result['workers']} workers)")
+    columns = ("symbol", "model", "stop_loss", "take_profit", "trades", "pnl", "return", "win_rate", "max_drawdown")
+    print("  ".join(f"{column:>12}" for column in columns))
+    for row in result["replays"]:
+        print("  ".join(
+            f"{row[column]:>12.4f}" if isinstance(row[column], float) else f"{str(row[column]):>12}" for column in columns
+        ))
+    if args.output:
+        print(f"✅ Fills written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
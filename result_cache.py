@@ -0,0 +1,109 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """Bounded LRU cache of computed results with a TTL and one computation per key at a time.
+
+    Callers asking for a key that is being computed wait for that computation instead of
+    starting their own (stampede protection). Results only go into the cache when
+    `cacheable(value)` is true; waiters receive them either way.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, wait_timeout=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """(value, "hit" | "miss" | "coalesced") for `key`, calling `compute()` only when needed"""
+        if self.max_entries <= 0:
+            return compute(), "miss"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], "hit"
+                del self._entries[key]
+                self.expired += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                # The first caller is stuck; do not hold this one hostage
+                return compute(), "miss"
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "coalesced"
+
+        try:
+            value = compute()
+            flight.value = value
+            if cacheable is None or cacheable(value):
+                with self._lock:
+                    self._entries[key] = (self.clock() + self.ttl, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            return value, "miss"
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, match=None):
+        """Drop every entry, or those whose key satisfies `match(key)`"""
+        with self._lock:
+            if match is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            keys = [key for key in self._entries if match(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+            inflight = len(self._inflight)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "inflight": inflight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
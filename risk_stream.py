@@ -0,0 +1,297 @@
+import math
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+from backtest import PERIODS_PER_YEAR
+from indicators import IndicatorState, SMA_WINDOWS
+
+ROLLING_WINDOWS = (30, 90, 252)
+# Strategies whose positions follow from the running indicator state, so a new bar costs O(1)
+STRATEGIES = ("macd", "sma_crossover")
+
+
+class RunningMoments:
+    """Count, mean and sum of squared deviations, updated one value at a time (Welford)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        # Welford's update run backwards, for values leaving a rolling window
+        if self.count <= 1:
+            self.reset()
+            return
+        delta = value - self.mean
+        self.count -= 1
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (value - self.mean), 0.0)
+
+    def reset(self, values=()):
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+        for value in values:
+            self.add(value)
+
+    def std(self):
+        # Sample standard deviation, as pandas' .std()
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+def _sharpe(moments, bars_per_year):
+    std = moments.std()
+    return moments.mean / std * math.sqrt(bars_per_year) if std > 0 else 0.0
+
+
+def _traded(strategy_return):
+    # A bar without a return (NaN) is not a trade, nor is a flat one
+    return math.isfinite(strategy_return) and strategy_return != 0
+
+
+def _annualized(total_return, bars, bars_per_year):
+    if not bars or total_return <= -1:
+        return -1.0 if total_return <= -1 else 0.0
+    return (1 + total_return) ** (bars_per_year / bars) - 1
+
+
+class RollingRisk:
+    """Risk metrics of the last `size` bars, kept in ring buffers.
+
+    Each bar costs O(1): the leaving return is taken out of the running moments and win
+    counters, and the window return divides the current equity by the equity before the
+    window's first bar. The moments are recomputed from the buffer once per wrap-around so
+    rounding errors from repeated removals cannot build up (amortized O(1) as well).
+    The drawdown is the current one from the window's highest equity, tracked with a
+    monotonic deque.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.returns = np.zeros(size)              # strategy return of each bar (NaN when it had none)
+        self.equity_before = np.ones(size)         # strategy equity before each bar
+        self.buy_hold_before = np.ones(size)
+        self.moments = RunningMoments()
+        self.bars = 0
+        self.wins = 0
+        self.traded = 0
+        self._next = 0
+        self._peaks = deque([(-1, 1.0)])           # (bar index, equity after it); -1 is the starting equity
+
+    def add(self, index, strategy_return, equity_before, equity, buy_hold_before):
+        if self.bars == self.size:
+            self._drop(self.returns[self._next])
+        else:
+            self.bars += 1
+        self.returns[self._next] = strategy_return
+        self.equity_before[self._next] = equity_before
+        self.buy_hold_before[self._next] = buy_hold_before
+        self._next = (self._next + 1) % self.size
+        self.wins += strategy_return > 0
+        self.traded += _traded(strategy_return)
+        if math.isfinite(strategy_return):
+            self.moments.add(strategy_return)
+        if self._next == 0:
+            self.moments.reset(value for value in self.returns if math.isfinite(value))
+
+        while self._peaks and self._peaks[-1][1] <= equity:
+            self._peaks.pop()
+        self._peaks.append((index, equity))
+        # Keep the equity before the window's first bar as a peak candidate
+        while self._peaks[0][0] < index - self.size:
+            self._peaks.popleft()
+
+    def _drop(self, strategy_return):
+        self.wins -= strategy_return > 0
+        self.traded -= _traded(strategy_return)
+        if math.isfinite(strategy_return):
+            self.moments.remove(strategy_return)
+
+    def snapshot(self, equity, buy_hold, bars_per_year):
+        oldest = self._next if self.bars == self.size else 0
+        start_equity = self.equity_before[oldest] if self.bars else equity
+        start_buy_hold = self.buy_hold_before[oldest] if self.bars else buy_hold
+        total_return = equity / start_equity - 1 if start_equity > 0 else -1.0
+        peak = self._peaks[0][1]
+        return {
+            "bars": self.bars,
+            "total_return": float(total_return),
+            "buy_hold_return": float(buy_hold / start_buy_hold - 1 if start_buy_hold > 0 else -1.0),
+            "annualized_return": float(_annualized(total_return, self.bars, bars_per_year)),
+            "sharpe_ratio": float(_sharpe(self.moments, bars_per_year)),
+            "drawdown": float(equity / peak - 1 if peak > 0 else 0.0),
+            "win_rate": float(self.wins / self.traded if self.traded else 0.0),
+        }
+
+
+class RiskAccumulator:
+    """calculate_risk_metrics of a return stream, updated in O(1) per bar instead of recomputed.
+
+    Whole-period figures come from running moments, equity, peak and counters, and each of
+    `windows` (in bars) adds the same figures over the most recent bars only.
+    """
+
+    def __init__(self, windows=ROLLING_WINDOWS):
+        self.moments = RunningMoments()
+        self.bars = 0
+        self.wins = 0
+        self.traded = 0
+        self.equity = 1.0
+        self.buy_hold = 1.0
+        self.peak = 1.0
+        self.max_drawdown = 0.0
+        self.windows = {size: RollingRisk(size) for size in windows}
+
+    def update(self, market_return, strategy_return):
+        """Add one bar; a NaN strategy return (a bar without a previous close) moves no equity"""
+        equity_before, buy_hold_before = self.equity, self.buy_hold
+        if math.isfinite(strategy_return):
+            self.moments.add(strategy_return)
+            self.equity *= 1 + strategy_return
+        if math.isfinite(market_return):
+            self.buy_hold *= 1 + market_return
+        self.wins += strategy_return > 0
+        self.traded += _traded(strategy_return)
+        self.peak = max(self.peak, self.equity)
+        self.max_drawdown = min(self.max_drawdown, self.equity / self.peak - 1 if self.peak > 0 else 0.0)
+        for window in self.windows.values():
+            window.add(self.bars, strategy_return, equity_before, self.equity, buy_hold_before)
+        self.bars += 1
+
+    def extend(self, market_returns, strategy_returns):
+        for market_return, strategy_return in zip(np.asarray(market_returns, dtype=np.float64).tolist(),
+                                                  np.asarray(strategy_returns, dtype=np.float64).tolist()):
+            self.update(market_return, strategy_return)
+
+    def snapshot(self, bars_per_year=PERIODS_PER_YEAR):
+        """Whole-period metrics under the names calculate_risk_metrics uses, plus a "rolling" entry per window"""
+        total_return = self.equity - 1
+        return {
+            "bars": self.bars,
+            "total_return": float(total_return),
+            "buy_hold_return": float(self.buy_hold - 1),
+            "annualized_return": float(_annualized(total_return, self.bars, bars_per_year)),
+            "sharpe_ratio": float(_sharpe(self.moments, bars_per_year)),
+            "max_drawdown": float(self.max_drawdown),
+            "drawdown": float(self.equity / self.peak - 1 if self.peak > 0 else 0.0),
+            "win_rate": float(self.wins / self.traded if self.traded else 0.0),
+            "rolling": {
+                str(size): window.snapshot(self.equity, self.buy_hold, bars_per_year)
+                for size, window in self.windows.items()
+            },
+        }
+
+
+class StrategyFeed:
+    """Bar and strategy returns of an indicator strategy, computed from newly arrived closes only.
+
+    Follows backtest.run_backtest: the position held at a bar's close earns the next bar's
+    return, and every change in the held position costs `cost_bps` basis points.
+    """
+
+    def __init__(self, strategy, cost_bps=0.0):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of: {', '.join(STRATEGIES)}")
+        self.strategy = strategy
+        self.cost = cost_bps / 10000.0
+        self.indicators = IndicatorState()
+        self.last_close = None
+        self.position = 0.0  # Position at the last bar's close, held during the next bar
+        self.held = 0.0      # Position held during the last bar
+
+    def extend(self, close):
+        close = np.asarray(close, dtype=np.float64)
+        if not len(close):
+            return np.empty(0), np.empty(0)
+        start = self.indicators.count
+        self.indicators.append(close)
+        if self.strategy == "macd":
+            positions = self.indicators.series("position")[start:]
+        else:
+            short, long = (self.indicators.series(f"sma_{length}")[start:] for length in SMA_WINDOWS)
+            positions = (short > long).astype(np.float64)
+
+        previous = np.concatenate([[np.nan if self.last_close is None else self.last_close], close[:-1]])
+        returns = close / previous - 1
+        held = np.concatenate([[self.position], positions[:-1]])
+        turnover = np.abs(np.diff(held, prepend=self.held))
+        strategy_returns = held * returns - turnover * self.cost
+        self.last_close, self.position, self.held = float(close[-1]), float(positions[-1]), float(held[-1])
+        return returns, strategy_returns
+
+
+class RiskMonitor:
+    """A RiskAccumulator per series key (e.g. symbol, timeframe, strategy), fed only with bars it has not seen.
+
+    Each series keeps the feed that turns its closes into returns, and the timestamp of the
+    last bar it added, so an update only reads and processes the bars after it. Up to
+    `max_series` series are kept, the least recently used dropped first.
+    """
+
+    def __init__(self, windows=ROLLING_WINDOWS, max_series=1024):
+        self.windows = tuple(windows)
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._series = OrderedDict()  # key -> [accumulator, last timestamp, lock, feed]
+        self.updates = 0
+
+    def _entry(self, key, create):
+        with self._lock:
+            entry = self._series.get(key)
+            if entry is None and create:
+                entry = self._series[key] = [RiskAccumulator(self.windows), None, threading.Lock(), None]
+                while len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+            if entry is not None:
+                self._series.move_to_end(key)
+            return entry
+
+    def cursor(self, key):
+        """Timestamp of the last bar added to `key`, or None when it is not tracked yet"""
+        entry = self._entry(key, False)
+        return None if entry is None else entry[1]
+
+    def update(self, key, read_bars, make_feed):
+        """Add the bars after the series' last one; returns how many were added.
+
+        `read_bars(last timestamp or None)` returns the (timestamps, closes) stored after it,
+        and `make_feed()` the StrategyFeed of a series seen for the first time.
+        """
+        entry = self._entry(key, True)
+        with entry[2]:
+            if entry[3] is None:
+                entry[3] = make_feed()
+            timestamps, close = read_bars(entry[1])
+            timestamps = np.asarray(timestamps)
+            start = 0 if entry[1] is None else int(np.searchsorted(timestamps, entry[1], side="right"))
+            if start < len(timestamps):
+                entry[0].extend(*entry[3].extend(close[start:]))
+                entry[1] = int(timestamps[-1])
+        with self._lock:
+            self.updates += len(timestamps) - start
+        return len(timestamps) - start
+
+    def keys(self, match=None):
+        with self._lock:
+            return [key for key in self._series if match is None or match(key)]
+
+    def snapshot(self, key, bars_per_year=PERIODS_PER_YEAR):
+        """Metrics of a tracked series (KeyError when untracked); reads only the running state"""
+        entry = self._entry(key, False)
+        if entry is None:
+            raise KeyError(key)
+        with entry[2]:
+            return dict(entry[0].snapshot(bars_per_year), last_timestamp=entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"series": len(self._series), "windows": list(self.windows), "bars_added": self.updates}
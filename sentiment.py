@@ -0,0 +1,243 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from market_data import BAR_SECONDS, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Inputs of models/sentiment_model.pkl, in training order
+MODEL_FEATURES = ["Compound", "Positive", "Negative", "Neutral", "Post_Count", "Close", "Volume", "Returns"]
+SCORE_COLUMNS = ("compound", "pos", "neg", "neu")
+# What VADER gives a headline with no sentiment words; used for buckets without headlines
+NEUTRAL_SCORES = (0.0, 0.0, 0.0, 1.0)
+SCORE_CACHE_FILE = "score_cache.npz"
+TEXT_FIELDS = ("headline", "title", "text")
+TIME_FIELDS = ("timestamp", "published", "date")
+
+
+def document_hash(text):
+    """Content hash of a headline, ignoring case and surrounding/repeated whitespace"""
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+def read_headlines(path):
+    """(timestamp ms, headline) pairs from a JSONL file; lines without both fields are skipped"""
+    headlines = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                text = next(str(entry[name]) for name in TEXT_FIELDS if entry.get(name))
+                published = next(entry[name] for name in TIME_FIELDS if entry.get(name) not in (None, ""))
+                headlines.append((parse_timestamp(published), text))
+            except (ValueError, StopIteration, AttributeError) as e:
+                logger.warning(f"⚠️ Skipping {os.path.basename(path)} line {number}: {str(e) or 'missing headline or timestamp'}")
+    return headlines
+
+
+class HeadlineScorer:
+    """VADER polarity scores (compound, pos, neg, neu) per headline, each document scored only once.
+
+    Scores are kept per document hash and persisted to `cache_path`, so a restart does not
+    rescore the corpus.
+    """
+
+    def __init__(self, cache_path=None, batch_size=512):
+        self.cache_path = cache_path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._analyzer = None
+        self._scores = {}
+        self.scored = 0
+        self.cached = 0
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as stored:
+                    self._scores = dict(zip(stored["hashes"].tolist(), stored["scores"]))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"⚠️ Ignoring unreadable sentiment score cache {cache_path}: {str(e)}")
+
+    def _score_batch(self, texts):
+        if self._analyzer is None:
+            from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+            self._analyzer = SentimentIntensityAnalyzer()
+        return np.array([[scores[name] for name in SCORE_COLUMNS] for scores in map(self._analyzer.polarity_scores, texts)])
+
+    def score(self, texts, hashes=None):
+        """Scores of every text, shape (n, 4); texts seen before are served from the cache"""
+        hashes = hashes if hashes is not None else [document_hash(text) for text in texts]
+        with self._lock:
+            missing = {}
+            for digest, text in zip(hashes, texts):
+                if digest not in self._scores:
+                    missing.setdefault(digest, text)
+            pending = list(missing.items())
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                for (digest, _), scores in zip(batch, self._score_batch([text for _, text in batch])):
+                    self._scores[digest] = scores
+            self.scored += len(pending)
+            self.cached += len(hashes) - len(pending)
+            if pending:
+                self._save()
+            return np.array([self._scores[digest] for digest in hashes]).reshape(-1, len(SCORE_COLUMNS))
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.{uuid.uuid4().hex}.tmp.npz"
+        try:
+            np.savez(
+                tmp_path,
+                hashes=np.array(list(self._scores), dtype="U40"),
+                scores=np.array(list(self._scores.values())).reshape(-1, len(SCORE_COLUMNS)),
+            )
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save sentiment score cache: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        return {"documents": len(self._scores), "scored": self.scored, "cached": self.cached}
+
+
+class SentimentBuckets:
+    """Mean headline scores and headline counts per fixed time bucket (one bar interval)"""
+
+    def __init__(self, starts, means, counts, bucket_ms):
+        self.starts = starts
+        self.means = means
+        self.counts = counts
+        self.bucket_ms = bucket_ms
+        self._index = {int(start): row for row, start in enumerate(starts)}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def at(self, timestamp):
+        """(mean scores, headline count) of the bucket holding `timestamp`, in O(1)"""
+        row = self._index.get(int(timestamp) - int(timestamp) % self.bucket_ms)
+        if row is None:
+            return NEUTRAL_SCORES, 0
+        return tuple(float(value) for value in self.means[row]), int(self.counts[row])
+
+    def lookup(self, timestamps):
+        """Vectorized `at` for many bars: (scores (n, 4), counts (n,))"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        keys = timestamps - timestamps % self.bucket_ms
+        rows = np.clip(np.searchsorted(self.starts, keys), 0, max(len(self.starts) - 1, 0))
+        found = (self.starts[rows] == keys) if len(self.starts) else np.zeros(len(keys), dtype=bool)
+        scores = np.tile(np.asarray(NEUTRAL_SCORES), (len(keys), 1))
+        counts = np.zeros(len(keys), dtype=np.int64)
+        scores[found] = self.means[rows[found]]
+        counts[found] = self.counts[rows[found]]
+        return scores, counts
+
+
+def bucket_scores(timestamps, scores, bucket_ms, hashes=None):
+    """Aggregate per-headline scores into buckets; with `hashes`, a headline counts once per bucket"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    keys = timestamps - timestamps % bucket_ms
+    if hashes is not None:
+        # The same story syndicated by several sources (or files) within one bucket
+        seen = set()
+        unique = np.array([(key, digest) not in seen and not seen.add((key, digest)) for key, digest in zip(keys.tolist(), hashes)], dtype=bool)
+        keys, scores = keys[unique], np.asarray(scores)[unique]
+    starts, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    sums = np.zeros((len(starts), len(SCORE_COLUMNS)))
+    np.add.at(sums, inverse, scores)
+    return SentimentBuckets(starts, sums / np.maximum(counts, 1)[:, np.newaxis], counts, bucket_ms)
+
+
+class NewsCorpus:
+    """Headlines per symbol, read from <news_dir>/<SYMBOL>.jsonl and/or <news_dir>/<SYMBOL>/*.jsonl.
+
+    Each line is a JSON object with a `headline` (or `title`/`text`) and a `timestamp`
+    (or `published`/`date`: epoch ms or a date). Scores are bucketed per bar interval once per
+    change of the symbol's files; reads after that are dictionary lookups.
+    """
+
+    def __init__(self, news_dir, scorer=None):
+        self.news_dir = news_dir
+        self.scorer = scorer or HeadlineScorer(os.path.join(news_dir, SCORE_CACHE_FILE))
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._buckets = {}  # (symbol, timeframe) -> (signature, SentimentBuckets)
+        self.rebuilds = 0
+
+    def files(self, symbol):
+        paths = [os.path.join(self.news_dir, f"{symbol}.jsonl")]
+        directory = os.path.join(self.news_dir, symbol)
+        if os.path.isdir(directory):
+            paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".jsonl"))
+        return [path for path in paths if os.path.isfile(path)]
+
+    def signature(self, symbol):
+        signature = []
+        for path in self.files(symbol):
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature.append((path, info.st_mtime_ns, info.st_size))
+        return tuple(signature)
+
+    def buckets(self, symbol, timeframe):
+        """SentimentBuckets for `symbol` at the bar interval of `timeframe`, rebuilt when its files change"""
+        key = (symbol, timeframe)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            signature = self.signature(symbol)
+            cached = self._buckets.get(key)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+            headlines = [headline for path in self.files(symbol) for headline in read_headlines(path)]
+            timestamps = np.array([timestamp for timestamp, _ in headlines], dtype=np.int64)
+            texts = [text for _, text in headlines]
+            hashes = [document_hash(text) for text in texts]
+            scores = self.scorer.score(texts, hashes)
+            buckets = bucket_scores(timestamps, scores, BAR_SECONDS[timeframe] * 1000, hashes)
+            self._buckets[key] = (signature, buckets)
+            self.rebuilds += 1
+            if headlines:
+                logger.info(f"✅ Scored {len(headlines)} {symbol} headlines into {len(buckets)} {timeframe} buckets")
+            return buckets
+
+    def stats(self):
+        with self._lock:
+            symbols = {f"{symbol}:{timeframe}": int(buckets.counts.sum()) for (symbol, timeframe), (_, buckets) in self._buckets.items()}
+        return dict(self.scorer.stats(), rebuilds=self.rebuilds, headlines=symbols)
+
+
+def model_inputs(buckets, timestamps, close, volume, returns):
+    """Model feature rows for the given bars: bucket sentiment plus the bar's close, volume and return"""
+    scores, counts = buckets.lookup(timestamps)
+    return pd.DataFrame({
+        "Compound": scores[:, 0],
+        "Positive": scores[:, 1],
+        "Negative": scores[:, 2],
+        "Neutral": scores[:, 3],
+        "Post_Count": counts,
+        "Close": close,
+        "Volume": volume,
+        "Returns": np.nan_to_num(returns),
+    }, columns=MODEL_FEATURES)
+
+
+def latest_inputs(buckets, timestamp, close, volume, returns):
+    """Model feature row for one bar, read in O(1) from the buckets"""
+    scores, count = buckets.at(timestamp)
+    return pd.DataFrame(
+        [[*scores, count, close, volume, 0.0 if np.isnan(returns) else returns]], columns=MODEL_FEATURES
+    )
@@ -12,12 +12,18 @@ const app = express();
 const PORT = process.env.PORT || 5000;
 const API_KEY = process.env.POLYGON_API_KEY; 
 const rest = restClient(API_KEY);
+const PREDICTION_SERVER_URL = process.env.PREDICTION_SERVER_URL || "http://localhost:5001";
 
 // Create data directory if it doesn't exist
 const DATA_DIR = path.join(process.cwd(), "data");
-if (!fs.existsSync(DATA_DIR)) {
-  fs.mkdirSync(DATA_DIR, { recursive: true });
-  console.log(`✅ Created data directory: ${DATA_DIR}`);
+// New bars are dropped here as small CSV batches; server.py appends them to its columnar store (data/bars)
+const INBOX_DIR = path.join(DATA_DIR, "inbox");
+const BARS_DIR = path.join(DATA_DIR, "bars");
+// Full per-symbol CSVs (older layout); still read when nothing newer is stored
+const CSV_DIR = path.join(DATA_DIR, "csv");
+if (!fs.existsSync(INBOX_DIR)) {
+  fs.mkdirSync(INBOX_DIR, { recursive: true });
+  console.log(`✅ Created data directory: ${INBOX_DIR}`);
 }
 
 // Enable CORS for frontend access
@@ -29,43 +35,133 @@ app.use(cors({
 }));
 
 
-const STOCK_SYMBOL = "AAPL";
+const DEFAULT_SYMBOL = "AAPL";
+const SYMBOL_PATTERN = /^[A-Z][A-Z0-9.\-]{0,14}$/;
 
-// Generate date range (Last 1 year)
-const today = new Date();
-const fromDate = new Date(today - 365 * 24 * 60 * 60 * 1000)
-  .toISOString()
-  .split("T")[0]; // 1 year ago
-const toDate = today.toISOString().split("T")[0]; // Today
+const DAY_MS = 24 * 60 * 60 * 1000;
 
-// Function to fetch stock data
-const fetchStockData = async () => {
+// Polygon aggregate size, bar length (ms) and history requested when nothing is stored yet, per timeframe
+const TIMEFRAMES = {
+  "1d": [1, "day", DAY_MS, 365 * DAY_MS],
+  "1h": [1, "hour", 60 * 60 * 1000, 365 * DAY_MS],
+  "1m": [1, "minute", 60 * 1000, 30 * DAY_MS],
+  "1s": [1, "second", 1000, DAY_MS],
+};
+
+// Validate ?symbol=&timeframe= (same rules as server.py); returns null when invalid
+const parseSymbolOptions = (query) => {
+  const symbol = String(query.symbol || DEFAULT_SYMBOL).trim().toUpperCase();
+  const timeframe = String(query.timeframe || "1d").trim().toLowerCase();
+  if (!SYMBOL_PATTERN.test(symbol) || !TIMEFRAMES[timeframe]) {
+    return null;
+  }
+  return { symbol, timeframe };
+};
+
+const csvPath = (symbol, timeframe) => path.join(CSV_DIR, `${symbol}_${timeframe}.csv`);
+const inboxPath = (symbol, timeframe) => path.join(INBOX_DIR, `${symbol}_${timeframe}`);
+const manifestPath = (symbol, timeframe) => path.join(BARS_DIR, symbol, timeframe, "manifest.json");
+
+// Pending inbox batches (named <first>-<last>.csv), oldest first
+const inboxBatches = (symbol, timeframe) => {
+  const dir = inboxPath(symbol, timeframe);
+  if (!fs.existsSync(dir)) {
+    return [];
+  }
+  return fs.readdirSync(dir)
+    .filter((name) => /^\d+-\d+\.csv$/.test(name))
+    .map((name) => {
+      const [first, last] = name.slice(0, -4).split("-").map(Number);
+      return { file: path.join(dir, name), first, last };
+    })
+    .sort((a, b) => a.first - b.first);
+};
+
+// What is stored for a symbol: bar count, last bar timestamp and bytes on disk (store + pending batches)
+const storedBars = (symbol, timeframe) => {
+  let rows = 0;
+  let lastTimestamp = null;
+  let sizeBytes = 0;
+  const manifestFile = manifestPath(symbol, timeframe);
+  if (fs.existsSync(manifestFile)) {
+    const manifest = JSON.parse(fs.readFileSync(manifestFile, "utf8"));
+    for (const segment of manifest.segments) {
+      rows += segment.rows;
+      const segmentDir = path.join(path.dirname(manifestFile), segment.name);
+      for (const name of fs.existsSync(segmentDir) ? fs.readdirSync(segmentDir) : []) {
+        sizeBytes += fs.statSync(path.join(segmentDir, name)).size;
+      }
+    }
+    if (manifest.segments.length) {
+      lastTimestamp = manifest.segments[manifest.segments.length - 1].last_timestamp;
+    }
+  } else if (fs.existsSync(csvPath(symbol, timeframe))) {
+    // Full CSV that server.py has not imported yet
+    const lines = fs.readFileSync(csvPath(symbol, timeframe), "utf8").trim().split("\n");
+    rows = lines.length - 1;
+    lastTimestamp = rows > 0 ? Number(lines[lines.length - 1].split(",")[0]) : null;
+    sizeBytes = fs.statSync(csvPath(symbol, timeframe)).size;
+  }
+  for (const batch of inboxBatches(symbol, timeframe)) {
+    if (lastTimestamp === null || batch.last > lastTimestamp) {
+      // Batches only hold bars newer than what was stored when they were written
+      rows += fs.readFileSync(batch.file, "utf8").trim().split("\n").length - 1;
+      lastTimestamp = batch.last;
+    }
+    sizeBytes += fs.statSync(batch.file).size;
+  }
+  return { rows, lastTimestamp, sizeBytes, exists: fs.existsSync(manifestFile) || rows > 0 };
+};
+
+// Tell the Python prediction server to pick up the new bars
+const notifyPredictionServer = async (symbol, timeframe) => {
   try {
-    console.log(`🔍 Fetching stock data for ${STOCK_SYMBOL} from ${fromDate} to ${toDate}...`);
-    
+    const query = new URLSearchParams({ symbol, timeframe });
+    await fetch(`${PREDICTION_SERVER_URL}/api/refresh-data?${query}`, { method: "POST" });
+  } catch (error) {
+    // The prediction server also checks the inbox on its next load, so this is best effort only
+    console.warn("⚠️ Could not notify prediction server:", error.message);
+  }
+};
+
+// Fetch only the bars newer than the last stored one and drop them into the inbox.
+// Returns the number of new bars, or -1 on failure.
+const fetchStockData = async (symbol = DEFAULT_SYMBOL, timeframe = "1d") => {
+  try {
+    const [multiplier, timespan, barMs, initialHistoryMs] = TIMEFRAMES[timeframe];
+    const now = Date.now();
+    const { lastTimestamp } = storedBars(symbol, timeframe);
+    const from = lastTimestamp === null ? now - initialHistoryMs : lastTimestamp + 1;
+    console.log(`🔍 Fetching ${timeframe} stock data for ${symbol} since ${new Date(from).toISOString()}...`);
+
+    // Polygon accepts millisecond timestamps for the range. Intraday ranges can exceed one response;
+    // the next fetch simply continues from the last bar saved here.
     const response = await rest.stocks.aggregates(
-      STOCK_SYMBOL,
-      1,
-      "day",
-      fromDate,
-      toDate,
-      { adjusted: true }
+      symbol,
+      multiplier,
+      timespan,
+      String(from),
+      String(now),
+      { adjusted: true, sort: "asc", limit: 50000 }
     );
 
-    if (!response || !response.results) {
+    if (!response) {
       throw new Error("No data found.");
     }
 
-    const stockData = response.results;
-    console.log(`✅ Received ${stockData.length} data points from Polygon API`);
-    
-    // Ensure data directory exists
-    if (!fs.existsSync(DATA_DIR)) {
-      fs.mkdirSync(DATA_DIR, { recursive: true });
+    // Skip bars already stored and the bar still in progress (the store is append-only)
+    const stockData = (response.results || []).filter(
+      (data) => (lastTimestamp === null || data.t > lastTimestamp) && data.t + barMs <= now
+    );
+    console.log(`✅ Received ${stockData.length} new data points from Polygon API`);
+    if (!stockData.length) {
+      return 0;
     }
-    
-    const filePath = path.join(DATA_DIR, "stock_data.csv");
-    console.log(`📝 Saving data to ${filePath}`);
+
+    const dir = inboxPath(symbol, timeframe);
+    fs.mkdirSync(dir, { recursive: true });
+    const filePath = path.join(dir, `${stockData[0].t}-${stockData[stockData.length - 1].t}.csv`);
+    console.log(`📝 Saving new bars to ${filePath}`);
 
     // Creating CSV content with header
     const csvHeader = "timestamp,open,high,low,close,volume\n";
@@ -73,14 +169,16 @@ const fetchStockData = async () => {
       .map((data) => `${data.t},${data.o},${data.h},${data.l},${data.c},${data.v}`)
       .join("\n");
 
-    // Writing the full file at once (not append)
-    fs.writeFileSync(filePath, csvHeader + csvRows);
-    
-    console.log(`✅ Stock data saved successfully to ${filePath}!`);
-    return true;
+    // Rename into place so server.py never reads a partial batch
+    fs.writeFileSync(`${filePath}.tmp`, csvHeader + csvRows);
+    fs.renameSync(`${filePath}.tmp`, filePath);
+
+    console.log(`✅ ${stockData.length} new bars saved to ${filePath}!`);
+    await notifyPredictionServer(symbol, timeframe);
+    return stockData.length;
   } catch (error) {
     console.error("❌ Error fetching stock data:", error.message);
-    return false;
+    return -1;
   }
 };
 
@@ -91,17 +189,27 @@ app.get("/", (req, res) => {
     <p>Server is running! Try these endpoints:</p>
     <ul>
       <li><a href='/api/check-file'>/api/check-file</a> - Check if stock data file exists</li>
-      <li><a href='/api/fetch-data'>/api/fetch-data</a> - Fetch and save fresh stock data</li>
+      <li><a href='/api/fetch-data'>/api/fetch-data</a> - Fetch and save bars newer than the stored data</li>
     </ul>
+    <p>Both accept <code>?symbol=MSFT&amp;timeframe=1d</code> (defaults: ${DEFAULT_SYMBOL}, 1d; timeframes: ${Object.keys(TIMEFRAMES).join(", ")}).</p>
   `);
 });
 
 // API to fetch fresh data
 app.get("/api/fetch-data", async (req, res) => {
+  const options = parseSymbolOptions(req.query);
+  if (!options) {
+    return res.status(400).json({ message: "❌ Invalid symbol or timeframe" });
+  }
   try {
-    const success = await fetchStockData();
-    if (success) {
-      res.json({ message: "✅ Stock data fetched and saved successfully" });
+    const added = await fetchStockData(options.symbol, options.timeframe);
+    if (added >= 0) {
+      res.json({
+        message: `✅ Stock data for ${options.symbol} is up to date (${added} new bars)`,
+        symbol: options.symbol,
+        timeframe: options.timeframe,
+        new_bars: added
+      });
     } else {
       res.status(500).json({ message: "❌ Failed to fetch stock data" });
     }
@@ -113,34 +221,32 @@ app.get("/api/fetch-data", async (req, res) => {
 
 // API to check if the file is saved
 app.get("/api/check-file", (req, res) => {
-  const filePath = path.join(DATA_DIR, "stock_data.csv");
-
-  if (fs.existsSync(filePath)) {
-    try {
-      // Get file size
-      const stats = fs.statSync(filePath);
-      const fileSizeInKB = stats.size / 1024;
-      
-      // Get line count (rows)
-      const fileContent = fs.readFileSync(filePath, 'utf8');
-      const rows = fileContent.split('\n').length - 1; // -1 for header
-      
-      res.json({ 
-        message: `✅ Stock data file found (${fileSizeInKB.toFixed(2)} KB, ${rows} rows)`,
-        exists: true,
-        size_kb: fileSizeInKB.toFixed(2),
-        rows: rows
-      });
-    } catch (error) {
-      res.json({ 
-        message: `⚠️ Stock data file found but couldn't read details: ${error.message}`,
-        exists: true 
+  const options = parseSymbolOptions(req.query);
+  if (!options) {
+    return res.status(400).json({ message: "❌ Invalid symbol or timeframe", exists: false });
+  }
+  try {
+    const stored = storedBars(options.symbol, options.timeframe);
+    if (!stored.exists) {
+      return res.json({
+        message: `❌ Stock data file not found for ${options.symbol}!`,
+        exists: false
       });
     }
-  } else {
+    const sizeInKB = stored.sizeBytes / 1024;
+    res.json({
+      message: `✅ Stock data found for ${options.symbol} (${sizeInKB.toFixed(2)} KB, ${stored.rows} rows)`,
+      exists: true,
+      symbol: options.symbol,
+      timeframe: options.timeframe,
+      size_kb: sizeInKB.toFixed(2),
+      rows: stored.rows,
+      last_timestamp: stored.lastTimestamp
+    });
+  } catch (error) {
     res.json({
-      message: "❌ Stock data file not found!",
-      exists: false
+      message: `⚠️ Stock data found but couldn't read details: ${error.message}`,
+      exists: true
     });
   }
 });
@@ -1,143 +1,221 @@
 import os
-# Set matplotlib backend to non-interactive mode before importing pyplot
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend to avoid threading issues
-import matplotlib.pyplot as plt
-from flask import Flask, jsonify, send_from_directory, request
+import json
+import time
+import logging
+import uuid
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, Blueprint, jsonify, send_from_directory, request, Response, stream_with_context, make_response
 import pandas as pd
 import joblib
 import numpy as np
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler
 from flask_cors import CORS, cross_origin
-import traceback
-from keras.models import load_model
-
-app = Flask(__name__, static_folder="public")  # ✅ Set static folder
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)  # ✅ Fix CORS issue
+from model_registry import ModelRegistry
+from result_cache import ResultCache
+from instrumentation import metrics, stage, configure_logging, instrument_app
+from market_data import (
+    MarketDataStore, parse_symbol_options, parse_window_options, default_window, window_key, partition_key,
+    periods_per_year, normalize_symbol, normalize_timeframe, TIMEFRAMES, DEFAULT_TIMEFRAME,
+)
+from indicators import IndicatorEngine, compute_reference_indicators
+from features import FeatureStore, register_market_features
+from sentiment import NewsCorpus, latest_inputs, model_inputs
+import backtest
+import sweep
+import replay
+import walk_forward
+import transformer_backends
+from backtest import calculate_risk_metrics
+from signal_feed import SignalHub, format_sse
+from triggers import TriggerEngine, thresholds_from_percent
+from risk_stream import RiskMonitor, StrategyFeed, ROLLING_WINDOWS, STRATEGIES as RISK_STRATEGIES
+from transformer_inference import TransformerForecaster, MicroBatcher, InferenceQueueFull, LOOK_BACK
+from charts import (
+    ChartRenderer, CHART_DIR_NAME, parse_chart_options,
+    plot_moving_average, plot_sentiment, plot_macd, plot_transformer,
+)
+
+# ✅ Routes live on a blueprint; create_app() builds the Flask app (dev server, wsgi.py / gunicorn)
+api = Blueprint("api", __name__)
+logger = logging.getLogger(__name__)
 
 # ✅ Define global directory for storing generated assets
 GLOBAL_ASSETS_DIR = os.path.join(os.path.dirname(__file__), "public")
 os.makedirs(GLOBAL_ASSETS_DIR, exist_ok=True)  # Ensure directory exists
 
+# ✅ Charts are rendered off the request path into content-addressed files (bounded LRU on disk)
+chart_renderer = ChartRenderer(
+    GLOBAL_ASSETS_DIR,
+    max_workers=int(os.environ.get("CHART_WORKERS", 2)),
+    max_files=int(os.environ.get("CHART_CACHE_FILES", 200)),
+    hold_seconds=int(os.environ.get("CHART_HOLD_SECONDS", 600)),
+)
+CHART_WAIT_SECONDS = 60
+CHART_MAX_AGE = 365 * 24 * 60 * 60  # Chart filenames change with their content
+
 # Ensure data directory exists
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# ✅ Per-symbol bar partitions (memory-mapped columns under data/bars/<SYMBOL>/<timeframe>)
+DEFAULT_SYMBOL = "AAPL"
+market_data = MarketDataStore(DATA_DIR, legacy_csv=os.path.join(DATA_DIR, "stock_data.csv"), legacy_symbol=DEFAULT_SYMBOL)
+
+# ✅ Running SMA/EMA/MACD state per symbol/timeframe, updated only with newly appended bars
+indicator_engine = IndicatorEngine(verify=os.environ.get("VERIFY_INDICATORS") == "1")
+
+# ✅ Derived series (returns, ranges, indicators) computed once per data version and shared by every model
+feature_store = register_market_features(
+    FeatureStore(max_series=int(os.environ.get("FEATURE_CACHE_SERIES", 256))), indicator_engine
+)
+
+# ✅ Transformer forecasts cached per data version, extended only for new windows
+transformer_forecaster = TransformerForecaster(look_back=LOOK_BACK)
+
 # Ensure models directory exists
 MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
 os.makedirs(MODELS_DIR, exist_ok=True)
 
-# Load moving average crossover model with better error handling
+# Moving average crossover model
 model_path = os.path.join(MODELS_DIR, "1_model_meanAveragCrossover.pkl")
 scaler_path = os.path.join(MODELS_DIR, "1_scaler.pkl")
 
-# Load eent model
+# Sentiment model, fed with headline sentiment from data/news/<SYMBOL>.jsonl (or <SYMBOL>/*.jsonl)
 sentiment_model_path = os.path.join(MODELS_DIR, "sentiment_model.pkl")
+news_corpus = NewsCorpus(os.environ.get("NEWS_DIR", os.path.join(DATA_DIR, "news")))
 
-#Load MACD model
+# MACD model
 macd_model_path = os.path.join(MODELS_DIR, "macd.pkl")
 
-# Load Transformer model and scaler
+# Transformer model and scaler
 transformer_model_path = os.path.join(MODELS_DIR, "Transformer_model.h5")
 transformer_scaler_path = os.path.join(MODELS_DIR, "Transformer_scaler.pkl")
 
-try:
-    model = joblib.load(model_path)
-    print(f"✅ Moving average model successfully loaded from: {model_path}")
-except FileNotFoundError:
-    print(f"⚠️ Warning: Moving average model file not found at: {model_path}")
-    model = None
-except Exception as e:
-    print(f"⚠️ Warning: Error loading moving average model: {str(e)}")
-    model = None
-
-try:
-    sentiment_model = joblib.load(sentiment_model_path)
-    print(f"✅ Sentiment model successfully loaded from: {sentiment_model_path}")
-except FileNotFoundError:
-    print(f"⚠️ Warning: Sentiment model file not found at: {sentiment_model_path}")
-    sentiment_model = None
-except Exception as e:
-    print(f"⚠️ Warning: Error loading sentiment model: {str(e)}")
-    sentiment_model = None
-
-try:
-    macd_model = joblib.load(macd_model_path)
-    print(f"✅ MACD model successfully loaded from: {macd_model_path}")
-except FileNotFoundError:
-    print(f"⚠️ Warning: MACD model file not found at: {macd_model_path}")
-    macd_model = None
-except Exception as e:
-    print(f"⚠️ Warning: Error loading MACD model: {str(e)}")
-    macd_model = None
-
-try:
-    transformer_model = load_model(transformer_model_path)
-    transformer_scaler = joblib.load(transformer_scaler_path)
-    print(f"✅ Transformer model and scaler successfully loaded")
-except FileNotFoundError:
-    print(f"⚠️ Warning: Transformer model or scaler file not found")
-    transformer_model = None
-    transformer_scaler = None
-except Exception as e:
-    print(f"⚠️ Warning: Error loading Transformer model: {str(e)}")
-    transformer_model = None
-    transformer_scaler = None
+# ✅ Transformer runtime: keras, or an ONNX/TFLite conversion made next to the .h5 on first load
+TRANSFORMER_BACKEND = os.environ.get("TRANSFORMER_BACKEND", "keras")
+TRANSFORMER_THREADS = int(os.environ.get("TRANSFORMER_THREADS", 0)) or None
+
+
+def load_transformer_model():
+    # Keras/TensorFlow is only imported when the Keras backend (or a conversion) needs it
+    return transformer_backends.load_backend(TRANSFORMER_BACKEND, transformer_model_path, TRANSFORMER_THREADS)
+
+
+def warm_transformer(transformer_model):
+    # The first predict call traces the graph; pay that during warmup rather than on a request
+    transformer_model.predict(np.zeros((1, LOOK_BACK, 1), dtype=np.float32))
+
+
+# ✅ Models load lazily on first use, or at startup when listed in MODEL_WARMUP (comma separated or "all")
+models = ModelRegistry()
+models.register("moving_average", lambda: joblib.load(model_path))
+models.register("moving_average_scaler", lambda: joblib.load(scaler_path))
+models.register("sentiment", lambda: joblib.load(sentiment_model_path))
+models.register("macd", lambda: joblib.load(macd_model_path))
+models.register("transformer", load_transformer_model, warm=warm_transformer)
+models.register("transformer_scaler", lambda: joblib.load(transformer_scaler_path))
+MODEL_WARMUP = [name.strip() for name in os.environ.get("MODEL_WARMUP", "").split(",") if name.strip()]
+
+# ✅ Concurrent Transformer requests are merged into one batched predict call
+transformer_batcher = MicroBatcher(
+    lambda X: models.get("transformer").predict(X),
+    max_latency=float(os.environ.get("TRANSFORMER_BATCH_LATENCY_MS", 5)) / 1000,
+    max_batch=int(os.environ.get("TRANSFORMER_MAX_BATCH", 512)),
+    max_queue=int(os.environ.get("TRANSFORMER_MAX_QUEUE", 8192)),
+)
+
+# ✅ Worker pool for /api/predict-batch (symbol loads and per-model evaluations)
+BATCH_MODELS = ("moving_average", "sentiment", "macd", "transformer")
+SWEEP_WORKERS = int(os.environ.get("SWEEP_WORKERS", os.cpu_count() or 1))
+WALK_FORWARD_FOLDS = int(os.environ.get("WALK_FORWARD_FOLDS", walk_forward.DEFAULT_FOLDS))
+MAX_BATCH_SYMBOLS = int(os.environ.get("MAX_BATCH_SYMBOLS", 500))
+batch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("BATCH_WORKERS", 4)), thread_name_prefix="predict-batch")
+
+
+def submit_in_context(fn, *args):
+    # Pool tasks run with the caller's context, so their stage timings count toward its endpoint
+    return batch_pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+# Display messages of the single-model endpoints, keyed by (model, normalized signal)
+SIGNAL_MESSAGES = {
+    ("moving_average", "BUY"): "📈 Uptrend (Buy)",
+    ("moving_average", "SELL"): "📉 Downtrend (Sell)",
+    ("sentiment", "BUY"): "📈 Positive Sentiment (Buy)",
+    ("sentiment", "SELL"): "📉 Negative Sentiment (Sell)",
+    ("macd", "BUY"): "📈 MACD Uptrend (Buy)",
+    ("macd", "SELL"): "📉 MACD Downtrend (Sell)",
+    ("macd", "HOLD"): "↔️ MACD Neutral (Hold)",
+    ("transformer", "BUY"): "📈 Transformer Uptrend (Buy)",
+    ("transformer", "SELL"): "📉 Transformer Downtrend (Sell)",
+    ("transformer", "HOLD"): "↔️ Transformer Neutral (Hold)",
+}
+
+# Columns of the MACD test signals frame and the indicator series they are filled from
+MACD_COLUMNS = {
+    'ema12': 'ema12',
+    'ema26': 'ema26',
+    'macd': 'macd',
+    'signal_line': 'signal_line',
+    'histogram': 'histogram',
+    'Signal': 'signal',
+    'Position': 'position',
+    'Return': 'return',
+    'Strategy_Return': 'strategy_return',
+    'Cumulative_Return': 'cumulative_return',
+    'Buy_and_Hold': 'buy_and_hold',
+}
 
 # Helper functions for MACD model
-def check_data_leakage(df):
-    # Simple check for chronological ordering
-    if 'date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['date']):
-        is_sorted = df['date'].is_monotonic_increasing
+def check_data_leakage(df, folds=None):
+    # Bars must be in chronological order, and every fold must train only on bars before its test window
+    if 'timestamp' in df.columns:
+        problems = walk_forward.check_folds(folds or [], df['timestamp'].to_numpy())
     else:
-        is_sorted = True  # Assume sorted if no date column
-        
-    return "Data leakage check passed" if is_sorted else "Warning: Data not in chronological order"
+        problems = walk_forward.check_folds(folds or [])
+        if 'date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['date']) and not df['date'].is_monotonic_increasing:
+            problems.insert(0, "bars are not in chronological order")
+
+    return "Data leakage check passed" if not problems else f"Warning: {'; '.join(problems)}"
+
+def time_series_split(df, indicators=None, n_splits=WALK_FORWARD_FOLDS, bars_per_year=252):
+    # Shallow clone: new columns must not leak into the shared market data frame
+    df = df.copy(deep=False)
 
-def time_series_split(df):
-    # Clone the dataframe to avoid modifications to original
-    df = df.copy()
-    
     # Ensure date column is datetime and set as index
     if 'date' in df.columns:
         df['date'] = pd.to_datetime(df['date'])
         df.set_index('date', inplace=True)
-    
-    # Calculate MACD indicators
-    df['ema12'] = df['close'].ewm(span=12, adjust=False).mean()
-    df['ema26'] = df['close'].ewm(span=26, adjust=False).mean()
-    df['macd'] = df['ema12'] - df['ema26']
-    df['signal_line'] = df['macd'].ewm(span=9, adjust=False).mean()
-    df['histogram'] = df['macd'] - df['signal_line']
-    
-    # Generate trading signals (1 for buy, -1 for sell, 0 for hold)
-    df['Signal'] = 0
-    # Buy signal: MACD crosses above signal line
-    df.loc[(df['macd'] > df['signal_line']) & (df['macd'].shift(1) <= df['signal_line'].shift(1)), 'Signal'] = 1
-    # Sell signal: MACD crosses below signal line
-    df.loc[(df['macd'] < df['signal_line']) & (df['macd'].shift(1) >= df['signal_line'].shift(1)), 'Signal'] = -1
-    
-    # For calculation purposes, forward fill the signals (maintain position until new signal)
-    df['Position'] = df['Signal'].replace(0, np.nan).fillna(method='ffill').fillna(0)
-    
-    # Calculate returns
-    df['Return'] = df['close'].pct_change()
-    df['Strategy_Return'] = df['Position'].shift(1) * df['Return']
-    
-    # Calculate cumulative returns
-    df['Cumulative_Return'] = (1 + df['Strategy_Return']).cumprod()
-    df['Buy_and_Hold'] = (1 + df['Return']).cumprod()
-    
+
+    # MACD indicators, crossover signals (1 buy, -1 sell, 0 hold), forward-filled positions
+    # and cumulative returns, either from the indicator engine or computed here in one pass
+    if indicators is None:
+        indicators = compute_reference_indicators(df['close'].to_numpy())
+    for column, name in MACD_COLUMNS.items():
+        df[column] = indicators[name]
+    df['Signal'] = df['Signal'].astype(int)
+
     # Renaming 'close' to 'Close' for consistency
     df.rename(columns={'close': 'Close'}, inplace=True)
-    
-    # Creating a dummy model and scaler for compatibility
-    model = {}
-    scaler = StandardScaler()
     features = ['macd', 'signal_line', 'histogram']
-    
-    # Returning the test signals dataframe and model components
-    return df, model, scaler, features
+
+    # Walk-forward folds: out-of-sample metrics of each test window, sliced from the series above
+    folds = []
+    try:
+        fold_ranges = walk_forward.walk_forward_folds(len(df), n_splits)
+    except ValueError:
+        fold_ranges = []  # Too few bars to split
+    if fold_ranges:
+        timestamps = df['timestamp'].to_numpy() if 'timestamp' in df.columns else None
+        folds = walk_forward.fold_metrics(
+            df['Return'].to_numpy(), df['Strategy_Return'].to_numpy(), fold_ranges, bars_per_year, timestamps, train=False
+        )
+
+    # Returning the test signals dataframe, the per-fold metrics and the model features
+    return df, folds, features
 
 def verify_return_calculation(test_signals):
     """Verify the return calculation methodology"""
@@ -153,149 +231,209 @@ def verify_return_calculation(test_signals):
     else:
         return "Return columns not found in test signals"
 
-def calculate_risk_metrics(test_signals):
-    """Calculate risk and performance metrics"""
-    metrics = {}
+@stage("predict")
+def moving_average_prediction(model, scaler, features):
+    """1 (uptrend) or 0 (downtrend) from the latest SMA 50/200 pair"""
+    latest_data = np.array([[features["sma_50"][-1], features["sma_200"][-1]]])
+    latest_data_scaled = scaler.transform(latest_data)
+    return int(model.predict(latest_data_scaled)[0])
+
+@stage("predict")
+def sentiment_prediction(model, features, symbol, timeframe):
+    """1 (positive) or 0 (negative) from the headline sentiment of the latest bar, plus the inputs behind it"""
+    # Mean headline scores of the latest bar's time bucket (pre-aggregated, O(1)) and the bar itself
+    buckets = news_corpus.buckets(symbol, timeframe)
+    inputs = latest_inputs(
+        buckets, features["timestamp"][-1], features["close"][-1], features["volume"][-1], features["returns"][-1]
+    )
+
+    # Predict sentiment (binary output: 1 for positive, 0 for negative)
+    probabilities = model.predict_proba(inputs)[0]
+    prediction = int(model.classes_[np.argmax(probabilities)])
+    details = {
+        "probability": float(probabilities[list(model.classes_).index(1)]),
+        "compound": float(inputs["Compound"].iloc[0]),
+        "headlines": int(inputs["Post_Count"].iloc[0]),
+    }
+    return prediction, details
+
+
+def sentiment_chart_data(features, bars=30):
+    """Closes and bar-over-bar changes of the last `bars` bars, as plotted by plot_sentiment"""
+    index = features.frame.index[-bars:]
+    return pd.DataFrame(
+        {"close": features["close"][-bars:], "price_change": features["returns"][-bars:]}, index=index
+    )
+
+@stage("predict")
+def macd_analysis(df, indicators, bars_per_year=252):
+    """Run the MACD validation pipeline; returns (test_signals, risk_metrics, signal_text)"""
+    # Check for data leakage
+    try:
+        leakage_check = check_data_leakage(df, walk_forward.walk_forward_folds(len(df), WALK_FORWARD_FOLDS))
+    except ValueError:
+        leakage_check = check_data_leakage(df)
+    logger.info(leakage_check)
     
-    if test_signals.empty:
-        return {"error": "No data available for risk calculation"}
+    # Run walk-forward validation on the incrementally maintained MACD series
+    logger.info("Running time series validation...")
+    test_signals, folds, features = time_series_split(df, indicators, WALK_FORWARD_FOLDS, bars_per_year)
     
-    # Assuming we have strategy returns and benchmark returns
-    if 'Strategy_Return' in test_signals.columns and 'Return' in test_signals.columns:
-        # Total return
-        metrics['total_return'] = float(test_signals['Cumulative_Return'].iloc[-1] - 1)
-        metrics['buy_hold_return'] = float(test_signals['Buy_and_Hold'].iloc[-1] - 1)
-        
-        # Annualized return (assuming daily data)
-        n_days = len(test_signals)
-        metrics['annualized_return'] = float(((1 + metrics['total_return']) ** (252 / n_days)) - 1)
-        
-        # Sharpe ratio (assuming risk-free rate of 0)
-        sharpe_ratio = (test_signals['Strategy_Return'].mean() / test_signals['Strategy_Return'].std() 
-                        * np.sqrt(252) if test_signals['Strategy_Return'].std() > 0 else 0)
-        metrics['sharpe_ratio'] = float(sharpe_ratio)
-        
-        # Maximum drawdown
-        cum_returns = test_signals['Cumulative_Return']
-        running_max = cum_returns.cummax()
-        drawdown = (cum_returns / running_max) - 1
-        metrics['max_drawdown'] = float(drawdown.min())
-        
-        # Win rate (percentage of winning trades)
-        winning_days = (test_signals['Strategy_Return'] > 0).sum()
-        total_days = (test_signals['Strategy_Return'] != 0).sum()
-        metrics['win_rate'] = float(winning_days / total_days if total_days > 0 else 0)
-        
-    return metrics
+    # Verify return calculation
+    return_check = verify_return_calculation(test_signals)
+    logger.info(return_check)
+    
+    # Calculate risk metrics
+    risk_metrics = calculate_risk_metrics(test_signals, bars_per_year)
+    risk_metrics['walk_forward'] = [dict(fold['test'], fold=fold['fold']) for fold in folds]
+    
+    # Get latest signal and convert it to text
+    latest_signal = test_signals['Signal'].iloc[-1]
+    signal_text = "HOLD" if latest_signal == 0 else "BUY" if latest_signal == 1 else "SELL"
+    return test_signals, risk_metrics, signal_text
+
+# ✅ Identical prediction requests on unchanged data are answered from memory (LRU + TTL, one computation per key)
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("RESULT_CACHE_TTL", 300)),
+)
+# Request args that are part of the key in normalized form, or that must not split it
+RESULT_CACHE_IGNORED_ARGS = ("symbol", "timeframe", "start", "end", "bars", "profile", "cache")
+
+
+def memoized_prediction(model_names, fingerprint=None):
+    """Serve a prediction endpoint from result_cache, keyed by (endpoint, symbol, params, data fingerprint).
+
+    The fingerprint is the market data version plus the generation of each model used (and
+    `fingerprint(symbol, timeframe)` if given), so new bars or a model reload change the key.
+    Only 200 responses are cached; ?cache=0 (or profiling) bypasses the cache.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper():
+            if request.args.get("cache") == "0" or request.args.get("profile") not in (None, "0"):
+                return view()
+            try:
+                symbol, timeframe = parse_symbol_options(request.args, DEFAULT_SYMBOL)
+                window = parse_window_options(request.args, timeframe)
+                if not market_data.exists(symbol, timeframe):
+                    return view()
+                data_version = market_data.load(symbol, timeframe, window)[1]
+            except Exception:
+                # Bad options or unreadable data: the endpoint reports those itself
+                return view()
+            # Load the models first: keyed by the generation before a lazy load, the first result would never be found again
+            for name in model_names:
+                models.get(name)
+            params = tuple(sorted(
+                (name, value) for name, value in request.args.items(multi=True) if name not in RESULT_CACHE_IGNORED_ARGS
+            ))
+            key = (
+                request.path, symbol, timeframe, window, params, request.host_url,
+                data_version, tuple(models.generation(name) for name in model_names),
+                fingerprint(symbol, timeframe) if fingerprint else None,
+            )
+
+            def compute():
+                response = make_response(view())
+                return response.get_data(), response.status_code, response.mimetype
+
+            (body, status, mimetype), outcome = result_cache.get_or_compute(
+                key, compute, cacheable=lambda result: result[1] == 200
+            )
+            response = Response(body, status=status, mimetype=mimetype)
+            response.headers["X-Cache"] = outcome.upper()
+            return response
+        return wrapper
+    return decorator
+
 
-@app.route("/")
+@api.route("/")
 def home():
     return "🚀 Welcome to Stock Prediction API! Go to /api/predict for moving average predictions, /api/predict-sentiment for sentiment predictions, or /api/predict-macd for MACD predictions."
 
 
-@app.route("/api/predict", methods=["GET"])
+@api.route("/api/predict", methods=["GET"])
 @cross_origin()  # Apply CORS only to this route
+@memoized_prediction(("moving_average", "moving_average_scaler"))
 def predict():
     try:
-        # Check if model is loaded
+        # Check if model is loaded (loads it on first use)
+        model = models.get("moving_average")
         if model is None:
             return jsonify({"message": "❌ Moving average model not loaded. Check server logs."}), 500
 
-        data_path = os.path.join(DATA_DIR, "stock_data.csv")
+        # Optional per-request chart resolution/format
+        try:
+            chart_dpi, chart_format = parse_chart_options(request.args)
+        except ValueError as e:
+            return jsonify({"message": f"❌ Invalid chart options: {str(e)}"}), 400
+
+        # Which symbol/timeframe partition to predict on
+        try:
+            symbol, timeframe = parse_symbol_options(request.args, DEFAULT_SYMBOL)
+            window = parse_window_options(request.args, timeframe)
+        except ValueError as e:
+            return jsonify({"message": f"❌ {str(e)}"}), 400
+        series_key = window_key(symbol, timeframe, window)
 
         # Load stock data
         try:
-            if not os.path.exists(data_path):
-                return jsonify({"message": "❌ Stock data file not found! Please fetch data first."}), 404
+            if not market_data.exists(symbol, timeframe):
+                return jsonify({"message": f"❌ No {timeframe} stock data for {symbol}! Please fetch data first."}), 404
                 
-            stock_data = pd.read_csv(data_path)
-            print(f"✅ Successfully loaded stock data with {len(stock_data)} rows")
+            with stage("load_data"):
+                stock_data, data_version = market_data.load(symbol, timeframe, window)
+            logger.info(f"✅ Successfully loaded stock data with {len(stock_data)} rows ({symbol} {timeframe})")
         except Exception as e:
-            print(f"❌ Error reading CSV: {str(e)}")
+            logger.error(f"❌ Error reading CSV: {str(e)}")
             return jsonify({"message": f"❌ Error reading stock data: {str(e)}"}), 400
 
         # Ensuring required columns exist
         required_cols = ["open", "high", "low", "close", "volume"]
         missing_cols = [col for col in required_cols if col not in stock_data.columns]
         if missing_cols:
-            print(f"❌ Missing columns: {missing_cols}")
+            logger.error(f"❌ Missing columns: {missing_cols}")
             return jsonify({"message": f"❌ Missing columns: {', '.join(missing_cols)}"}), 400
 
-        # Compute moving averages
-        stock_data["SMA_50"] = stock_data["close"].rolling(window=50).mean()
-        stock_data["SMA_200"] = stock_data["close"].rolling(window=200).mean()
-        stock_data = stock_data.dropna()
+        # Moving averages come from the incremental indicator engine, through the shared feature store
+        features = feature_store.view(series_key, data_version, stock_data)
+        with stage("indicators"):
+            indicators = features["indicators"]
+        valid_rows = int(np.count_nonzero(~np.isnan(indicators["sma_200"])))
 
-        if stock_data.empty:
+        if valid_rows == 0:
             return jsonify({"message": "⚠️ Not enough stock data to make a prediction"}), 400
 
+        # Only the rows with both averages defined that the chart shows (last 90 days) are needed below
+        keep_rows = min(valid_rows, 90)
+        stock_data = stock_data.iloc[-keep_rows:].copy()
+        stock_data["SMA_50"] = indicators["sma_50"][-keep_rows:]
+        stock_data["SMA_200"] = indicators["sma_200"][-keep_rows:]
+
         # Load scaler and preprocess data
         try:
-            scaler = joblib.load(scaler_path)
-            latest_data = stock_data[['SMA_50', 'SMA_200']].iloc[-1].values.reshape(1, -1)
-            latest_data_scaled = scaler.transform(latest_data)
+            scaler = models.get("moving_average_scaler")
+            if scaler is None:
+                return jsonify({"message": "❌ Moving average scaler not loaded. Check server logs."}), 500
+            # Make prediction
+            prediction = moving_average_prediction(model, scaler, features)
         except Exception as e:
-            print(f"❌ Error preprocessing data: {str(e)}")
+            logger.error(f"❌ Error preprocessing data: {str(e)}")
             return jsonify({"message": f"❌ Error preprocessing data: {str(e)}"}), 500
-
-        # Make prediction
-        prediction = model.predict(latest_data_scaled)
         
         # Simple signal
-        signal = "📈 Uptrend (Buy)" if prediction[0] == 1 else "📉 Downtrend (Sell)"
-        
-        # Get latest price for display but not including in the main signal
-        latest_price = stock_data['close'].iloc[-1]
+        signal = "📈 Uptrend (Buy)" if prediction == 1 else "📉 Downtrend (Sell)"
         
-        # Calculate price change from previous day if available
-        price_change = 0
-        percent_change = 0
-        if len(stock_data) > 1:
-            price_change = stock_data['close'].iloc[-1] - stock_data['close'].iloc[-2]
-            percent_change = (price_change / stock_data['close'].iloc[-2]) * 100
+        # Latest price and change from the previous bar, for display but not included in the main signal
+        latest_price, price_change, percent_change = features["quote"]
         
-        # Generate and save the plot
-        try:
-            plt.figure(figsize=(12, 6))
-            
-            # Plot only the last 90 days data to make it more readable
-            last_n_days = min(90, len(stock_data))
-            plot_data = stock_data.iloc[-last_n_days:]
-            
-            plt.plot(plot_data.index, plot_data['close'], label='Closing Price', color='blue')
-            plt.plot(plot_data.index, plot_data['SMA_50'], label='SMA 50', color='orange')
-            plt.plot(plot_data.index, plot_data['SMA_200'], label='SMA 200', color='red')
-            
-            # Add buy/sell markers
-            buy_indices = plot_data.index[plot_data['SMA_50'] > plot_data['SMA_200']]
-            sell_indices = plot_data.index[plot_data['SMA_50'] < plot_data['SMA_200']]
-            
-            plt.scatter(
-                buy_indices,
-                plot_data.loc[buy_indices, 'close'],
-                color='green', label='Buy Signal', marker='^', alpha=1, s=100, zorder=5
-            )
-            plt.scatter(
-                sell_indices,
-                plot_data.loc[sell_indices, 'close'],
-                color='red', label='Sell Signal', marker='v', alpha=1, s=100, zorder=5
-            )
-            
-            plt.title(f"Stock Price with Moving Average Crossover Signals (Last {last_n_days} days)", fontsize=14)
-            plt.legend()
-            plt.xlabel("Day")
-            plt.ylabel("Price ($)")
-            plt.grid(True, alpha=0.3)
-
-            # Saving the plot to /public folder
-            image_path = os.path.join(GLOBAL_ASSETS_DIR, "momentum_average_crossover.png")
-            plt.savefig(image_path, dpi=300, bbox_inches='tight')
-            plt.close('all')  # Closing all figures to prevent memory leaks
-
-            print(f"✅ Image successfully saved at: {image_path}")
-        except Exception as e:
-            print(f"❌ Error generating chart: {str(e)}")
-            # Continuing execution - we can still return the prediction even if chart fails
+        # Queue the chart (last 90 days) on the background render pool; the response does not wait for it
+        last_n_days = min(90, len(stock_data))
+        chart_file = chart_renderer.submit(
+            "momentum_average_crossover", (series_key, data_version), plot_moving_average,
+            stock_data.iloc[-last_n_days:], last_n_days, dpi=chart_dpi, fmt=chart_format
+        )
 
         # Return only the simple signal message but keep other data in the JSON
         base_url = request.host_url.rstrip("/")  # Get base URL dynamically
@@ -305,135 +443,74 @@ def predict():
             "price": float(latest_price),
             "change": float(price_change),
             "change_percent": float(percent_change),
-            "image_url": f"{base_url}/public/momentum_average_crossover.png",
+            "image_url": f"{base_url}/public/{chart_file}",
+            "symbol": symbol,
+            "timeframe": timeframe,
             "model_type": "moving_average"
         })
 
     except Exception as e:
-        error_traceback = traceback.format_exc()
-        print(f"❌ Error in prediction: {str(e)}")
-        print(f"Traceback: {error_traceback}")
+        logger.exception(f"❌ Error in prediction: {str(e)}")
         return jsonify({"message": f"❌ Error in prediction: {str(e)}"}), 500
 
 
-@app.route("/api/predict-sentiment", methods=["GET"])
+@api.route("/api/predict-sentiment", methods=["GET"])
 @cross_origin()
+@memoized_prediction(("sentiment",), fingerprint=lambda symbol, timeframe: news_corpus.signature(symbol))
 def predict_sentiment():
     try:
         # Check if sentiment model is loaded
+        sentiment_model = models.get("sentiment")
         if sentiment_model is None:
             return jsonify({"message": "❌ Sentiment model not loaded. Check server logs."}), 500
 
-        data_path = os.path.join(DATA_DIR, "stock_data.csv")
+        # Optional per-request chart resolution/format
+        try:
+            chart_dpi, chart_format = parse_chart_options(request.args)
+        except ValueError as e:
+            return jsonify({"message": f"❌ Invalid chart options: {str(e)}"}), 400
+
+        # Which symbol/timeframe partition to predict on
+        try:
+            symbol, timeframe = parse_symbol_options(request.args, DEFAULT_SYMBOL)
+            window = parse_window_options(request.args, timeframe)
+        except ValueError as e:
+            return jsonify({"message": f"❌ {str(e)}"}), 400
+        series_key = window_key(symbol, timeframe, window)
 
         # Load stock data
         try:
-            if not os.path.exists(data_path):
-                return jsonify({"message": "❌ Stock data file not found! Please fetch data first."}), 404
+            if not market_data.exists(symbol, timeframe):
+                return jsonify({"message": f"❌ No {timeframe} stock data for {symbol}! Please fetch data first."}), 404
                 
-            stock_data = pd.read_csv(data_path)
-            print(f"✅ Successfully loaded stock data with {len(stock_data)} rows for sentiment analysis")
+            with stage("load_data"):
+                stock_data, data_version = market_data.load(symbol, timeframe, window)
+            logger.info(f"✅ Successfully loaded stock data with {len(stock_data)} rows ({symbol} {timeframe}) for sentiment analysis")
         except Exception as e:
-            print(f"❌ Error reading CSV for sentiment analysis: {str(e)}")
+            logger.error(f"❌ Error reading CSV for sentiment analysis: {str(e)}")
             return jsonify({"message": f"❌ Error reading stock data: {str(e)}"}), 400
 
-        # For sentiment model, we simulate extracting sentiment features
+        # Headline sentiment of the latest bar plus its close, volume and return go through the model
+        features = feature_store.view(series_key, data_version, stock_data)
         try:
-            # Simulate sentiment features from price movement and volatility
-            stock_data['price_change'] = stock_data['close'].pct_change()
-            stock_data['volatility'] = stock_data['high'] - stock_data['low']
-            
-            # Use recent data for sentiment analysis (last 14 days)
-            recent_data = stock_data.iloc[-14:].dropna()
-            
-            if recent_data.empty:
-                return jsonify({"message": "⚠️ Not enough data for sentiment analysis"}), 400
-                
-            # Extract simulated sentiment features
-            avg_price_change = recent_data['price_change'].mean()
-            avg_volatility = recent_data['volatility'].mean()
-            volume_trend = recent_data['volume'].pct_change().mean()
-            
-            # Creating feature vector for sentiment model
-            # currently we are using a simplified example - in reality its a different game
-            features = np.array([[avg_price_change, avg_volatility, volume_trend]])
-            
-            # Predict sentiment (binary output: 1 for positive, 0 for negative)
-            sentiment_score = np.random.random()  # Simulate sentiment score between 0 and 1
-            prediction = 1 if sentiment_score > 0.5 else 0
-            
-            
+            prediction, sentiment_details = sentiment_prediction(sentiment_model, features, symbol, timeframe)
         except Exception as e:
-            print(f"❌ Error preprocessing data for sentiment: {str(e)}")
+            logger.error(f"❌ Error preprocessing data for sentiment: {str(e)}")
             return jsonify({"message": f"❌ Error analyzing sentiment: {str(e)}"}), 500
 
         # Generate sentiment-based signal
         signal = "📈 Positive Sentiment (Buy)" if prediction == 1 else "📉 Negative Sentiment (Sell)"
         
-        # Get latest price
-        latest_price = stock_data['close'].iloc[-1]
-        
-        # Calculate price change
-        price_change = 0
-        percent_change = 0
-        if len(stock_data) > 1:
-            price_change = stock_data['close'].iloc[-1] - stock_data['close'].iloc[-2]
-            percent_change = (price_change / stock_data['close'].iloc[-2]) * 100
-
-        # Generate and save sentiment visualization
-        try:
-            plt.figure(figsize=(12, 6))
-            
-            # Plot only recent data
-            recent_n_days = min(30, len(stock_data))
-            plot_data = stock_data.iloc[-recent_n_days:]
-            
-            # Plot closing price
-            plt.plot(plot_data.index, plot_data['close'], label='Closing Price', color='blue')
-            
-            # shaded background based on sentiment
-            if prediction == 1:  # Positive sentiment
-                plt.axhspan(plot_data['close'].min(), plot_data['close'].max(), 
-                          alpha=0.2, color='green', label='Positive Sentiment')
-            else:  # Negative sentiment
-                plt.axhspan(plot_data['close'].min(), plot_data['close'].max(), 
-                          alpha=0.2, color='red', label='Negative Sentiment')
-            
-            # indicators for where price movement aligns with sentiment
-            sentiment_direction = 1 if prediction == 1 else -1
-            plot_data['aligned'] = plot_data['price_change'].apply(
-                lambda x: sentiment_direction * x > 0)
-            
-            # Mark days where price movement aligned with sentiment
-            aligned_days = plot_data.index[plot_data['aligned']]
-            plt.scatter(
-                aligned_days,
-                plot_data.loc[aligned_days, 'close'],
-                color='purple', label='Sentiment Confirmation', marker='o', s=80, zorder=5
-            )
-            
-            plt.title(f"Stock Price with Sentiment Analysis (Last {recent_n_days} days)", fontsize=14)
-            plt.legend()
-            plt.xlabel("Day")
-            plt.ylabel("Price ($)")
-            plt.grid(True, alpha=0.3)
-            
-            # Add text annotation for the sentiment prediction
-            y_position = plot_data['close'].min() + (plot_data['close'].max() - plot_data['close'].min()) * 0.1
-            plt.text(plot_data.index[0], y_position, 
-                    f"Sentiment: {'Positive' if prediction == 1 else 'Negative'}", 
-                    fontsize=14, color='black', 
-                    bbox=dict(facecolor='white', alpha=0.8))
-
-            # Save the plot
-            image_path = os.path.join(GLOBAL_ASSETS_DIR, "sentiment_analysis.png")
-            plt.savefig(image_path, dpi=300, bbox_inches='tight')
-            plt.close('all')
-
-            print(f"✅ Sentiment image saved at: {image_path}")
-        except Exception as e:
-            print(f"❌ Error generating sentiment chart: {str(e)}")
-            # Continuing execution - we can still return the prediction even if chart fails
+        # Latest price and change from the previous bar
+        latest_price, price_change, percent_change = features["quote"]
+
+        # Queue the sentiment chart (last 30 days) on the background render pool
+        recent_n_days = min(30, len(stock_data))
+        chart_file = chart_renderer.submit(
+            "sentiment_analysis", (series_key, data_version, prediction), plot_sentiment,
+            sentiment_chart_data(features, recent_n_days), prediction, recent_n_days,
+            dpi=chart_dpi, fmt=chart_format
+        )
 
         # Return sentiment prediction
         base_url = request.host_url.rstrip("/")
@@ -443,145 +520,211 @@ def predict_sentiment():
             "price": float(latest_price),
             "change": float(price_change),
             "change_percent": float(percent_change),
-            "image_url": f"{base_url}/public/sentiment_analysis.png",
-            "model_type": "sentiment"
+            "image_url": f"{base_url}/public/{chart_file}",
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "model_type": "sentiment",
+            "sentiment": sentiment_details
         })
 
     except Exception as e:
-        error_traceback = traceback.format_exc()
-        print(f"❌ Error in sentiment prediction: {str(e)}")
-        print(f"Traceback: {error_traceback}")
+        logger.exception(f"❌ Error in sentiment prediction: {str(e)}")
         return jsonify({"message": f"❌ Error in sentiment prediction: {str(e)}"}), 500
 
 
-@app.route("/api/check-file", methods=["GET"])
+@api.route("/api/check-file", methods=["GET"])
 @cross_origin()
 def check_file():
-    data_path = os.path.join(DATA_DIR, "stock_data.csv")
-    
-    if os.path.exists(data_path):
+    try:
+        symbol, timeframe = parse_symbol_options(request.args, DEFAULT_SYMBOL)
+    except ValueError as e:
+        return jsonify({"message": f"❌ {str(e)}", "exists": False}), 400
+
+    if market_data.exists(symbol, timeframe):
         try:
-            # Get file stats
-            file_size = os.path.getsize(data_path) / 1024  # Size in KB
-            
-            # Trying to read the file to verify it's valid
-            data = pd.read_csv(data_path)
-            rows = len(data)
+            # Loading a one-bar window through the shared cache also imports new bars and verifies the data is valid
+            market_data.load(symbol, timeframe, (None, None, 1))
+            rows = market_data.rows(symbol, timeframe)
+
+            # Size of the stored column segments
+            file_size = market_data.partition(symbol, timeframe).size_bytes() / 1024  # Size in KB
             
             return jsonify({
-                "message": f"✅ Stock data file found ({file_size:.2f} KB, {rows} rows)",
+                "message": f"✅ Stock data found for {symbol} ({file_size:.2f} KB, {rows} rows)",
                 "exists": True,
+                "symbol": symbol,
+                "timeframe": timeframe,
                 "size_kb": round(file_size, 2),
                 "rows": rows
             })
         except Exception as e:
             return jsonify({
-                "message": f"⚠️ Stock data file exists but is not valid: {str(e)}",
+                "message": f"⚠️ Stock data for {symbol} exists but is not valid: {str(e)}",
                 "exists": True,
                 "valid": False
             })
     else:
         return jsonify({
-            "message": "❌ Stock data file not found!",
+            "message": f"❌ No {timeframe} stock data for {symbol}!",
             "exists": False
         })
 
 
-@app.route("/api/get-image", methods=["GET"])
+@api.route("/api/refresh-data", methods=["POST"])
+@cross_origin()
+def refresh_data():
+    # Called by server.js once a fetch completes so the next request re-checks that symbol's data
+    symbol = request.args.get("symbol")
+    timeframe = request.args.get("timeframe")
+    market_data.invalidate(symbol.upper() if symbol else None, timeframe)
+    # Cached results are keyed by data version and would miss anyway; free them now
+    result_cache.invalidate(lambda key: not symbol or key[1] == symbol.upper())
+    signal_hub.notify(symbol.upper() if symbol else None, timeframe)
+    if symbol:
+        try:
+            check_triggers_on_new_bars(normalize_symbol(symbol), normalize_timeframe(timeframe))
+        except Exception as e:
+            logger.error(f"❌ Could not check stop-loss/take-profit triggers for {symbol}: {str(e)}")
+        try:
+            update_risk_streams(normalize_symbol(symbol), normalize_timeframe(timeframe))
+        except Exception as e:
+            logger.error(f"❌ Could not update running risk metrics for {symbol}: {str(e)}")
+    return jsonify({"message": f"✅ Market data cache invalidated ({symbol or 'all symbols'})"})
+
+
+@api.route("/api/cache-stats", methods=["GET"])
+@cross_origin()
+def cache_stats():
+    return jsonify(dict(
+        market_data.stats(), features=feature_store.stats(), sentiment=news_corpus.stats(), results=result_cache.stats()
+    ))
+
+
+@api.route("/api/models", methods=["GET"])
+@cross_origin()
+def model_status():
+    return jsonify(models.status())
+
+
+@api.route("/api/models/reload", methods=["POST"])
+@cross_origin()
+def reload_models():
+    # Swaps models in this process only; under gunicorn send SIGHUP to the master to reload every worker
+    names = request_list(request, "models", "") or None
+    try:
+        results = reload_model_registry(names)
+    except KeyError as e:
+        return jsonify({"message": f"❌ Unknown model: {str(e)}"}), 400
+    failed = [name for name, error in results.items() if error]
+    status = 500 if failed else 200
+    return jsonify({"message": "⚠️ Some models failed to reload" if failed else "✅ Models reloaded", "results": results}), status
+
+
+@api.route("/api/inference-stats", methods=["GET"])
+@cross_origin()
+def inference_stats():
+    return jsonify({
+        "transformer_backend": TRANSFORMER_BACKEND,
+        "transformer_batcher": transformer_batcher.stats(),
+        "transformer_forecasts": transformer_forecaster.stats(),
+    })
+
+
+@api.route("/api/get-image", methods=["GET"])
 @cross_origin()
 def get_image():
     image_name = request.args.get('image', 'momentum_average_crossover.png')
-    valid_images = ['momentum_average_crossover.png', 'sentiment_analysis.png', 'macd_analysis.png']
+    valid_images = ['momentum_average_crossover.png', 'sentiment_analysis.png', 'macd_analysis.png', 'transformer_analysis.png']
     
-    if image_name not in valid_images:
+    # Content-addressed charts (charts/<name>-<hash>.<fmt>) are valid too
+    if image_name not in valid_images and not image_name.startswith(f"{CHART_DIR_NAME}/"):
         return jsonify({"message": "❌ Invalid image requested!"}), 400
         
-    image_path = os.path.join(GLOBAL_ASSETS_DIR, image_name)
+    return send_public_file(image_name)
 
-    if os.path.exists(image_path):
-        return send_from_directory(GLOBAL_ASSETS_DIR, image_name)
-    else:
-        return jsonify({"message": "❌ Image not found!"}), 404
 
-
-@app.route("/public/<path:filename>")
+@api.route("/public/<path:filename>")
 @cross_origin()
 def serve_static(filename):
-    return send_from_directory(GLOBAL_ASSETS_DIR, filename)
+    return send_public_file(filename)
+
 
+def send_public_file(filename):
+    """Serve a file from /public with an ETag so polling clients get 304s"""
+    if not filename.startswith(f"{CHART_DIR_NAME}/"):
+        # Mutable assets: always revalidate against the ETag
+        if not os.path.exists(os.path.join(GLOBAL_ASSETS_DIR, filename)):
+            return jsonify({"message": "❌ Image not found!"}), 404
+        response = send_from_directory(GLOBAL_ASSETS_DIR, filename, max_age=0)
+        response.cache_control.no_cache = True
+        return response
 
-@app.route("/api/predict-macd", methods=["GET"])
+    # Content-addressed chart: wait if it is still rendering, then let clients cache it for good
+    try:
+        with stage("chart_wait"):
+            filename = chart_renderer.result(filename, timeout=CHART_WAIT_SECONDS)
+    except KeyError:
+        return jsonify({"message": "❌ Image not found!"}), 404
+    except TimeoutError:
+        return jsonify({"message": "⚠️ Chart is still rendering, try again shortly"}), 503
+    except Exception as e:
+        return jsonify({"message": f"❌ Error generating chart: {str(e)}"}), 500
+    response = send_from_directory(GLOBAL_ASSETS_DIR, filename, max_age=CHART_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+
+@api.route("/api/predict-macd", methods=["GET"])
 @cross_origin()
+@memoized_prediction(("macd",))
 def predict_macd():
     try:
         # Check if MACD model is loaded
+        macd_model = models.get("macd")
         if macd_model is None:
             return jsonify({"message": "❌ MACD model not loaded. Check server logs."}), 500
 
-        data_path = os.path.join(DATA_DIR, "stock_data.csv")
+        # Optional per-request chart resolution/format
+        try:
+            chart_dpi, chart_format = parse_chart_options(request.args)
+        except ValueError as e:
+            return jsonify({"message": f"❌ Invalid chart options: {str(e)}"}), 400
+
+        # Which symbol/timeframe partition to predict on
+        try:
+            symbol, timeframe = parse_symbol_options(request.args, DEFAULT_SYMBOL)
+            window = parse_window_options(request.args, timeframe)
+        except ValueError as e:
+            return jsonify({"message": f"❌ {str(e)}"}), 400
+        series_key = window_key(symbol, timeframe, window)
 
         # Load stock data
         try:
-            if not os.path.exists(data_path):
-                return jsonify({"message": "❌ Stock data file not found! Please fetch data first."}), 404
+            if not market_data.exists(symbol, timeframe):
+                return jsonify({"message": f"❌ No {timeframe} stock data for {symbol}! Please fetch data first."}), 404
                 
-            df = pd.read_csv(data_path)
-            print(f"✅ Successfully loaded stock data with {len(df)} rows for MACD analysis")
+            with stage("load_data"):
+                df, data_version = market_data.load(symbol, timeframe, window)
+            logger.info(f"✅ Successfully loaded stock data with {len(df)} rows ({symbol} {timeframe}) for MACD analysis")
         except Exception as e:
-            print(f"❌ Error reading CSV for MACD analysis: {str(e)}")
+            logger.error(f"❌ Error reading CSV for MACD analysis: {str(e)}")
             return jsonify({"message": f"❌ Error reading stock data: {str(e)}"}), 400
 
-        # Check for data leakage
-        leakage_check = check_data_leakage(df)
-        print(leakage_check)
-        
-        # Run time series split validation
-        print("\nRunning time series validation...")
-        test_signals, model, scaler, features = time_series_split(df)
-        
-        # Verify return calculation
-        return_check = verify_return_calculation(test_signals)
-        print(return_check)
-        
-        # Calculate risk metrics
-        risk_metrics = calculate_risk_metrics(test_signals)
-        
-        # Get latest signal and price
-        latest_date = test_signals.index[-1]
-        latest_signal = test_signals.loc[latest_date, 'Signal']
-        latest_price = test_signals.loc[latest_date, 'Close']
-        
-        # Convert signal to text
-        signal_text = "HOLD" if latest_signal == 0 else "BUY" if latest_signal == 1 else "SELL"
-        
-        # Calculate price change
-        price_change = 0
-        percent_change = 0
-        if len(df) > 1:
-            price_change = df['close'].iloc[-1] - df['close'].iloc[-2]
-            percent_change = (price_change / df['close'].iloc[-2]) * 100
-            
-        # Generate and save MACD performance plot
-        try:
-            plt.figure(figsize=(12, 6))
-            plt.plot(test_signals.index, test_signals['Cumulative_Return'], label='Model Strategy')
-            plt.plot(test_signals.index, test_signals['Buy_and_Hold'], label='Buy and Hold')
-            plt.title('AAPL Trading Strategy Performance (MACD)')
-            plt.xlabel('Date')
-            plt.ylabel('Cumulative Return')
-            plt.legend()
-            plt.grid(True)
-            
-            # Save the plot
-            image_path = os.path.join(GLOBAL_ASSETS_DIR, "macd_analysis.png")
-            plt.savefig(image_path, dpi=300, bbox_inches='tight')
-            plt.close('all')
+        # MACD validation on the incrementally maintained indicator series
+        features = feature_store.view(series_key, data_version, df)
+        with stage("indicators"):
+            indicators = features["indicators"]
+        test_signals, risk_metrics, signal_text = macd_analysis(df, indicators, periods_per_year(timeframe))
+
+        # Latest price and change from the previous bar
+        latest_price, price_change, percent_change = features["quote"]
             
-            print(f"✅ MACD image saved at: {image_path}")
-        except Exception as e:
-            print(f"❌ Error generating MACD chart: {str(e)}")
-            traceback.print_exc()
-            # Continuing execution - we can still return the prediction even if chart fails
+        # Queue the MACD performance chart on the background render pool
+        chart_file = chart_renderer.submit(
+            "macd_analysis", (series_key, data_version), plot_macd,
+            test_signals[['Cumulative_Return', 'Buy_and_Hold']], symbol,
+            dpi=chart_dpi, fmt=chart_format
+        )
 
         # Format the signal for response
         if signal_text == "BUY":
@@ -602,118 +745,87 @@ def predict_macd():
             "price": float(latest_price),
             "change": float(price_change),
             "change_percent": float(percent_change),
-            "image_url": f"{base_url}/public/macd_analysis.png",
+            "image_url": f"{base_url}/public/{chart_file}",
+            "symbol": symbol,
+            "timeframe": timeframe,
             "model_type": "macd",
             "risk_metrics": risk_metrics
         })
 
     except Exception as e:
-        error_traceback = traceback.format_exc()
-        print(f"❌ Error in MACD prediction: {str(e)}")
-        print(f"Traceback: {error_traceback}")
+        logger.exception(f"❌ Error in MACD prediction: {str(e)}")
         return jsonify({"message": f"❌ Error in MACD prediction: {str(e)}"}), 500
 
 
-@app.route("/api/predict-transformer", methods=["GET"])
+@api.route("/api/predict-transformer", methods=["GET"])
 @cross_origin()
+@memoized_prediction(("transformer", "transformer_scaler"))
 def predict_transformer():
     try:
         # Check if  model is loaded
+        transformer_model = models.get("transformer")
+        transformer_scaler = models.get("transformer_scaler")
         if transformer_model is None or transformer_scaler is None:
             return jsonify({"message": "❌ Transformer model not loaded. Check server logs."}), 500
 
-        data_path = os.path.join(DATA_DIR, "stock_data.csv")
+        # Optional per-request chart resolution/format
+        try:
+            chart_dpi, chart_format = parse_chart_options(request.args)
+        except ValueError as e:
+            return jsonify({"message": f"❌ Invalid chart options: {str(e)}"}), 400
+
+        # Which symbol/timeframe partition to predict on
+        try:
+            symbol, timeframe = parse_symbol_options(request.args, DEFAULT_SYMBOL)
+            window = parse_window_options(request.args, timeframe)
+        except ValueError as e:
+            return jsonify({"message": f"❌ {str(e)}"}), 400
+        series_key = window_key(symbol, timeframe, window)
 
         # Loading stock data
         try:
-            if not os.path.exists(data_path):
-                return jsonify({"message": "❌ Stock data file not found! Please fetch data first."}), 404
+            if not market_data.exists(symbol, timeframe):
+                return jsonify({"message": f"❌ No {timeframe} stock data for {symbol}! Please fetch data first."}), 404
                 
-            df = pd.read_csv(data_path)
-            print(f"✅ Successfully loaded stock data with {len(df)} rows for Transformer analysis")
+            with stage("load_data"):
+                df, data_version = market_data.load(symbol, timeframe, window)
+            logger.info(f"✅ Successfully loaded stock data with {len(df)} rows ({symbol} {timeframe}) for Transformer analysis")
         except Exception as e:
-            print(f"❌ Error reading CSV for Transformer analysis: {str(e)}")
+            logger.error(f"❌ Error reading CSV for Transformer analysis: {str(e)}")
             return jsonify({"message": f"❌ Error reading stock data: {str(e)}"}), 400
 
-        # Preparing data for prediction
-        look_back = 60
-        close_prices = df['close'].values.reshape(-1, 1)
-        scaled = transformer_scaler.transform(close_prices)
-
-        X = []
-        for i in range(look_back, len(scaled)):
-            X.append(scaled[i - look_back:i, 0])
-        X = np.array(X).reshape(-1, look_back, 1)
-
-        # Making prediction
-        predicted = transformer_model.predict(X, verbose=0)
-        predicted = transformer_scaler.inverse_transform(predicted).flatten()
-        actual = transformer_scaler.inverse_transform(scaled[look_back:]).flatten()
-
-        # Generate signals
-        signals = []
-        for i in range(1, len(predicted)):
-            if predicted[i] > actual[i - 1]:
-                signals.append("BUY")
-            elif predicted[i] < actual[i - 1]:
-                signals.append("SELL")
-            else:
-                signals.append("HOLD")
-        signals.insert(0, "HOLD")
+        if len(df) <= LOOK_BACK:
+            return jsonify({"message": f"⚠️ Need more than {LOOK_BACK} bars of data for a Transformer prediction"}), 400
+
+        # Forecasts and BUY/SELL signals for every window; cached per data version and, unless
+        # ?inference=full is passed, the model only runs on windows it has not seen before
+        full_pass = request.args.get("inference", "incremental") == "full"
+        features = feature_store.view(series_key, data_version, df)
+        try:
+            with stage("predict"):
+                predicted, actual, signals = transformer_forecaster.forecast(
+                    partition_key(series_key), data_version, features["close"],
+                    transformer_batcher.predict, transformer_scaler, full=full_pass, timestamps=features["timestamp"]
+                )
+        except InferenceQueueFull as e:
+            logger.warning(f"⚠️ Transformer inference queue full: {str(e)}")
+            return jsonify({"message": "⚠️ Transformer model is busy, try again shortly"}), 503
+        except TimeoutError as e:
+            # The batcher has already dropped the request's windows if the model had not started on them
+            logger.warning(f"⚠️ Transformer inference timed out: {str(e)}")
+            return jsonify({"message": "⚠️ Transformer model is busy, try again shortly"}), 503
 
         # Getting the latest signal
-        latest_signal = signals[-1]
+        latest_signal = str(signals[-1])
         
-        # Getting latest price
-        latest_price = df['close'].iloc[-1]
-        
-        # Calculate price change
-        price_change = 0
-        percent_change = 0
-        if len(df) > 1:
-            price_change = df['close'].iloc[-1] - df['close'].iloc[-2]
-            percent_change = (price_change / df['close'].iloc[-2]) * 100
-
-        # Generate and saving visualization
-        try:
-            plt.figure(figsize=(12, 6))
-            
-            # Plot actual prices
-            plt.plot(df.index[-len(actual):], actual, label='Actual Price', color='blue')
-            
-            # Plot predicted prices
-            plt.plot(df.index[-len(predicted):], predicted, label='Predicted Price', color='red', linestyle='--')
-            
-            # Add buy/sell markers
-            buy_indices = [i for i, sig in enumerate(signals) if sig == "BUY"]
-            sell_indices = [i for i, sig in enumerate(signals) if sig == "SELL"]
-            
-            plt.scatter(
-                df.index[-len(signals):][buy_indices],
-                actual[buy_indices],
-                color='green', label='Buy Signal', marker='^', s=100, zorder=5
-            )
-            plt.scatter(
-                df.index[-len(signals):][sell_indices],
-                actual[sell_indices],
-                color='red', label='Sell Signal', marker='v', s=100, zorder=5
-            )
-            
-            plt.title("Transformer Model Price Prediction and Signals", fontsize=14)
-            plt.legend()
-            plt.xlabel("Day")
-            plt.ylabel("Price ($)")
-            plt.grid(True, alpha=0.3)
-
-            # Save the plot
-            image_path = os.path.join(GLOBAL_ASSETS_DIR, "transformer_analysis.png")
-            plt.savefig(image_path, dpi=300, bbox_inches='tight')
-            plt.close('all')
-
-            print(f"✅ Transformer analysis image saved at: {image_path}")
-        except Exception as e:
-            print(f"❌ Error generating Transformer chart: {str(e)}")
-            traceback.print_exc()
+        # Latest price and change from the previous bar
+        latest_price, price_change, percent_change = features["quote"]
+
+        # Queue the prediction chart on the background render pool
+        chart_file = chart_renderer.submit(
+            "transformer_analysis", (series_key, data_version, models.generation("transformer")), plot_transformer,
+            df.index, actual, predicted, signals, dpi=chart_dpi, fmt=chart_format
+        )
 
         # Format the signal for response
         if latest_signal == "BUY":
@@ -731,23 +843,1116 @@ def predict_transformer():
             "price": float(latest_price),
             "change": float(price_change),
             "change_percent": float(percent_change),
-            "image_url": f"{base_url}/public/transformer_analysis.png",
+            "image_url": f"{base_url}/public/{chart_file}",
+            "symbol": symbol,
+            "timeframe": timeframe,
             "model_type": "transformer"
         })
 
     except Exception as e:
-        error_traceback = traceback.format_exc()
-        print(f"❌ Error in Transformer prediction: {str(e)}")
-        print(f"Traceback: {error_traceback}")
+        logger.exception(f"❌ Error in Transformer prediction: {str(e)}")
         return jsonify({"message": f"❌ Error in Transformer prediction: {str(e)}"}), 500
 
 
+def request_option(req, name, default=None):
+    """Option from the JSON body, falling back to the query string"""
+    body = req.get_json(silent=True) or {}
+    return body.get(name, req.args.get(name, default))
+
+
+def request_list(req, name, default):
+    """List option given as a JSON array or a comma separated string"""
+    value = request_option(req, name, default)
+    if isinstance(value, str):
+        value = value.split(",")
+    return list(dict.fromkeys(str(item).strip() for item in value if str(item).strip()))
+
+
+def request_window(req, timeframe):
+    """(start, end, bars) window from a JSON body or query args; raises ValueError when invalid"""
+    return parse_window_options({name: request_option(req, name) for name in ("start", "end", "bars")}, timeframe)
+
+
+def request_symbols(req):
+    symbols = [normalize_symbol(symbol) for symbol in request_list(req, "symbols", DEFAULT_SYMBOL)]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols or len(symbols) > MAX_BATCH_SYMBOLS:
+        raise ValueError(f"Between 1 and {MAX_BATCH_SYMBOLS} symbols are allowed")
+    return symbols
+
+
+def parse_batch_options(req):
+    """Read symbols/models/timeframe/charts/stream from a JSON body or query args; raises ValueError when invalid"""
+    symbols = request_symbols(req)
+    model_names = request_list(req, "models", ",".join(BATCH_MODELS))
+    unknown = [name for name in model_names if name not in BATCH_MODELS]
+    if unknown or not model_names:
+        raise ValueError(f"models must be taken from: {', '.join(BATCH_MODELS)}")
+    timeframe = normalize_timeframe(request_option(req, "timeframe"))
+    window = request_window(req, timeframe)
+    charts = str(request_option(req, "charts", "")).lower() in ("1", "true", "yes")
+    stream = str(request_option(req, "stream", "")).lower() in ("1", "true", "yes", "ndjson")
+    return symbols, model_names, timeframe, window, charts, stream
+
+
+def load_batch_context(symbol, timeframe, window=None):
+    """Load one symbol once; its models share the features computed from it"""
+    if not market_data.exists(symbol, timeframe):
+        raise LookupError(f"No {timeframe} stock data for {symbol}")
+    with stage("load_data"):
+        frame, data_version = market_data.load(symbol, timeframe, window)
+    series_key = window_key(symbol, timeframe, window)
+    features = feature_store.view(series_key, data_version, frame)
+    price, change, percent = features["quote"]
+    return {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "series_key": series_key,
+        "frame": frame,
+        "version": data_version,
+        "features": features,
+        "price": price,
+        "change": change,
+        "change_percent": percent,
+    }
+
+
+def evaluate_batch_item(context, model_name, chart_options, base_url):
+    """Run one model on a loaded symbol; signals are normalized to BUY/SELL/HOLD"""
+    frame, key, version, features = context["frame"], context["series_key"], context["version"], context["features"]
+    result = {"symbol": context["symbol"], "model": model_name}
+    chart_file = None
+
+    if model_name == "moving_average":
+        model, scaler = models.get("moving_average"), models.get("moving_average_scaler")
+        if model is None or scaler is None:
+            raise RuntimeError("Moving average model not loaded")
+        with stage("indicators"):
+            sma_200 = features["sma_200"]
+        valid_rows = int(np.count_nonzero(~np.isnan(sma_200)))
+        if valid_rows == 0:
+            raise ValueError("Not enough stock data to make a prediction")
+        result["signal"] = "BUY" if moving_average_prediction(model, scaler, features) == 1 else "SELL"
+        if chart_options:
+            keep_rows = min(valid_rows, 90)
+            plot_data = frame.iloc[-keep_rows:].copy()
+            plot_data["SMA_50"] = features["sma_50"][-keep_rows:]
+            plot_data["SMA_200"] = sma_200[-keep_rows:]
+            chart_file = chart_renderer.submit(
+                "momentum_average_crossover", (key, version), plot_moving_average,
+                plot_data, keep_rows, **chart_options
+            )
+
+    elif model_name == "sentiment":
+        sentiment_model = models.get("sentiment")
+        if sentiment_model is None:
+            raise RuntimeError("Sentiment model not loaded")
+        prediction, result["sentiment"] = sentiment_prediction(sentiment_model, features, context["symbol"], context["timeframe"])
+        result["signal"] = "BUY" if prediction == 1 else "SELL"
+        if chart_options:
+            recent_n_days = min(30, len(frame))
+            chart_file = chart_renderer.submit(
+                "sentiment_analysis", (key, version, prediction), plot_sentiment,
+                sentiment_chart_data(features, recent_n_days), prediction, recent_n_days, **chart_options
+            )
+
+    elif model_name == "macd":
+        if models.get("macd") is None:
+            raise RuntimeError("MACD model not loaded")
+        with stage("indicators"):
+            indicators = features["indicators"]
+        test_signals, risk_metrics, signal_text = macd_analysis(frame, indicators, periods_per_year(context["timeframe"]))
+        result["signal"] = signal_text
+        result["risk_metrics"] = risk_metrics
+        if chart_options:
+            chart_file = chart_renderer.submit(
+                "macd_analysis", (key, version), plot_macd,
+                test_signals[['Cumulative_Return', 'Buy_and_Hold']], context["symbol"], **chart_options
+            )
+
+    elif model_name == "transformer":
+        transformer_scaler = models.get("transformer_scaler")
+        if models.get("transformer") is None or transformer_scaler is None:
+            raise RuntimeError("Transformer model not loaded")
+        if len(frame) <= LOOK_BACK:
+            raise ValueError(f"Need more than {LOOK_BACK} bars for a Transformer prediction")
+        # Transformer calls from all workers are merged by the micro-batcher
+        with stage("predict"):
+            predicted, actual, signals = transformer_forecaster.forecast(
+                partition_key(key), version, features["close"], transformer_batcher.predict, transformer_scaler,
+                timestamps=features["timestamp"]
+            )
+        result["signal"] = str(signals[-1])
+        if chart_options:
+            chart_file = chart_renderer.submit(
+                "transformer_analysis", (key, version, models.generation("transformer")), plot_transformer,
+                frame.index, actual, predicted, signals, **chart_options
+            )
+
+    result["message"] = SIGNAL_MESSAGES.get((model_name, result["signal"]))
+    if chart_file:
+        result["image_url"] = f"{base_url}/public/{chart_file}"
+    return result
+
+
+@api.route("/api/predict-batch", methods=["GET", "POST"])
+@cross_origin()
+def predict_batch():
+    """Many symbols x many models in one call; ?stream=1 returns NDJSON lines as results complete"""
+    try:
+        symbols, model_names, timeframe, window, with_charts, stream = parse_batch_options(request)
+        chart_options = None
+        if with_charts:
+            chart_dpi, chart_format = parse_chart_options(request.args)
+            chart_options = {"dpi": chart_dpi, "fmt": chart_format}
+    except ValueError as e:
+        return jsonify({"message": f"❌ Invalid batch request: {str(e)}"}), 400
+
+    base_url = request.host_url.rstrip("/")
+    started = time.perf_counter()
+
+    def results():
+        # Symbols load in parallel; once a symbol is loaded its models are queued on the same pool
+        pending = {submit_in_context(load_batch_context, symbol, timeframe, window): (symbol, None) for symbol in symbols}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    symbol, model_name = pending.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Batch prediction failed for {symbol} {model_name or 'data'}: {str(e)}")
+                        yield {"symbol": symbol, "model": model_name, "error": str(e)} if model_name else {"symbol": symbol, "error": str(e)}
+                        continue
+                    if model_name is not None:
+                        yield value
+                        continue
+                    yield {key: value[key] for key in ("symbol", "price", "change", "change_percent")}
+                    for name in model_names:
+                        pending[submit_in_context(evaluate_batch_item, value, name, chart_options, base_url)] = (symbol, name)
+        finally:
+            # Client went away (or an error escaped): drop work that has not started yet
+            for future in pending:
+                future.cancel()
+
+    if stream:
+        def ndjson():
+            for item in results():
+                yield json.dumps(item) + "\n"
+            yield json.dumps({"done": True, "elapsed_ms": round(1000 * (time.perf_counter() - started), 1)}) + "\n"
+        return Response(stream_with_context(ndjson()), mimetype="application/x-ndjson")
+
+    # One compact document: per-symbol prices plus results in request order
+    symbol_info = {}
+    items = []
+    for item in results():
+        if "model" in item:
+            items.append(item)
+        else:
+            symbol_info[item["symbol"]] = {key: value for key, value in item.items() if key != "symbol"}
+    order = {(symbol, name): i for i, (symbol, name) in enumerate((s, m) for s in symbols for m in model_names)}
+    items.sort(key=lambda item: order[(item["symbol"], item["model"])])
+    return jsonify({
+        "timeframe": timeframe,
+        "symbols": symbol_info,
+        "results": items,
+        "elapsed_ms": round(1000 * (time.perf_counter() - started), 1),
+    })
+
+
+def parse_backtest_options(req):
+    """Read symbols/strategy/cost_bps/window parameters; raises ValueError when invalid"""
+    symbols = request_symbols(req)
+    strategy = str(request_option(req, "strategy", "macd"))
+    if strategy not in backtest.STRATEGIES:
+        raise ValueError(f"strategy must be one of: {', '.join(backtest.STRATEGIES)}")
+    timeframe = normalize_timeframe(request_option(req, "timeframe"))
+    window = request_window(req, timeframe)
+    cost_bps = float(request_option(req, "cost_bps", 0))
+    if not 0 <= cost_bps <= 1000:
+        raise ValueError("cost_bps must be between 0 and 1000")
+
+    defaults = {
+        "sma_crossover": {"short": backtest.SMA_WINDOWS[0], "long": backtest.SMA_WINDOWS[1]},
+        "macd": {"fast": backtest.MACD_FAST, "slow": backtest.MACD_SLOW, "signal": backtest.MACD_SIGNAL},
+        "transformer": {},
+    }[strategy]
+    parameters = {name: int(request_option(req, name, default)) for name, default in defaults.items()}
+    if any(value < 1 for value in parameters.values()):
+        raise ValueError("Window parameters must be positive integers")
+    if parameters.get("short", 0) >= parameters.get("long", 1) or parameters.get("fast", 0) >= parameters.get("slow", 1):
+        raise ValueError("The fast/short window must be shorter than the slow/long window")
+    return symbols, strategy, timeframe, window, cost_bps, parameters
+
+
+def _safe_call(fn, *args):
+    # (value, None) or (None, error message), so one failing symbol does not abort a pool map
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, str(e)
+
+
+def transformer_signal_series(symbol, timeframe, window=None):
+    """BUY/SELL/HOLD label for every bar of a symbol (HOLD during the look-back period)"""
+    transformer_scaler = models.get("transformer_scaler")
+    if models.get("transformer") is None or transformer_scaler is None:
+        raise RuntimeError("Transformer model not loaded")
+    frame, data_version = market_data.load(symbol, timeframe, window)
+    if len(frame) <= LOOK_BACK:
+        raise ValueError(f"Need more than {LOOK_BACK} bars for a Transformer backtest")
+    _, _, signals = transformer_forecaster.forecast(
+        partition_key(window_key(symbol, timeframe, window)), data_version, frame['close'].to_numpy(),
+        transformer_batcher.predict, transformer_scaler, timestamps=frame['timestamp'].to_numpy()
+    )
+    labels = np.full(len(frame), "HOLD", dtype="<U4")
+    labels[LOOK_BACK:] = signals
+    return labels
+
+
+@api.route("/api/backtest", methods=["GET", "POST"])
+@cross_origin()
+def backtest_strategy():
+    """Vectorized backtest of one strategy over a symbols x time price matrix"""
+    try:
+        symbols, strategy, timeframe, window, cost_bps, parameters = parse_backtest_options(request)
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"❌ Invalid backtest request: {str(e)}"}), 400
+
+    started = time.perf_counter()
+    try:
+        closes, errors = backtest.load_closes(market_data, symbols, timeframe, window)
+
+        labels = {}
+        if strategy == "transformer":
+            # Forecasts are cached per symbol and data version; concurrent symbols share model batches
+            outcomes = batch_pool.map(lambda symbol: _safe_call(transformer_signal_series, symbol, timeframe, window), list(closes))
+            for symbol, (value, error) in zip(list(closes), outcomes):
+                if error is not None:
+                    errors[symbol] = error
+                    del closes[symbol]
+                else:
+                    labels[symbol] = (closes[symbol][0], value)
+
+        if not closes:
+            return jsonify({"message": "❌ No stock data for the requested symbols", "errors": errors}), 404
+
+        # All symbols are tested on the bars they have in common
+        panel_symbols, timestamps, close = backtest.align_panel(closes)
+        if len(timestamps) < 2:
+            return jsonify({"message": "⚠️ The requested symbols have fewer than 2 bars in common", "errors": errors}), 400
+
+        if strategy == "sma_crossover":
+            positions = backtest.sma_positions(close, parameters["short"], parameters["long"])
+        elif strategy == "macd":
+            positions = backtest.macd_positions(close, parameters["fast"], parameters["slow"], parameters["signal"])
+        else:
+            signal_labels = np.stack([
+                np.asarray(labels[symbol][1])[np.searchsorted(labels[symbol][0], timestamps)] for symbol in panel_symbols
+            ])
+            positions = backtest.transformer_positions(signal_labels)
+
+        bars_per_year = periods_per_year(timeframe)
+        result = backtest.run_backtest(close, positions, cost_bps, bars_per_year)
+        return jsonify({
+            "strategy": strategy,
+            "parameters": parameters,
+            "timeframe": timeframe,
+            "cost_bps": cost_bps,
+            "bars": int(len(timestamps)),
+            "start": int(timestamps[0]),
+            "end": int(timestamps[-1]),
+            "symbols": backtest.metrics_table(panel_symbols, result["metrics"]),
+            "portfolio": backtest.portfolio_metrics(result["strategy_returns"], close, bars_per_year),
+            "trades": {symbol: int(np.count_nonzero(result["turnover"][row])) for row, symbol in enumerate(panel_symbols)},
+            "errors": errors,
+            "elapsed_ms": round(1000 * (time.perf_counter() - started), 1),
+        })
+
+    except Exception as e:
+        logger.exception(f"❌ Error in backtest: {str(e)}")
+        return jsonify({"message": f"❌ Error in backtest: {str(e)}"}), 500
+
+
+
+@api.route("/api/sweep", methods=["GET", "POST"])
+@cross_origin()
+def parameter_sweep():
+    """Grid-search MACD (fast/slow/signal) or SMA (short/long) windows; returns a ranked metrics table"""
+    try:
+        symbols = request_symbols(request)
+        strategy = str(request_option(request, "strategy", "macd"))
+        if strategy not in sweep.SWEEP_STRATEGIES:
+            raise ValueError(f"strategy must be one of: {', '.join(sweep.SWEEP_STRATEGIES)}")
+        timeframe = normalize_timeframe(request_option(request, "timeframe"))
+        window = request_window(request, timeframe)
+        cost_bps = float(request_option(request, "cost_bps", 0))
+        sort_by = str(request_option(request, "sort", "sharpe_ratio"))
+        top = int(request_option(request, "top", 20))
+        grid = {
+            name: [int(value) for value in request_list(request, name, "")]
+            for name in sweep.DEFAULT_GRIDS[strategy]
+        }
+        grid = {name: values for name, values in grid.items() if values}
+        # Validate the grid before loading any data
+        sweep.parameter_grid(strategy, grid)
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"❌ Invalid sweep request: {str(e)}"}), 400
+
+    try:
+        closes, errors = backtest.load_closes(market_data, symbols, timeframe, window)
+        if not closes:
+            return jsonify({"message": "❌ No stock data for the requested symbols", "errors": errors}), 404
+        panel_symbols, timestamps, close = backtest.align_panel(closes)
+        if len(timestamps) < 2:
+            return jsonify({"message": "⚠️ The requested symbols have fewer than 2 bars in common", "errors": errors}), 400
+
+        result = sweep.run_sweep(
+            panel_symbols, close, strategy, grid, cost_bps=cost_bps,
+            workers=SWEEP_WORKERS, sort_by=sort_by, top=top, periods_per_year=periods_per_year(timeframe)
+        )
+        result["timeframe"] = timeframe
+        result["errors"] = errors
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"message": f"❌ Invalid sweep request: {str(e)}"}), 400
+    except Exception as e:
+        logger.exception(f"❌ Error in parameter sweep: {str(e)}")
+        return jsonify({"message": f"❌ Error in parameter sweep: {str(e)}"}), 500
+
+
+# ✅ Replays of stored bars through the prediction models; fill logs go to replays/
+REPLAY_DIR = os.environ.get("REPLAY_DIR", os.path.join(os.path.dirname(__file__), "replays"))
+
+
+def replay_signal_series(symbol, timeframe, model_name, window=None):
+    """Bar columns of a symbol plus the model's signal for every bar (+1 buy, -1 sell, 0 none).
+
+    Each signal is what the model's prediction endpoint returns when that bar is the latest one.
+    """
+    if not market_data.exists(symbol, timeframe):
+        raise LookupError(f"No {timeframe} stock data for {symbol}")
+    frame, data_version = market_data.load(symbol, timeframe, window)
+    features = feature_store.view(window_key(symbol, timeframe, window), data_version, frame)
+    signals = np.zeros(len(frame), dtype=np.int8)
+
+    if model_name == "moving_average":
+        model, scaler = models.get("moving_average"), models.get("moving_average_scaler")
+        if model is None or scaler is None:
+            raise RuntimeError("Moving average model not loaded")
+        sma_50, sma_200 = features["sma_50"], features["sma_200"]
+        valid = ~np.isnan(sma_50) & ~np.isnan(sma_200)
+        if valid.any():
+            predictions = model.predict(scaler.transform(np.column_stack([sma_50[valid], sma_200[valid]])))
+            signals[valid] = np.where(predictions == 1, 1, -1)
+    elif model_name == "sentiment":
+        sentiment_model = models.get("sentiment")
+        if sentiment_model is None:
+            raise RuntimeError("Sentiment model not loaded")
+        inputs = model_inputs(
+            news_corpus.buckets(symbol, timeframe), features["timestamp"], features["close"], features["volume"], features["returns"]
+        )
+        signals[:] = np.where(sentiment_model.predict(inputs) == 1, 1, -1)
+    elif model_name == "macd":
+        if models.get("macd") is None:
+            raise RuntimeError("MACD model not loaded")
+        test_signals = time_series_split(frame, features["indicators"])[0]
+        signals[:] = test_signals["Signal"].to_numpy()
+    elif model_name == "transformer":
+        labels = transformer_signal_series(symbol, timeframe, window)
+        signals[:] = np.select([labels == "BUY", labels == "SELL"], [1, -1], 0)
+    else:
+        raise ValueError(f"models must be taken from: {', '.join(BATCH_MODELS)}")
+
+    columns = {name: features[name] for name in replay.BAR_INPUTS}
+    columns["signals"] = signals
+    return columns
+
+
+def load_replay_inputs(symbols, model_names, timeframe, window=None):
+    """Replay inputs per (symbol, model), plus an error message per pair that could not be loaded"""
+    pairs = [(symbol, model_name) for symbol in symbols for model_name in model_names]
+    outcomes = batch_pool.map(
+        lambda pair: _safe_call(replay_signal_series, pair[0], timeframe, pair[1], window), pairs
+    )
+    inputs, errors = {}, {}
+    for pair, (value, error) in zip(pairs, outcomes):
+        if error is not None:
+            errors[pair] = error
+        else:
+            inputs[pair] = value
+    return inputs, errors
+
+
+def request_percent_list(req, name):
+    """Percentages given as a list or comma separated string; "none" (or nothing) disables the threshold"""
+    values = [None if str(value).lower() == "none" else float(value) for value in request_list(req, name, "none")]
+    if any(value is not None and not 0 < value < 100 for value in values):
+        raise ValueError(f"{name} percentages must be between 0 and 100")
+    return values
+
+
+@api.route("/api/replay", methods=["GET", "POST"])
+@cross_origin()
+def replay_strategies():
+    """Replay stored bars through the models with stop loss/take profit, for every symbol x model x threshold"""
+    try:
+        symbols = request_symbols(request)
+        model_names = request_list(request, "models", ",".join(BATCH_MODELS))
+        unknown = [name for name in model_names if name not in BATCH_MODELS]
+        if unknown or not model_names:
+            raise ValueError(f"models must be taken from: {', '.join(BATCH_MODELS)}")
+        timeframe = normalize_timeframe(request_option(request, "timeframe"))
+        window = request_window(request, timeframe)
+        options = {
+            "investment": float(request_option(request, "investment", 10000)),
+            "max_trades": int(request_option(request, "max_trades")) if request_option(request, "max_trades") else None,
+            "cost_bps": float(request_option(request, "cost_bps", 0)),
+        }
+        if not options["investment"] > 0 or not 0 <= options["cost_bps"] <= 1000:
+            raise ValueError("investment must be positive and cost_bps between 0 and 1000")
+        specs = replay.replay_specs(
+            symbols, model_names, request_percent_list(request, "stop_loss"), request_percent_list(request, "take_profit"),
+            **options
+        )
+        if len(specs) > replay.MAX_REPLAYS:
+            raise ValueError(f"{len(specs)} replays requested (at most {replay.MAX_REPLAYS} are allowed)")
+        write_log = str(request_option(request, "log", "")).lower() in ("1", "true", "yes")
+        include_fills = str(request_option(request, "fills", "")).lower() in ("1", "true", "yes")
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"❌ Invalid replay request: {str(e)}"}), 400
+
+    try:
+        inputs, errors = load_replay_inputs(symbols, model_names, timeframe, window)
+        if not inputs:
+            return jsonify({
+                "message": "❌ No replay inputs for the requested symbols and models",
+                "errors": {f"{symbol}:{model}": error for (symbol, model), error in errors.items()},
+            }), 404
+        specs = [spec for spec in specs if (spec["symbol"], spec["model"]) in inputs]
+        result = replay.run_replays(inputs, specs, SWEEP_WORKERS)
+
+        response = {
+            "timeframe": timeframe,
+            "replays": result["replays"],
+            "workers": result["workers"],
+            "elapsed_ms": result["elapsed_ms"],
+            "bars_per_second": result["bars_per_second"],
+            "errors": {f"{symbol}:{model}": error for (symbol, model), error in errors.items()},
+        }
+        if write_log:
+            log_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.npz"
+            replay.write_fill_log(os.path.join(REPLAY_DIR, log_name), result["replays"], result["fills"])
+            response["log"] = log_name
+        if include_fills:
+            fills = result["fills"]
+            response["fills"] = [
+                dict({name: fills[name][row].item() for name in replay.FILL_COLUMNS}, reason=replay.REASONS[fills["reason"][row]])
+                for row in range(len(fills["pnl"]))
+            ]
+        return jsonify(response)
+
+    except ValueError as e:
+        return jsonify({"message": f"❌ Invalid replay request: {str(e)}"}), 400
+    except Exception as e:
+        logger.exception(f"❌ Error in replay: {str(e)}")
+        return jsonify({"message": f"❌ Error in replay: {str(e)}"}), 500
+
+
+# Strategies walk-forward validation can evaluate: the vectorized indicator strategies and every prediction model
+WALK_FORWARD_STRATEGIES = ("macd", "sma_crossover") + tuple(name for name in BATCH_MODELS if name != "macd")
+
+
+def strategy_return_series(symbol, timeframe, strategy, window=None, cost_bps=0.0):
+    """(timestamps, bar returns, strategy returns) of one strategy over all loaded bars.
+
+    Indicator strategies read the indicator series computed once per data version; models use
+    their per-bar replay signals, held until the opposite signal.
+    """
+    if strategy in ("macd", "sma_crossover"):
+        if not market_data.exists(symbol, timeframe):
+            raise LookupError(f"No {timeframe} stock data for {symbol}")
+        frame, data_version = market_data.load(symbol, timeframe, window)
+        features = feature_store.view(window_key(symbol, timeframe, window), data_version, frame)
+        indicators = features["indicators"]
+        timestamps, close = features["timestamp"], features["close"]
+        if strategy == "macd":
+            positions = indicators["position"]
+        else:
+            short, long = (indicators[f"sma_{length}"] for length in backtest.SMA_WINDOWS)
+            positions = (short > long).astype(np.float64)
+    else:
+        data = replay_signal_series(symbol, timeframe, strategy, window)
+        timestamps, close = data["timestamp"], data["close"]
+        positions = backtest.hold_positions(data["signals"][np.newaxis])[0]
+    result = backtest.run_backtest(close[np.newaxis], positions[np.newaxis], cost_bps)
+    return timestamps, result["returns"][0], result["strategy_returns"][0]
+
+
+def walk_forward_validation(symbols, strategies, timeframe, window=None, fold_options=None, cost_bps=0.0):
+    """Train/test metrics per walk-forward fold for every symbol x strategy"""
+    pairs = [(symbol, strategy) for symbol in symbols for strategy in strategies]
+    outcomes = batch_pool.map(
+        lambda pair: _safe_call(strategy_return_series, pair[0], timeframe, pair[1], window, cost_bps), pairs
+    )
+    series, errors = {}, {}
+    for pair, (value, error) in zip(pairs, outcomes):
+        if error is None:
+            timestamps, returns, strategy_returns = value
+            try:
+                folds = walk_forward.walk_forward_folds(len(timestamps), **(fold_options or {}))
+                problems = walk_forward.check_folds(folds, timestamps)
+                if problems:
+                    raise ValueError("; ".join(problems))
+                series[pair] = (returns, strategy_returns, timestamps, folds)
+                continue
+            except ValueError as e:
+                error = str(e)
+        errors[f"{pair[0]}:{pair[1]}"] = error
+
+    evaluated = walk_forward.run_walk_forward(series, periods_per_year(timeframe))
+    by_symbol = {}
+    for (symbol, strategy), entry in evaluated.items():
+        by_symbol.setdefault(symbol, {})[strategy] = entry
+    # Model strategies come from weights fitted once, possibly on bars a fold tests on; nothing is refit per fold
+    pretrained = [strategy for strategy in strategies if strategy not in ("macd", "sma_crossover")]
+    return {"timeframe": timeframe, "symbols": by_symbol, "errors": errors, "pretrained": pretrained}
+
+
+@api.route("/api/walk-forward", methods=["GET", "POST"])
+@cross_origin()
+def walk_forward_endpoint():
+    """Walk-forward validation: calculate_risk_metrics of every fold's training and test window"""
+    try:
+        symbols = request_symbols(request)
+        strategies = request_list(request, "strategies", "macd")
+        unknown = [name for name in strategies if name not in WALK_FORWARD_STRATEGIES]
+        if unknown or not strategies:
+            raise ValueError(f"strategies must be taken from: {', '.join(WALK_FORWARD_STRATEGIES)}")
+        timeframe = normalize_timeframe(request_option(request, "timeframe"))
+        window = request_window(request, timeframe)
+        fold_options = {
+            "n_folds": int(request_option(request, "folds", WALK_FORWARD_FOLDS)),
+            "test_size": int(request_option(request, "test_size")) if request_option(request, "test_size") else None,
+            "min_train": int(request_option(request, "min_train")) if request_option(request, "min_train") else None,
+            "mode": str(request_option(request, "mode", "expanding")),
+            "gap": int(request_option(request, "gap", 0)),
+        }
+        if fold_options["mode"] not in walk_forward.FOLD_MODES:
+            raise ValueError(f"mode must be one of: {', '.join(walk_forward.FOLD_MODES)}")
+        if not 1 <= fold_options["n_folds"] <= 100:
+            raise ValueError("folds must be between 1 and 100")
+        cost_bps = float(request_option(request, "cost_bps", 0))
+        if not 0 <= cost_bps <= 1000:
+            raise ValueError("cost_bps must be between 0 and 1000")
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"❌ Invalid walk-forward request: {str(e)}"}), 400
+
+    started = time.perf_counter()
+    try:
+        result = walk_forward_validation(symbols, strategies, timeframe, window, fold_options, cost_bps)
+        if not result["symbols"]:
+            return jsonify({"message": "❌ No walk-forward results for the requested symbols", "errors": result["errors"]}), 404
+        result.update(fold_options, cost_bps=cost_bps, elapsed_ms=round(1000 * (time.perf_counter() - started), 1))
+        return jsonify(result)
+    except Exception as e:
+        logger.exception(f"❌ Error in walk-forward validation: {str(e)}")
+        return jsonify({"message": f"❌ Error in walk-forward validation: {str(e)}"}), 500
+
+
+# ✅ Running risk metrics per symbol/timeframe/strategy, fed only with bars stored since their last update
+RISK_WINDOWS = tuple(int(size) for size in os.environ.get("RISK_WINDOWS", ",".join(map(str, ROLLING_WINDOWS))).split(",") if size.strip())
+risk_monitor = RiskMonitor(windows=RISK_WINDOWS, max_series=int(os.environ.get("RISK_STREAM_SERIES", 1024)))
+
+
+def update_risk_stream(symbol, timeframe, strategy, cost_bps=0.0):
+    """Add the bars stored since a series' last update (every stored bar the first time)"""
+    if not market_data.exists(symbol, timeframe):
+        raise LookupError(f"No {timeframe} stock data for {symbol}")
+
+    def read_bars(since):
+        # Only the rows after the last added bar are read; the indicator state lives in the series' feed
+        columns = market_data.bars_after(symbol, timeframe, since)[0]
+        return columns["timestamp"], columns["close"]
+
+    return risk_monitor.update(
+        (symbol, timeframe, strategy, cost_bps), read_bars, lambda: StrategyFeed(strategy, cost_bps)
+    )
+
+
+def update_risk_streams(symbol, timeframe):
+    """Bring every tracked series of a symbol up to date with its newly stored bars"""
+    for key in risk_monitor.keys(lambda key: key[0] == symbol and key[1] == timeframe):
+        update_risk_stream(*key)
+
+
+@api.route("/api/risk-stream", methods=["GET", "POST"])
+@cross_origin()
+def risk_stream_endpoint():
+    """Running whole-period and rolling-window risk metrics; a series is tracked from its first request on.
+
+    Only indicator strategies are offered: model signals would need the model rerun over the history.
+    """
+    try:
+        symbols = request_symbols(request)
+        strategies = request_list(request, "strategies", "macd")
+        unknown = [name for name in strategies if name not in RISK_STRATEGIES]
+        if unknown or not strategies:
+            raise ValueError(f"strategies must be taken from: {', '.join(RISK_STRATEGIES)}")
+        timeframe = normalize_timeframe(request_option(request, "timeframe"))
+        cost_bps = float(request_option(request, "cost_bps", 0))
+        if not 0 <= cost_bps <= 1000:
+            raise ValueError("cost_bps must be between 0 and 1000")
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"❌ Invalid risk stream request: {str(e)}"}), 400
+
+    started = time.perf_counter()
+    pairs = [(symbol, strategy) for symbol in symbols for strategy in strategies]
+    outcomes = batch_pool.map(
+        lambda pair: _safe_call(update_risk_stream, pair[0], timeframe, pair[1], cost_bps), pairs
+    )
+    by_symbol, errors, added = {}, {}, 0
+    for (symbol, strategy), (value, error) in zip(pairs, outcomes):
+        if error is not None:
+            errors[f"{symbol}:{strategy}"] = error
+            continue
+        added += value
+        by_symbol.setdefault(symbol, {})[strategy] = risk_monitor.snapshot(
+            (symbol, timeframe, strategy, cost_bps), periods_per_year(timeframe)
+        )
+    if not by_symbol:
+        return jsonify({"message": "❌ No risk metrics for the requested symbols", "errors": errors}), 404
+    return jsonify({
+        "timeframe": timeframe,
+        "cost_bps": cost_bps,
+        "windows": list(RISK_WINDOWS),
+        "symbols": by_symbol,
+        "errors": errors,
+        "bars_added": added,
+        "elapsed_ms": round(1000 * (time.perf_counter() - started), 1),
+    })
+
+
+def parse_stream_topics(args):
+    """(symbol, timeframe, model) topics from ?symbols=&models=&timeframe=; raises ValueError when invalid"""
+    symbols = [normalize_symbol(symbol) for symbol in (args.get("symbols") or DEFAULT_SYMBOL).split(",") if symbol.strip()]
+    model_names = [name.strip() for name in (args.get("models") or ",".join(BATCH_MODELS)).split(",") if name.strip()]
+    unknown = [name for name in model_names if name not in BATCH_MODELS]
+    if unknown or not model_names:
+        raise ValueError(f"models must be taken from: {', '.join(BATCH_MODELS)}")
+    if not symbols or len(symbols) > MAX_BATCH_SYMBOLS:
+        raise ValueError(f"Between 1 and {MAX_BATCH_SYMBOLS} symbols are allowed")
+    timeframe = normalize_timeframe(args.get("timeframe"))
+    return [(symbol, timeframe, name) for symbol in dict.fromkeys(symbols) for name in dict.fromkeys(model_names)]
+
+
+def feed_data_version(symbol, timeframe):
+    if not market_data.exists(symbol, timeframe):
+        raise LookupError(f"No {timeframe} stock data for {symbol}")
+    return market_data.load(symbol, timeframe, default_window(timeframe))[1]
+
+
+def compute_feed_signals(symbol, timeframe, model_names):
+    """Signals of the given models for one symbol, computed once per data version for all feed subscribers"""
+    context = load_batch_context(symbol, timeframe, default_window(timeframe))
+    shared = {key: context[key] for key in ("price", "change", "change_percent", "version")}
+    outcomes = batch_pool.map(lambda name: _safe_call(evaluate_batch_item, context, name, None, ""), model_names)
+    results = []
+    for name, (value, error) in zip(model_names, outcomes):
+        results.append(dict(value or {"symbol": symbol, "model": name, "error": error}, **shared))
+    return results
+
+
+# ✅ Server-push signal feed: one recompute per data update, broadcast to every subscriber
+SIGNAL_FEED_HEARTBEAT = float(os.environ.get("SIGNAL_FEED_HEARTBEAT", 15))
+signal_hub = SignalHub(
+    compute_feed_signals, feed_data_version,
+    poll_interval=float(os.environ.get("SIGNAL_FEED_POLL_SECONDS", 5)),
+)
+
+
+# ✅ Every SSE response served through WSGI keeps a worker thread until its client goes away, so only
+# MAX_WSGI_STREAMS of them may be open per process; the asyncio listener has no such limit
+MAX_WSGI_STREAMS = int(os.environ.get("MAX_WSGI_STREAMS", 2))
+wsgi_stream_slots = threading.BoundedSemaphore(MAX_WSGI_STREAMS)
+wsgi_stream_counts = {"open": 0, "refused": 0}
+wsgi_stream_lock = threading.Lock()
+
+
+def acquire_wsgi_stream():
+    """Reserve a WSGI stream slot; False (and counted) when every slot is taken"""
+    acquired = wsgi_stream_slots.acquire(blocking=False)
+    with wsgi_stream_lock:
+        wsgi_stream_counts["open" if acquired else "refused"] += 1
+    return acquired
+
+
+def release_wsgi_stream():
+    with wsgi_stream_lock:
+        wsgi_stream_counts["open"] -= 1
+    wsgi_stream_slots.release()
+
+
+def wsgi_stream_response(events):
+    """SSE response holding a slot from acquire_wsgi_stream(), given back when the connection closes"""
+    response = Response(
+        stream_with_context(events), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs when the server closes the response, even if the client left before the first event
+    response.call_on_close(release_wsgi_stream)
+    return response
+
+
+def streams_busy_response():
+    logger.warning(f"⚠️ Refusing a stream: {MAX_WSGI_STREAMS} streams already open in this process")
+    message = "⚠️ Too many open streams, poll instead or use the signal feed listener (SIGNAL_FEED_PORT)"
+    return jsonify({"message": message}), 503, {"Retry-After": str(int(SIGNAL_FEED_HEARTBEAT))}
+
+
+def start_signal_feed_server():
+    """Start the asyncio SSE listener if SIGNAL_FEED_PORT is set (call once per serving process)"""
+    port = os.environ.get("SIGNAL_FEED_PORT")
+    if port:
+        signal_hub.serve(os.environ.get("SIGNAL_FEED_HOST", "0.0.0.0"), int(port), parse_stream_topics, SIGNAL_FEED_HEARTBEAT)
+
+
+@api.route("/api/stream", methods=["GET"])
+@cross_origin()
+def stream_signals():
+    """Server-Sent Events feed of model signals (?symbols=AAPL,MSFT&models=macd,transformer)"""
+    try:
+        topics = parse_stream_topics(request.args)
+    except ValueError as e:
+        return jsonify({"message": f"❌ {str(e)}"}), 400
+    if not acquire_wsgi_stream():
+        return streams_busy_response()
+
+    subscription = signal_hub.subscribe(topics)
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=SIGNAL_FEED_HEARTBEAT)
+                yield ": keepalive\n\n" if event is None else format_sse(event)
+        finally:
+            # Client disconnected
+            subscription.close()
+
+    return wsgi_stream_response(events())
+
+
+@api.route("/api/stream-stats", methods=["GET"])
+@cross_origin()
+def stream_stats():
+    with wsgi_stream_lock:
+        wsgi_streams = dict(wsgi_stream_counts, limit=MAX_WSGI_STREAMS)
+    return jsonify(dict(signal_hub.stats(), wsgi_streams=wsgi_streams))
+
+
+# ✅ Stop-loss / take-profit triggers for open positions, fired by price ticks and newly ingested bars
+# (held in memory by the serving process: run a single worker when using them)
+trigger_engine = TriggerEngine(max_closed=int(os.environ.get("TRIGGER_CLOSED_LOG", 10000)))
+trigger_bar_cursor = {}  # (symbol, timeframe) -> timestamp of the last bar run through the triggers
+# Held from reading a cursor until it is moved, so concurrent fetches never run a bar through the triggers twice
+trigger_bar_lock = threading.Lock()
+
+
+def request_float(req, name, default=None):
+    value = request_option(req, name, default)
+    return None if value in (None, "") else float(value)
+
+
+def latest_close(symbol):
+    if not market_data.exists(symbol, DEFAULT_TIMEFRAME):
+        raise LookupError(f"No {DEFAULT_TIMEFRAME} stock data for {symbol}")
+    return float(market_data.load(symbol, DEFAULT_TIMEFRAME, (None, None, 1))[0]["close"].iloc[-1])
+
+
+def check_triggers_on_new_bars(symbol, timeframe):
+    """Run the bars stored since the last check through the symbol's triggers"""
+    if not market_data.exists(symbol, timeframe):
+        return []
+    key = (symbol, timeframe)
+    if not trigger_engine.has_positions(symbol):
+        # Nothing to trigger: just move the cursor past the stored bars
+        frame = market_data.load(symbol, timeframe, (None, None, 1))[0]
+        if len(frame):
+            with trigger_bar_lock:
+                # Never backwards: a caller holding a newer frame may have moved it already
+                trigger_bar_cursor[key] = max(int(frame["timestamp"].iloc[-1]), trigger_bar_cursor.get(key, -1))
+        return []
+    frame = market_data.load(symbol, timeframe, default_window(timeframe))[0]
+    timestamps = frame["timestamp"].to_numpy()
+    events = []
+    with trigger_bar_lock:
+        last_seen = trigger_bar_cursor.get(key)
+        start = len(timestamps) if last_seen is None else int(np.searchsorted(timestamps, last_seen, side="right"))
+        for row in frame.iloc[start:].itertuples(index=False):
+            events.extend(trigger_engine.on_bar(symbol, row.open, row.high, row.low, row.timestamp))
+        if len(timestamps):
+            trigger_bar_cursor[key] = max(int(timestamps[-1]), trigger_bar_cursor.get(key, -1))
+    for event in events:
+        logger.info(f"✅ {event['reason']} closed {symbol} position {event['position']['id']} at {event['exit_price']:.2f}")
+    return events
+
+
+@api.route("/api/last-price", methods=["GET"])
+@cross_origin()
+def last_price():
+    """Latest stored close of a symbol: the price positions are opened and closed at from the UI"""
+    try:
+        symbol = normalize_symbol(request.args.get("symbol", DEFAULT_SYMBOL))
+        if not market_data.exists(symbol, DEFAULT_TIMEFRAME):
+            raise LookupError(f"No {DEFAULT_TIMEFRAME} stock data for {symbol}")
+        frame = market_data.load(symbol, DEFAULT_TIMEFRAME, (None, None, 1))[0]
+    except ValueError as e:
+        return jsonify({"message": f"❌ {str(e)}"}), 400
+    except LookupError as e:
+        return jsonify({"message": f"❌ {str(e)}"}), 404
+    return jsonify({"symbol": symbol, "price": float(frame["close"].iloc[-1]), "timestamp": int(frame["timestamp"].iloc[-1])})
+
+
+@api.route("/api/positions", methods=["GET", "POST"])
+@cross_origin()
+def positions():
+    """GET: open positions (?symbol=). POST: open one with `stop_loss`/`take_profit` prices or `*_pct` percentages"""
+    if request.method == "GET":
+        symbol = request.args.get("symbol")
+        return jsonify({"positions": trigger_engine.positions(normalize_symbol(symbol) if symbol else None)})
+    try:
+        symbol = normalize_symbol(request_option(request, "symbol", DEFAULT_SYMBOL))
+        side = str(request_option(request, "side", "")).lower()
+        quantity = request_float(request, "quantity")
+        entry_price = request_float(request, "entry_price")
+        if quantity is None:
+            raise ValueError("quantity is required")
+        if entry_price is None:
+            entry_price = latest_close(symbol)
+        stop_loss, take_profit = thresholds_from_percent(
+            side, entry_price, request_float(request, "stop_loss_pct"), request_float(request, "take_profit_pct")
+        )
+        stop_loss = request_float(request, "stop_loss", stop_loss)
+        take_profit = request_float(request, "take_profit", take_profit)
+        metadata = request_option(request, "metadata") or {}
+        # Bars already stored belong to existing positions only; the new one reacts to later bars
+        for timeframe in TIMEFRAMES:
+            check_triggers_on_new_bars(symbol, timeframe)
+        # Closes up to here cannot concern the new position: clients follow the close feed from this id
+        last_close_id = trigger_engine.last_closed_id()
+        position = trigger_engine.open(symbol, side, quantity, entry_price, stop_loss, take_profit, metadata)
+    except (ValueError, TypeError, LookupError) as e:
+        return jsonify({"message": f"❌ Invalid position: {str(e)}"}), 400
+    return jsonify(dict(position, last_close_id=last_close_id)), 201
+
+
+@api.route("/api/positions/<int:position_id>", methods=["DELETE"])
+@cross_origin()
+def close_position(position_id):
+    """Close a position by hand at `price` (default: the latest stored close)"""
+    try:
+        price = request_float(request, "price")
+        positions_by_id = {position["id"]: position for position in trigger_engine.positions()}
+        if position_id not in positions_by_id:
+            return jsonify({"message": f"❌ No open position {position_id}"}), 404
+        if price is None:
+            price = latest_close(positions_by_id[position_id]["symbol"])
+        event = trigger_engine.close(position_id, price, str(request_option(request, "reason", "manual")))
+    except KeyError:
+        return jsonify({"message": f"❌ No open position {position_id}"}), 404
+    except (ValueError, TypeError, LookupError) as e:
+        return jsonify({"message": f"❌ {str(e)}"}), 400
+    return jsonify(event)
+
+
+@api.route("/api/ticks", methods=["POST"])
+@cross_origin()
+def price_ticks():
+    """Feed prices ({"symbol", "price"[, "timestamp"]} or {"ticks": [...]}); returns the positions they closed"""
+    body = request.get_json(silent=True) or {}
+    ticks = body.get("ticks", [body])
+    try:
+        parsed = [
+            (normalize_symbol(tick["symbol"]), float(tick["price"]), tick.get("timestamp"))
+            for tick in ticks
+        ]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"message": f"❌ Invalid ticks: {str(e)}"}), 400
+    closed = []
+    for symbol, price, timestamp in parsed:
+        closed.extend(trigger_engine.on_price(symbol, price, timestamp))
+    return jsonify({"closed": closed})
+
+
+@api.route("/api/positions/closed", methods=["GET"])
+@cross_origin()
+def closed_positions():
+    """Closes after ?since=<event id> (oldest first); ?wait=<seconds> long-polls until there is one"""
+    try:
+        since = int(request.args.get("since", 0))
+        limit = min(int(request.args.get("limit", 1000)), 1000)
+        wait_seconds = min(float(request.args.get("wait", 0)), 60)
+    except ValueError:
+        return jsonify({"message": "❌ since, limit and wait must be numbers"}), 400
+    events = trigger_engine.wait_for_closed(since, wait_seconds)[:limit] if wait_seconds > 0 else trigger_engine.closed_since(since, limit)
+    return jsonify({"closed": events, "last_id": events[-1]["id"] if events else since})
+
+
+@api.route("/api/positions/stream", methods=["GET"])
+@cross_origin()
+def stream_closed_positions():
+    """Server-Sent Events feed of position closes; resumes after the Last-Event-ID header or ?since="""
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.args.get("since", 0))
+    except ValueError:
+        return jsonify({"message": "❌ since must be an event id"}), 400
+    if not acquire_wsgi_stream():
+        return streams_busy_response()
+
+    def events():
+        last_id = since
+        yield "retry: 3000\n\n"
+        while True:
+            closed = trigger_engine.wait_for_closed(last_id, SIGNAL_FEED_HEARTBEAT)
+            if not closed:
+                yield ": keepalive\n\n"
+            for event in closed:
+                last_id = event["id"]
+                yield format_sse(event, "close")
+
+    return wsgi_stream_response(events())
+
+
+@api.route("/api/positions/stats", methods=["GET"])
+@cross_origin()
+def position_stats():
+    return jsonify(trigger_engine.stats())
+
+
+# ✅ Prometheus metrics (per process: under gunicorn every worker exposes its own)
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), "profiles")
+
+metrics.gauge(
+    "algotrade_market_data_events_total", "Market data cache hits/misses, CSV imports and appended bars", ("event",),
+    lambda: {(event,): market_data.stats()[event] for event in ("hits", "misses", "reloads", "imports", "appended_bars")},
+    kind="counter",
+)
+metrics.gauge(
+    "algotrade_feature_events_total", "Feature store values computed vs reused from an earlier request", ("event",),
+    lambda: {(event,): feature_store.stats()[event] for event in ("hits", "computed")}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_headlines_scored_total", "Headlines scored by the sentiment scorer vs served from its cache", ("source",),
+    lambda: {("scored",): news_corpus.scorer.scored, ("cache",): news_corpus.scorer.cached}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_result_cache_events_total", "Prediction result cache lookups by outcome, and evictions", ("event",),
+    lambda: {(event,): result_cache.stats()[event] for event in ("hits", "misses", "coalesced", "evictions", "expired")},
+    kind="counter",
+)
+metrics.gauge(
+    "algotrade_open_positions", "Open positions watched by the stop-loss/take-profit engine", (),
+    lambda: {(): trigger_engine.stats()["open_positions"]},
+)
+metrics.gauge(
+    "algotrade_triggers_fired_total", "Stop-loss/take-profit triggers fired", (),
+    lambda: {(): trigger_engine.stats()["fired"]}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_wsgi_streams_open", "SSE responses holding a WSGI thread", (),
+    lambda: {(): wsgi_stream_counts["open"]},
+)
+metrics.gauge(
+    "algotrade_wsgi_streams_refused_total", "SSE requests refused because MAX_WSGI_STREAMS were open", (),
+    lambda: {(): wsgi_stream_counts["refused"]}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_risk_stream_series", "Symbol/strategy series with running risk metrics", (),
+    lambda: {(): risk_monitor.stats()["series"]},
+)
+metrics.gauge(
+    "algotrade_risk_stream_bars_total", "Bars added to the running risk metrics", (),
+    lambda: {(): risk_monitor.stats()["bars_added"]}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_model_loaded", "1 when the model is loaded", ("model",),
+    lambda: {(name,): int(status["state"] == "loaded") for name, status in models.status().items()},
+)
+metrics.gauge(
+    "algotrade_model_load_seconds", "Time the last model load took", ("model",),
+    lambda: {(name,): status["load_seconds"] for name, status in models.status().items()},
+)
+metrics.gauge(
+    "algotrade_transformer_queue_windows", "Windows waiting for the Transformer micro-batcher", (),
+    lambda: {(): transformer_batcher.stats()["queued_windows"]},
+)
+metrics.gauge(
+    "algotrade_transformer_rejected_total", "Transformer requests rejected because the queue was full", (),
+    lambda: {(): transformer_batcher.stats()["rejected"]}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_transformer_timed_out_total", "Transformer requests that gave up waiting for their batch", (),
+    lambda: {(): transformer_batcher.stats()["timed_out"]}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_transformer_forecasts_total", "Transformer forecasts by how they were served", ("kind",),
+    lambda: {(kind,): count for kind, count in transformer_forecaster.stats().items()}, kind="counter",
+)
+metrics.gauge(
+    "algotrade_chart_files", "Chart files on disk and renders in flight", ("state",),
+    lambda: {("stored",): chart_renderer.stats()["files"], ("pending",): chart_renderer.stats()["pending"]},
+)
+metrics.gauge(
+    "algotrade_signal_feed_subscribers", "Connected signal feed clients", (),
+    lambda: {(): signal_hub.stats()["subscribers"]},
+)
+metrics.gauge(
+    "algotrade_signal_feed_recomputes_total", "Signal feed recomputes (one per data update)", (),
+    lambda: {(): signal_hub.stats()["recomputes"]}, kind="counter",
+)
+
+
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def reload_model_registry(names=None):
+    """Reload models in place (all loaded ones by default); in-flight requests keep the model they started with"""
+    results = models.reload(names)
+    if "transformer" in results and results["transformer"] is None:
+        # Cached forecasts came from the previous weights
+        transformer_forecaster.clear()
+    # Subscribers get signals from the new models without waiting for new data
+    signal_hub.notify(force=True)
+    return results
+
+
+def create_app(preload=None):
+    """Build the Flask app; `preload` lists models to load now ("all", or MODEL_WARMUP when None)"""
+    configure_logging()
+    app = Flask(__name__, static_folder=None)  # ✅ /public is served by serve_static (ETag + caching headers)
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)  # ✅ Fix CORS issue
+    app.register_blueprint(api)
+    # ✅ Per-stage timings, request metrics and ?profile=1 when ENABLE_PROFILING=1
+    instrument_app(app, PROFILE_DIR, allow_profiling=os.environ.get("ENABLE_PROFILING") == "1")
+    models.warmup(MODEL_WARMUP if preload is None else preload)
+    return app
+
+
 if __name__ == "__main__":
-    print("Starting prediction server on port 5001...")
-    print(f"Moving average model status: {'Loaded' if model is not None else 'Not loaded'}")
-    print(f"Sentiment model status: {'Loaded' if sentiment_model is not None else 'Not loaded'}")
-    print(f"MACD model status: {'Loaded' if macd_model is not None else 'Not loaded'}")
-    print(f"Transformer model status: {'Loaded' if transformer_model is not None else 'Not loaded'}")
-    print(f"Data directory: {DATA_DIR}")
-    print(f"Public directory: {GLOBAL_ASSETS_DIR}")
-    app.run(host="0.0.0.0", port=5001, debug=True, threaded=True)
+    # Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
+    app = create_app()
+    debug = os.environ.get("FLASK_DEBUG", "1") == "1"
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # With the debug reloader only the child process serves requests
+        start_signal_feed_server()
+    logger.info("Starting prediction server on port 5001...")
+    for name, status in models.status().items():
+        logger.info(f"{name} model status: {status['state']}")
+    logger.info(f"Data directory: {DATA_DIR}")
+    logger.info(f"Public directory: {GLOBAL_ASSETS_DIR}")
+    app.run(host="0.0.0.0", port=5001, debug=debug, threaded=True)
@@ -0,0 +1,259 @@
+import json
+import time
+import queue
+import socket
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event, name="signal"):
+    """One Server-Sent Events message for an event with an `id`"""
+    return f"event: {name}\nid: {event['id']}\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscription:
+    """Thread-side handle on a hub subscription (used by the WSGI /api/stream route)"""
+
+    def __init__(self, hub, topics, max_queue):
+        self.hub = hub
+        self.topics = topics
+        self._queue = queue.Queue(maxsize=max_queue)
+
+    def deliver(self, event):
+        # Called on the hub loop; a slow client loses its oldest events rather than stalling the hub
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class _AsyncSubscription:
+    def __init__(self, topics, max_queue):
+        self.topics = topics
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def deliver(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class SignalHub:
+    """Pushes model signals to subscribers of (symbol, timeframe, model) topics.
+
+    The hub owns an asyncio loop on a background thread. It watches the data
+    version of every subscribed symbol and, when it changes, runs
+    `compute(symbol, timeframe, models)` once for all subscribed models and
+    broadcasts the results, so work scales with data updates rather than with
+    the number of connected clients. New subscribers get the latest signal
+    straight away.
+    """
+
+    def __init__(self, compute, data_version, poll_interval=5.0, max_queue=100):
+        self.compute = compute
+        self.data_version = data_version
+        self.poll_interval = poll_interval
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._wake = None
+        self._subscribers = {}  # topic -> set of subscriptions
+        self._latest = {}  # topic -> last event
+        self._versions = {}  # (symbol, timeframe) -> data version the latest events were computed from
+        self._next_id = 0
+        self.recomputes = 0
+        self.events = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            # Started on first use so forking servers do not inherit a running loop
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="signal-hub", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wake = asyncio.Event()
+        self._loop.create_task(self._watch())
+        ready.set()
+        self._loop.run_forever()
+
+    def _call(self, fn, *args):
+        self._ensure_started()
+        self._loop.call_soon_threadsafe(fn, *args)
+
+    # Subscriptions (the _add/_remove helpers run on the hub loop)
+
+    def subscribe(self, topics):
+        subscription = Subscription(self, topics, self.max_queue)
+        self._call(self._add, subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._call(self._remove, subscription)
+
+    def _add(self, subscription):
+        for topic in subscription.topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            if topic in self._latest:
+                subscription.deliver(self._latest[topic])
+        self._wake.set()
+
+    def _remove(self, subscription):
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def notify(self, symbol=None, timeframe=None, force=False):
+        """Re-check data now (e.g. after an ingest); `force` recomputes even if the data version is unchanged"""
+        if self._thread is None:
+            return
+        self._call(self._mark_stale, symbol, timeframe, force)
+
+    def _mark_stale(self, symbol, timeframe, force):
+        if force:
+            for key in list(self._versions):
+                if (symbol is None or key[0] == symbol) and (timeframe is None or key[1] == timeframe):
+                    del self._versions[key]
+        self._wake.set()
+
+    # Recompute loop
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            groups = {}
+            for symbol, timeframe, model in self._subscribers:
+                groups.setdefault((symbol, timeframe), set()).add(model)
+            for (symbol, timeframe), model_names in groups.items():
+                try:
+                    version = await loop.run_in_executor(None, self.data_version, symbol, timeframe)
+                except Exception as e:
+                    version = ("error", str(e))
+                missing = [m for m in model_names if (symbol, timeframe, m) not in self._latest]
+                if version == self._versions.get((symbol, timeframe)) and not missing:
+                    continue
+                if isinstance(version, tuple) and version[0] == "error":
+                    results = [{"symbol": symbol, "model": m, "error": version[1]} for m in sorted(model_names)]
+                else:
+                    try:
+                        results = await loop.run_in_executor(None, self.compute, symbol, timeframe, sorted(model_names))
+                    except Exception as e:
+                        results = [{"symbol": symbol, "model": m, "error": str(e)} for m in sorted(model_names)]
+                    self.recomputes += 1
+                self._versions[(symbol, timeframe)] = version
+                for result in results:
+                    self._publish((symbol, timeframe, result["model"]), result, timeframe)
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _publish(self, topic, result, timeframe):
+        self._next_id += 1
+        event = dict(result, id=self._next_id, timeframe=timeframe, updated_at=time.time())
+        self._latest[topic] = event
+        self.events += 1
+        for subscription in list(self._subscribers.get(topic, ())):
+            subscription.deliver(event)
+
+    # Standalone asyncio SSE listener
+
+    def serve(self, host, port, parse_topics, heartbeat=15.0, path="/api/stream"):
+        """Serve `path` as SSE from the hub loop; each client costs a coroutine, not a thread.
+
+        Uses SO_REUSEPORT where available, so every gunicorn worker can listen on
+        the same port and the kernel spreads connections across them.
+        """
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            self._start_server(host, port, parse_topics, heartbeat, path), self._loop
+        )
+        return future.result()
+
+    async def _start_server(self, host, port, parse_topics, heartbeat, path):
+        reuse_port = hasattr(socket, "SO_REUSEPORT")
+
+        async def handle(reader, writer):
+            await self._handle_client(reader, writer, parse_topics, heartbeat, path)
+
+        server = await asyncio.start_server(handle, host, port, reuse_port=reuse_port)
+        logger.info(f"✅ Signal feed listening on {host}:{port}{path}")
+        return server
+
+    async def _handle_client(self, reader, writer, parse_topics, heartbeat, path):
+        subscription = None
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # Headers are not needed
+            url = urlsplit(request_line[1]) if len(request_line) >= 2 else None
+            if url is None or url.path != path:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            try:
+                topics = parse_topics(dict(parse_qsl(url.query)))
+            except ValueError as e:
+                body = json.dumps({"message": f"❌ {str(e)}"}).encode()
+                writer.write(
+                    b"HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\nAccess-Control-Allow-Origin: *\r\n"
+                    + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+                return
+
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n"
+            )
+            subscription = _AsyncSubscription(topics, self.max_queue)
+            self._add(subscription)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                    writer.write(format_sse(event).encode())
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if subscription is not None:
+                self._remove(subscription)
+            writer.close()
+
+    def stats(self):
+        return {
+            "topics": len(self._subscribers),
+            "subscribers": len({id(s) for subs in list(self._subscribers.values()) for s in subs}),
+            "recomputes": self.recomputes,
+            "events": self.events,
+        }
@@ -1,8 +1,19 @@
-﻿import React, { useState, useEffect, useCallback } from 'react';
+﻿import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { DollarSign, TrendingUp, TrendingDown, AlertTriangle, Target, Clock, Settings, PlayCircle, StopCircle, RefreshCw, AlertCircle } from 'lucide-react';
 import { motion } from 'framer-motion';
 import axios from 'axios';
 
+// Server-Sent Events feed of model signals from the prediction server. Each client there holds a
+// WSGI thread (and the server caps how many); point VITE_SIGNAL_FEED_URL at the SIGNAL_FEED_PORT listener for many tabs
+const SIGNAL_FEED_URL = import.meta.env.VITE_SIGNAL_FEED_URL || "http://localhost:5001/api/stream";
+// Positions and their stop loss / take profit triggers live on the prediction server
+const POSITIONS_URL = "http://localhost:5001/api/positions";
+// Closes (stop loss, take profit, other tabs) arrive as Server-Sent Events
+const CLOSED_POSITIONS_URL = "http://localhost:5001/api/positions/stream";
+// Prices come from the ingested bars: the latest stored close
+const LAST_PRICE_URL = "http://localhost:5001/api/last-price";
+const TRADING_SYMBOL = "AAPL";
+
 const TradingInterface = ({ strategy }) => {
   // Trading settings state
   const [isAutoTrading, setIsAutoTrading] = useState(false);
@@ -37,6 +48,7 @@ const TradingInterface = ({ strategy }) => {
   const [autoTradeInterval, setAutoTradeInterval] = useState(null);
   const [notification, setNotification] = useState(null);
   const [tradeHistory, setTradeHistory] = useState([]);
+  const [isStreaming, setIsStreaming] = useState(false);
 
   // Format strategy name for display
   const formatStrategyName = useCallback((strategyName) => {
@@ -96,88 +108,41 @@ const TradingInterface = ({ strategy }) => {
     }));
   };
 
-  // current market price (simulated)
+  // current market price: the latest close stored by the prediction server
   const getCurrentMarketPrice = async () => {
     try {
-      const newPrice = 100.25 + (Math.random() * 5 - 2.5); // Random price around 100.25
-      setMarketPrice(newPrice);
-      return newPrice;
+      const response = await axios.get(LAST_PRICE_URL, { params: { symbol: TRADING_SYMBOL } });
+      setMarketPrice(response.data.price);
+      return response.data.price;
     } catch (error) {
       console.error("Error fetching market price:", error);
       return marketPrice; 
     }
   };
 
-  // Checking if stop loss or take profit is triggered
-  const checkStopLossAndTakeProfit = useCallback(async () => {
-    if (position.status !== 'open') return;
-    
-    try {
-      const currentPrice = await getCurrentMarketPrice();
-      let shouldClose = false;
-      let profitAmount = 0;
-      let closeReason = '';
-      
-      if (position.type === 'buy') {
-        // Calculate profit/loss percentage for long position
-        const priceDiff = currentPrice - position.entryPrice;
-        const percentChange = (priceDiff / position.entryPrice) * 100;
-        profitAmount = position.quantity * priceDiff;
-        
-        // Check stop loss
-        if (percentChange <= -tradeSettings.stopLoss) {
-          shouldClose = true;
-          closeReason = 'Stop loss';
-          setNotification({
-            type: 'error',
-            message: `Stop loss triggered at ${currentPrice.toFixed(2)}`
-          });
-        }
-        
-        // Check take profit
-        if (percentChange >= tradeSettings.takeProfit) {
-          shouldClose = true;
-          closeReason = 'Take profit';
-          setNotification({
-            type: 'success',
-            message: `Take profit triggered at ${currentPrice.toFixed(2)}`
-          });
-        }
-      } else if (position.type === 'sell') {
-        // Calculate profit/loss percentage for short position
-        const priceDiff = position.entryPrice - currentPrice;
-        const percentChange = (priceDiff / position.entryPrice) * 100;
-        profitAmount = position.quantity * priceDiff;
-        
-        // Check stop loss
-        if (percentChange <= -tradeSettings.stopLoss) {
-          shouldClose = true;
-          closeReason = 'Stop loss';
-          setNotification({
-            type: 'error',
-            message: `Stop loss triggered at ${currentPrice.toFixed(2)}`
-          });
-        }
-        
-        // Check take profit
-        if (percentChange >= tradeSettings.takeProfit) {
-          shouldClose = true;
-          closeReason = 'Take profit';
-          setNotification({
-            type: 'success',
-            message: `Take profit triggered at ${currentPrice.toFixed(2)}`
-          });
-        }
-      }
-      
-      // Close position if needed
-      if (shouldClose) {
-        await closePosition(profitAmount, closeReason);
-      }
-    } catch (error) {
-      console.error("Error checking stop loss/take profit:", error);
+  // Stop loss / take profit run on the prediction server against ingested bars; this tab only
+  // follows the close feed and mirrors a close of its own position, whoever caused it
+  const positionRef = useRef(position);
+  positionRef.current = position;
+
+  const handleServerClose = async (closed) => {
+    const current = positionRef.current;
+    if (current.status !== 'open' || !current.serverId || closed.position.id !== current.serverId) return;
+
+    const triggered = closed.reason === 'stop_loss' || closed.reason === 'take_profit';
+    const reason = closed.reason === 'stop_loss' ? 'Stop loss' : closed.reason === 'take_profit' ? 'Take profit' : 'Closed on server';
+    if (triggered) {
+      setNotification({
+        type: closed.reason === 'stop_loss' ? 'error' : 'success',
+        message: `${reason} triggered at ${closed.exit_price.toFixed(2)}`
+      });
     }
-  }, [position, tradeSettings.stopLoss, tradeSettings.takeProfit]);
+    await closePosition(closed.pnl, reason, closed.exit_price);
+  };
+  const handleServerCloseRef = useRef(handleServerClose);
+  handleServerCloseRef.current = handleServerClose;
+  // Id of the last close event seen, so a new subscription resumes after it instead of replaying the log
+  const lastCloseIdRef = useRef(0);
 
   // prediction based on current strategy model
   const fetchPrediction = useCallback(async () => {
@@ -328,10 +293,23 @@ const TradingInterface = ({ strategy }) => {
       const timestamp = new Date().toLocaleString();
       const currentModel = getCurrentModel();
       const modelDisplayName = getModelDisplayName();
+
+      // Register the position with its stop loss / take profit thresholds; the server enters at the latest stored close
+      const response = await axios.post(POSITIONS_URL, {
+        symbol: TRADING_SYMBOL,
+        side: type,
+        quantity,
+        stop_loss_pct: tradeSettings.stopLoss,
+        take_profit_pct: tradeSettings.takeProfit,
+        metadata: { model: currentModel, strategy }
+      });
+      const entryPrice = response.data.entry_price;
+      lastCloseIdRef.current = Math.max(lastCloseIdRef.current, response.data.last_close_id || 0);
       
       setPosition({
         type,
-        entryPrice: currentPrice,
+        serverId: response.data.id,
+        entryPrice,
         quantity: quantity,
         profit: 0,
         status: 'open',
@@ -346,7 +324,7 @@ const TradingInterface = ({ strategy }) => {
           id: Date.now(),
           type: type,
           action: 'OPEN',
-          price: currentPrice,
+          price: entryPrice,
           quantity: quantity,
           timestamp: timestamp,
           reason: `${formatStrategyName(strategy)} strategy signal`,
@@ -359,7 +337,7 @@ const TradingInterface = ({ strategy }) => {
       
       setNotification({
         type: 'info',
-        message: `${type.toUpperCase()} position opened at ${currentPrice.toFixed(2)} (${formatStrategyName(strategy)} strategy)`
+        message: `${type.toUpperCase()} position opened at ${entryPrice.toFixed(2)} (${formatStrategyName(strategy)} strategy)`
       });
       
       setTimeout(() => setNotification(null), 3000);
@@ -382,9 +360,9 @@ const TradingInterface = ({ strategy }) => {
   };
 
   // Closing the current position
-  const closePosition = async (profit = null, reason = 'Manual close') => {
+  const closePosition = async (profit = null, reason = 'Manual close', exitPrice = null) => {
     try {
-      const currentPrice = await getCurrentMarketPrice();
+      const currentPrice = exitPrice ?? await getCurrentMarketPrice();
       let profitAmount = profit;
       const timestamp = new Date().toLocaleString();
       const currentModel = position.model || getCurrentModel();
@@ -396,6 +374,13 @@ const TradingInterface = ({ strategy }) => {
         } else {
           profitAmount = position.quantity * (position.entryPrice - currentPrice);
         }
+        // Triggered closes are already closed on the server; manual ones are closed there too
+        if (position.serverId) {
+          await axios.delete(`${POSITIONS_URL}/${position.serverId}`, {
+            params: { price: currentPrice, reason },
+            validateStatus: (status) => status < 500,
+          });
+        }
       }
       
       setTradeHistory(prev => [
@@ -499,8 +484,7 @@ const TradingInterface = ({ strategy }) => {
         console.log(`Opening new ${signal.toUpperCase()} position immediately after closing`);
         await openPosition(signal);
       } else {
-        console.log(`Signal matches current position (${position.type}), checking stop loss/take profit...`);
-        await checkStopLossAndTakeProfit();
+        console.log(`Signal matches current position (${position.type}), stop loss/take profit are watched by the server`);
       }
     } else {
       console.log(`Opening new ${signal.toUpperCase()} position based on ${getModelDisplayName()} model signal`);
@@ -514,7 +498,6 @@ const TradingInterface = ({ strategy }) => {
     tradeSettings.maxTrades,
     getCurrentPrediction,
     getTradingSignalFromPrediction,
-    checkStopLossAndTakeProfit,
     openPosition,
     closePosition,
     fetchPrediction,
@@ -619,7 +602,8 @@ const TradingInterface = ({ strategy }) => {
     fetchPrediction();
     
     const predictionInterval = setInterval(() => {
-      if (isAutoTrading) {
+      // While the signal feed is connected, new predictions are pushed instead of polled
+      if (isAutoTrading && !isStreaming) {
         console.log(`Fetching fresh ${getModelDisplayName()} prediction for ${formatStrategyName(strategy)} auto trading...`);
         fetchPrediction();
       }
@@ -629,7 +613,69 @@ const TradingInterface = ({ strategy }) => {
       console.log("Cleaning up prediction interval");
       clearInterval(predictionInterval);
     };
-  }, [fetchPrediction, isAutoTrading, strategy, formatStrategyName, getModelDisplayName]);
+  }, [fetchPrediction, isAutoTrading, isStreaming, strategy, formatStrategyName, getModelDisplayName]);
+
+  // Subscribe to pushed signals for the current model (recomputed by the server only when data changes)
+  useEffect(() => {
+    const currentModel = getCurrentModel();
+    if (currentModel === 'momentum' || typeof EventSource === 'undefined') {
+      return undefined;
+    }
+    
+    const source = new EventSource(`${SIGNAL_FEED_URL}?symbols=AAPL&models=${currentModel}`);
+    source.onopen = () => setIsStreaming(true);
+    // EventSource reconnects by itself; polling covers the gap meanwhile
+    source.onerror = () => setIsStreaming(false);
+    source.addEventListener('signal', (event) => {
+      const data = JSON.parse(event.data);
+      if (data.model !== currentModel || !data.message) return;
+      
+      console.log(`Received pushed ${getModelDisplayName()} signal:`, data.message);
+      if (currentModel === 'sentiment') {
+        setSentimentPrediction(data.message);
+        setIsLoadingSentiment(false);
+      } else {
+        setMarketPrediction(data.message);
+        setIsLoading(false);
+      }
+      setLastSignal(data.message);
+    });
+    
+    return () => {
+      source.close();
+      setIsStreaming(false);
+    };
+  }, [getCurrentModel, getModelDisplayName]);
+
+  // Follow position closes while this tab has a position open on the server
+  useEffect(() => {
+    if (position.status !== 'open' || !position.serverId || typeof EventSource === 'undefined') {
+      return undefined;
+    }
+    
+    let source;
+    let retryTimer;
+    const connect = () => {
+      source = new EventSource(`${CLOSED_POSITIONS_URL}?since=${lastCloseIdRef.current}`);
+      source.addEventListener('close', (event) => {
+        const closed = JSON.parse(event.data);
+        lastCloseIdRef.current = Math.max(lastCloseIdRef.current, closed.id);
+        handleServerCloseRef.current(closed);
+      });
+      // Dropped connections are retried by EventSource with Last-Event-ID; a refused one (e.g. 503) is not
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          retryTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
+    connect();
+    
+    return () => {
+      clearTimeout(retryTimer);
+      source.close();
+    };
+  }, [position.status, position.serverId]);
 
   useEffect(() => {
     const priceUpdateInterval = setInterval(() => {
@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import backtest
+
+SWEEP_STRATEGIES = ("macd", "sma_crossover")
+DEFAULT_GRIDS = {
+    "macd": {"fast": [8, 10, 12, 15], "slow": [21, 26, 30, 35], "signal": [5, 7, 9, 12]},
+    "sma_crossover": {"short": [10, 20, 50, 100], "long": [100, 150, 200, 250]},
+}
+MAX_COMBINATIONS = 5000
+CHUNK_BYTES = 256 * 1024 * 1024  # Working-set budget for one chunk of symbols in a worker
+
+
+def parameter_grid(strategy, grid):
+    """Every window combination of `grid` where the fast/short window is below the slow/long one"""
+    names = tuple(DEFAULT_GRIDS[strategy])
+    values = [sorted({int(value) for value in grid.get(name, DEFAULT_GRIDS[strategy][name])}) for name in names]
+    if any(value < 1 for column in values for value in column):
+        raise ValueError("Window parameters must be positive integers")
+    combos = [dict(zip(names, combo)) for combo in itertools.product(*values)]
+    combos = [combo for combo in combos if combo[names[0]] < combo[names[1]]]
+    if not combos:
+        raise ValueError("The grid has no combination with a fast/short window below the slow/long window")
+    if len(combos) > MAX_COMBINATIONS:
+        raise ValueError(f"The grid has {len(combos)} combinations (at most {MAX_COMBINATIONS} are allowed)")
+    return combos
+
+
+def ema_bank(values, spans):
+    """ewm(span, adjust=False).mean() of every row of `values` for every span, shape (len(spans), rows, time)"""
+    return np.stack([backtest.ema(values, span) for span in spans])
+
+
+def evaluate_grid(close, strategy, combos, cost_bps=0.0, periods_per_year=backtest.PERIODS_PER_YEAR):
+    """Risk metrics of every combination on every row of `close`; returns {metric: (combos, rows)}"""
+    results = {name: np.empty((len(combos), close.shape[0])) for name in backtest.METRICS}
+
+    def store(index, positions):
+        metrics = backtest.run_backtest(close, positions, cost_bps, periods_per_year)["metrics"]
+        for name in backtest.METRICS:
+            results[name][index] = metrics[name]
+
+    if strategy == "sma_crossover":
+        windows = sorted({combo[name] for combo in combos for name in ("short", "long")})
+        averages = {window: backtest.rolling_mean(close, window) for window in windows}
+        for index, combo in enumerate(combos):
+            store(index, (averages[combo["short"]] > averages[combo["long"]]).astype(np.float64))
+        return results
+
+    # MACD: one EMA pass for every fast/slow span, then one pass for every signal span over every MACD line
+    spans = sorted({combo[name] for combo in combos for name in ("fast", "slow")})
+    emas = dict(zip(spans, ema_bank(close, spans)))
+    pairs = sorted({(combo["fast"], combo["slow"]) for combo in combos})
+    signal_spans = sorted({combo["signal"] for combo in combos})
+    macd_lines = np.stack([emas[fast] - emas[slow] for fast, slow in pairs])  # (pairs, rows, time)
+    rows = close.shape[0]
+    signal_lines = ema_bank(macd_lines.reshape(len(pairs) * rows, -1), signal_spans)
+    pair_index = {pair: i for i, pair in enumerate(pairs)}
+    signal_index = {span: i for i, span in enumerate(signal_spans)}
+    for index, combo in enumerate(combos):
+        p = pair_index[(combo["fast"], combo["slow"])]
+        macd = macd_lines[p]
+        signal_line = signal_lines[signal_index[combo["signal"]], p * rows:(p + 1) * rows]
+        store(index, backtest.hold_positions(backtest.crossover_signals(macd, signal_line)))
+    return results
+
+
+def _chunks(strategy, combos, shape, workers):
+    """(row start, row stop, combo start, combo stop) pieces of the grid.
+
+    Row ranges are small enough for the per-chunk working set; when there are fewer of them
+    than workers (one symbol, say), the combinations are split too so every worker gets a piece.
+    Combinations stay in grid order, so a MACD piece still shares most of its EMAs.
+    """
+    rows, bars = shape
+    if strategy == "macd":
+        pairs = len({(combo["fast"], combo["slow"]) for combo in combos})
+        signals = len({combo["signal"] for combo in combos})
+        spans = len({combo[name] for combo in combos for name in ("fast", "slow")})
+        arrays_per_row = spans + pairs * (signals + 1) + 8
+    else:
+        arrays_per_row = len({combo[name] for combo in combos for name in ("short", "long")}) + 8
+    by_memory = max(1, CHUNK_BYTES // (arrays_per_row * bars * 8))
+    size = max(1, min(by_memory, math.ceil(rows / max(workers, 1))))
+    row_ranges = [(start, min(start + size, rows)) for start in range(0, rows, size)]
+    groups = min(len(combos), max(1, math.ceil(workers / len(row_ranges))))
+    combo_size = math.ceil(len(combos) / groups)
+    return [
+        (start, stop, first, min(first + combo_size, len(combos)))
+        for start, stop in row_ranges for first in range(0, len(combos), combo_size)
+    ]
+
+
+# Set in each worker process by _attach_shared_close
+_shared = {}
+
+
+def _attach_shared_close(name, shape):
+    block = shared_memory.SharedMemory(name=name)
+    _shared["block"] = block
+    _shared["close"] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+def _evaluate_shared_chunk(strategy, combos, start, stop, cost_bps, periods_per_year):
+    return evaluate_grid(_shared["close"][start:stop], strategy, combos, cost_bps, periods_per_year)
+
+
+def _process_context():
+    # Not fork: sweeps start from server request threads, and a forked child can inherit a lock held by
+    # another thread that will never release it. The workers only need NumPy and the shared block.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Imported once by the fork server instead of by every worker (applies when it has not started yet)
+    context.set_forkserver_preload(["__main__", __name__])
+    return context
+
+
+def run_sweep(symbols, close, strategy, grid=None, cost_bps=0.0, workers=None, sort_by="sharpe_ratio", top=None,
+              periods_per_year=backtest.PERIODS_PER_YEAR):
+    """Evaluate a parameter grid over a (symbols, time) close matrix and rank the combinations.
+
+    Pieces of symbols x combinations are spread over a process pool; the close matrix is
+    placed in shared memory once and every worker maps it instead of receiving a pickled copy.
+    Each ranked row holds the combination and its metrics averaged over symbols.
+    """
+    if strategy not in SWEEP_STRATEGIES:
+        raise ValueError(f"strategy must be one of: {', '.join(SWEEP_STRATEGIES)}")
+    if sort_by not in backtest.METRICS:
+        raise ValueError(f"sort must be one of: {', '.join(backtest.METRICS)}")
+    combos = parameter_grid(strategy, grid or {})
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunks = _chunks(strategy, combos, close.shape, workers)
+    started = time.perf_counter()
+
+    if workers == 1 or len(chunks) == 1:
+        parts = [
+            evaluate_grid(close[start:stop], strategy, combos[first:last], cost_bps, periods_per_year)
+            for start, stop, first, last in chunks
+        ]
+    else:
+        block = shared_memory.SharedMemory(create=True, size=close.nbytes)
+        try:
+            np.ndarray(close.shape, dtype=np.float64, buffer=block.buf)[:] = close
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(chunks)), mp_context=_process_context(),
+                initializer=_attach_shared_close, initargs=(block.name, close.shape),
+            ) as pool:
+                futures = [
+                    pool.submit(_evaluate_shared_chunk, strategy, combos[first:last], start, stop, cost_bps, periods_per_year)
+                    for start, stop, first, last in chunks
+                ]
+                parts = [future.result() for future in futures]
+        finally:
+            block.close()
+            block.unlink()
+
+    metrics = {name: np.empty((len(combos), close.shape[0])) for name in backtest.METRICS}
+    for (start, stop, first, last), part in zip(chunks, parts):
+        for name in backtest.METRICS:
+            metrics[name][first:last, start:stop] = part[name]
+    means = {name: values.mean(axis=1) for name, values in metrics.items()}
+    order = np.argsort(-means[sort_by], kind="stable")
+    if top:
+        order = order[:top]
+    table = [
+        dict(rank=rank + 1, **combos[i], **{name: float(means[name][i]) for name in backtest.METRICS})
+        for rank, i in enumerate(order)
+    ]
+    return {
+        "strategy": strategy,
+        "symbols": list(symbols),
+        "bars": int(close.shape[1]),
+        "combinations": len(combos),
+        "cost_bps": cost_bps,
+        "sort": sort_by,
+        "workers": workers,
+        "elapsed_ms": round(1000 * (time.perf_counter() - started), 1),
+        "results": table,
+    }
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def main(argv=None):
+    from market_data import MarketDataStore, normalize_symbol, normalize_timeframe, periods_per_year, parse_window_options
+    from instrumentation import configure_logging
+
+    parser = argparse.ArgumentParser(description="Grid-search MACD or SMA crossover windows over stored symbols")
+    parser.add_argument("--symbols", default="AAPL", help="Comma separated tickers")
+    parser.add_argument("--strategy", choices=SWEEP_STRATEGIES, default="macd")
+    parser.add_argument("--timeframe", default="1d")
+    parser.add_argument("--start", help="First bar (epoch ms or date)")
+    parser.add_argument("--end", help="Last bar (epoch ms or date)")
+    parser.add_argument("--bars", type=int, help="Only the most recent N bars")
+    parser.add_argument("--fast", type=_int_list)
+    parser.add_argument("--slow", type=_int_list)
+    parser.add_argument("--signal", type=_int_list)
+    parser.add_argument("--short", type=_int_list)
+    parser.add_argument("--long", type=_int_list)
+    parser.add_argument("--cost-bps", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sort", default="sharpe_ratio", choices=backtest.METRICS)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    parser.add_argument("--json", action="store_true", help="Print the full result as JSON")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    timeframe = normalize_timeframe(args.timeframe)
+    symbols = [normalize_symbol(symbol) for symbol in args.symbols.split(",") if symbol.strip()]
+    store = MarketDataStore(args.data_dir, legacy_csv=os.path.join(args.data_dir, "stock_data.csv"), legacy_symbol="AAPL")
+    window = parse_window_options({"start": args.start, "end": args.end, "bars": args.bars}, timeframe)
+    series, errors = backtest.load_closes(store, symbols, timeframe, window)
+    for symbol, error in errors.items():
+        print(f"⚠️ Skipping {symbol}: {error}")
+    if not series:
+        print("❌ No stock data for the requested symbols")
+        return 1
+    panel_symbols, _, close = backtest.align_panel(series)
+
+    names = DEFAULT_GRIDS[args.strategy]
+    grid = {name: getattr(args, name) for name in names if getattr(args, name)}
+    result = run_sweep(
+        panel_symbols, close, args.strategy, grid, args.cost_bps, args.workers, args.sort, args.top,
+        periods_per_year(timeframe),
+    )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    print(f"✅ {result['combinations']} combinations x {len(panel_symbols)} symbols x {result['bars']} bars "
+          f"in {result['elapsed_ms'] / 1000:.2f}s (ranked by mean {args.sort})")
+    columns = ["rank", *names, *backtest.METRICS]
+    print("  ".join(f"{column:>17}" for column in columns))
+    for row in result["results"]:
+        print("  ".join(f"{row[column]:>17}" if isinstance(row[column], int) else f"{row[column]:>17.4f}" for column in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
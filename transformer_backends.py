@@ -0,0 +1,355 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from transformer_inference import LOOK_BACK
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("keras", "onnx", "onnx_int8", "tflite", "tflite_int8")
+# TFLite graphs have a fixed batch size: one graph for single windows, one for chunks of this many
+TFLITE_BATCH = 32
+# Largest absolute difference from the Keras forecast (in scaled units, 0..1) a converted model may show
+PARITY_TOLERANCE = {"onnx": 1e-4, "tflite": 1e-4, "onnx_int8": 0.02, "tflite_int8": 0.02}
+PARITY_WINDOWS = 512
+
+
+def artifact_paths(keras_path, backend):
+    """Files a backend is converted to, next to the Keras model (none for Keras itself)"""
+    base = os.path.splitext(keras_path)[0]
+    if backend == "keras":
+        return []
+    if backend in ("onnx", "onnx_int8"):
+        return [f"{base}{'.int8' if backend == 'onnx_int8' else ''}.onnx"]
+    suffix = ".int8" if backend == "tflite_int8" else ""
+    return [f"{base}.b{batch}{suffix}.tflite" for batch in (1, TFLITE_BATCH)]
+
+
+def is_stale(keras_path, backend):
+    """True when a converted file is missing or older than the Keras model it was made from"""
+    source_mtime = os.path.getmtime(keras_path)
+    return any(not os.path.exists(path) or os.path.getmtime(path) < source_mtime for path in artifact_paths(keras_path, backend))
+
+
+def parity_windows(count=PARITY_WINDOWS, seed=0):
+    """Random-walk look-back windows in the scaled 0..1 range the model sees"""
+    rng = np.random.default_rng(seed)
+    walks = np.cumsum(rng.normal(0, 0.02, (count, LOOK_BACK)), axis=1)
+    walks -= walks.min(axis=1, keepdims=True)
+    walks /= np.maximum(walks.max(axis=1, keepdims=True), 1e-9)
+    return (0.1 + 0.8 * walks)[..., np.newaxis].astype(np.float32)
+
+
+def parity_check(reference, candidate, tolerance, windows=None):
+    """Compare two (n, 1) forecasts; the BUY/SELL direction is compared against each window's last value"""
+    windows = parity_windows() if windows is None else windows
+    expected = np.asarray(reference(windows), dtype=np.float64).reshape(-1)
+    actual = np.asarray(candidate(windows), dtype=np.float64).reshape(-1)
+    error = np.abs(actual - expected)
+    last = windows[:, -1, 0]
+    agreement = float(np.mean(np.sign(expected - last) == np.sign(actual - last)))
+    return {
+        "windows": len(windows),
+        "max_abs_error": float(error.max()),
+        "mean_abs_error": float(error.mean()),
+        "direction_agreement": agreement,
+        "tolerance": tolerance,
+        "passed": bool(error.max() <= tolerance),
+    }
+
+
+def _replace(tmp_path, path):
+    os.replace(tmp_path, path)
+    return path
+
+
+def convert(keras_path, backend):
+    """Convert the Keras model to `backend`'s files and check them against the Keras output.
+
+    Needs TensorFlow (plus tf2onnx and onnxruntime for ONNX); the converted files do not.
+    Raises ValueError, and keeps no files, when the converted model fails the parity check.
+    """
+    if backend == "keras":
+        return None
+    import tensorflow as tf
+    from keras.models import load_model
+
+    model = load_model(keras_path, compile=False)
+    paths = artifact_paths(keras_path, backend)
+    tmp_paths = [f"{path}.{uuid.uuid4().hex}.tmp" for path in paths]
+    try:
+        if backend == "onnx":
+            import tf2onnx
+            signature = [tf.TensorSpec((None, LOOK_BACK, 1), tf.float32, name="window")]
+            forward = tf.function(lambda window: model(window, training=False), input_signature=signature, autograph=False)
+            tf2onnx.convert.from_function(forward, input_signature=signature, opset=17, output_path=tmp_paths[0])
+        elif backend == "onnx_int8":
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            source = artifact_paths(keras_path, "onnx")[0]
+            if is_stale(keras_path, "onnx"):
+                convert(keras_path, "onnx")
+            # Weights stored as int8, activations quantized on the fly
+            quantize_dynamic(source, tmp_paths[0], weight_type=QuantType.QInt8)
+        else:
+            for tmp_path, batch in zip(tmp_paths, (1, TFLITE_BATCH)):
+                signature = [tf.TensorSpec((batch, LOOK_BACK, 1), tf.float32, name="window")]
+                forward = tf.function(lambda window: model(window, training=False), input_signature=signature, autograph=False)
+                converter = tf.lite.TFLiteConverter.from_concrete_functions([forward.get_concrete_function()])
+                if backend == "tflite_int8":
+                    # Dynamic-range quantization: int8 weights, float activations
+                    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                with open(tmp_path, "wb") as f:
+                    f.write(converter.convert())
+
+        candidate = _load(backend, tmp_paths)
+        report = parity_check(lambda windows: model.predict(windows, verbose=0), candidate.predict, PARITY_TOLERANCE[backend])
+        if not report["passed"]:
+            raise ValueError(
+                f"{backend} conversion of {os.path.basename(keras_path)} differs from Keras by up to "
+                f"{report['max_abs_error']:.2e} (tolerance {report['tolerance']:.0e})"
+            )
+        for tmp_path, path in zip(tmp_paths, paths):
+            _replace(tmp_path, path)
+        logger.info(f"✅ Converted {os.path.basename(keras_path)} to {backend}: max error {report['max_abs_error']:.2e}, "
+                    f"direction agreement {100 * report['direction_agreement']:.1f}%")
+        return report
+    finally:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, keras_path):
+        from keras.models import load_model
+        self.model = load_model(keras_path)
+
+    def predict(self, windows):
+        return self.model.predict(windows, verbose=0)
+
+
+class OnnxBackend:
+    def __init__(self, path, name="onnx", threads=None):
+        import onnxruntime
+        self.name = name
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, windows):
+        return self.session.run(None, {self.input_name: np.asarray(windows, dtype=np.float32)})[0]
+
+
+def _tflite_interpreter(path, threads=None):
+    # The standalone runtimes avoid importing TensorFlow; fall back to TensorFlow's own interpreter
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    interpreter = Interpreter(model_path=path, num_threads=threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+class TFLiteBackend:
+    """Fixed-batch TFLite graphs: full chunks go through the large graph, the remainder one window at a time"""
+
+    def __init__(self, paths, name="tflite", threads=None):
+        self.name = name
+        self._lock = threading.Lock()  # An interpreter runs one invoke at a time
+        self._graphs = []
+        for path in paths:
+            interpreter = _tflite_interpreter(path, threads)
+            inputs, outputs = interpreter.get_input_details()[0], interpreter.get_output_details()[0]
+            self._graphs.append((int(inputs["shape"][0]), interpreter, inputs["index"], outputs["index"]))
+        self._graphs.sort(key=lambda graph: -graph[0])
+
+    def predict(self, windows):
+        windows = np.asarray(windows, dtype=np.float32)
+        out = np.empty((len(windows), 1), dtype=np.float32)
+        start = 0
+        with self._lock:
+            for batch, interpreter, input_index, output_index in self._graphs:
+                while len(windows) - start >= batch:
+                    interpreter.set_tensor(input_index, windows[start:start + batch])
+                    interpreter.invoke()
+                    out[start:start + batch] = interpreter.get_tensor(output_index).reshape(batch, -1)[:, :1]
+                    start += batch
+        return out
+
+
+def _load(backend, paths, threads=None):
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxBackend(paths[0], backend, threads)
+    return TFLiteBackend(paths, backend, threads)
+
+
+def load_backend(backend, keras_path, threads=None, convert_missing=True):
+    """Inference backend with a `predict(windows)` method, converting the Keras model first when needed"""
+    if backend not in BACKENDS:
+        raise ValueError(f"TRANSFORMER_BACKEND must be one of: {', '.join(BACKENDS)}")
+    if backend == "keras":
+        return KerasBackend(keras_path)
+    if is_stale(keras_path, backend):
+        if not convert_missing:
+            raise FileNotFoundError(f"No up-to-date {backend} conversion of {keras_path}; run transformer_backends.py convert")
+        logger.info(f"🔄 Converting {os.path.basename(keras_path)} to {backend}...")
+        convert(keras_path, backend)
+    return _load(backend, artifact_paths(keras_path, backend), threads)
+
+
+def _rss_mb():
+    # Current resident set size; falls back to the peak where /proc is not available
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    divisor = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+
+
+def measure_backend(backend, keras_path, iterations=50, batch=512, output=None):
+    """Load time, memory, latency and throughput of one backend, measured in the current (fresh) process"""
+    from benchmark import measure
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    model = load_backend(backend, keras_path, convert_missing=False)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = _rss_mb()
+
+    single = parity_windows(1)
+    batch_windows = parity_windows(batch)
+    result = {
+        "backend": backend,
+        "load_s": round(load_seconds, 3),
+        "rss_mb": round(rss_loaded, 1),
+        "rss_model_mb": round(rss_loaded - rss_before, 1),
+        "file_mb": round(sum(os.path.getsize(path) for path in artifact_paths(keras_path, backend) or [keras_path]) / 2**20, 3),
+        "single": measure(lambda: model.predict(single), iterations),
+        "batch": measure(lambda: model.predict(batch_windows), max(3, iterations // 10)),
+    }
+    result["batch"]["windows_per_s"] = round(batch * result["batch"]["throughput_per_s"], 1)
+    result["rss_after_mb"] = round(_rss_mb(), 1)
+    if output:
+        np.save(output, np.asarray(model.predict(parity_windows()), dtype=np.float64))
+    return result
+
+
+def benchmark_backends(backends, keras_path, iterations=50, batch=512):
+    """Measure every backend in its own subprocess (so imports and memory do not mix) and check parity with Keras"""
+    results = {}
+    outputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            output = os.path.join(tmp, f"{backend}.npy")
+            command = [
+                sys.executable, os.path.abspath(__file__), "measure", "--backend", backend, "--model", keras_path,
+                "--iterations", str(iterations), "--batch", str(batch), "--forecasts", output,
+            ]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                results[backend] = {"backend": backend, "error": completed.stderr.strip().splitlines()[-1:] or ["failed"]}
+                continue
+            results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+            outputs[backend] = np.load(output)
+
+    if "keras" in outputs:
+        last = parity_windows()[:, -1, 0]
+        for backend, forecasts in outputs.items():
+            error = np.abs(forecasts - outputs["keras"]).reshape(-1)
+            results[backend]["parity"] = {
+                "max_abs_error": float(error.max()),
+                "mean_abs_error": float(error.mean()),
+                "direction_agreement": float(np.mean(
+                    np.sign(forecasts.reshape(-1) - last) == np.sign(outputs["keras"].reshape(-1) - last)
+                )),
+            }
+    return results
+
+
+def main(argv=None):
+    default_model = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "Transformer_model.h5")
+    parser = argparse.ArgumentParser(description="Convert the Transformer model to ONNX/TFLite and compare the backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="Convert the Keras model and check parity")
+    convert_parser.add_argument("--backends", default="onnx,onnx_int8", help=f"Comma separated: {', '.join(BACKENDS[1:])}")
+    bench_parser = commands.add_parser("benchmark", help="Latency, throughput, memory and parity of every backend")
+    bench_parser.add_argument("--backends", default=",".join(BACKENDS))
+    bench_parser.add_argument("--output", help="Write the results as JSON")
+    measure_parser = commands.add_parser("measure", help="Measure one backend in this process (run by benchmark)")
+    measure_parser.add_argument("--backend", required=True, choices=BACKENDS)
+    measure_parser.add_argument("--forecasts")
+    for sub in (convert_parser, bench_parser, measure_parser):
+        sub.add_argument("--model", default=default_model, help="Keras .h5 model")
+    for sub in (bench_parser, measure_parser):
+        sub.add_argument("--iterations", type=int, default=50, help="Timed single-window calls")
+        sub.add_argument("--batch", type=int, default=512, help="Windows per batch call")
+    args = parser.parse_args(argv)
+
+    if args.command == "measure":
+        print(json.dumps(measure_backend(args.backend, args.model, args.iterations, args.batch, args.forecasts)))
+        return 0
+
+    from instrumentation import configure_logging
+    configure_logging()
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = [name for name in backends if name not in BACKENDS]
+    if unknown:
+        parser.error(f"Unknown backends: {', '.join(unknown)}")
+
+    if args.command == "convert":
+        failed = False
+        for backend in backends:
+            try:
+                convert(args.model, backend)
+            except (ValueError, ImportError) as e:
+                print(f"❌ {backend}: {str(e)}")
+                failed = True
+        return 1 if failed else 0
+
+    # Benchmarks only measure existing conversions; create any missing ones first
+    for backend in backends:
+        if backend != "keras" and is_stale(args.model, backend):
+            convert(args.model, backend)
+    results = benchmark_backends(backends, args.model, args.iterations, args.batch)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    columns = ("backend", "load_s", "rss_mb", "file_mb", "single_p50_ms", "single_p95_ms", "batch_windows_per_s", "max_abs_error", "agreement")
+    print("  ".join(f"{column:>19}" for column in columns))
+    for backend, result in results.items():
+        if "error" in result:
+            print(f"{backend:>19}  ❌ {' '.join(result['error'])}")
+            continue
+        parity = result.get("parity", {})
+        values = (
+            backend, result["load_s"], result["rss_mb"], result["file_mb"], result["single"]["p50_ms"], result["single"]["p95_ms"],
+            result["batch"]["windows_per_s"], parity.get("max_abs_error", float("nan")), parity.get("direction_agreement", float("nan")),
+        )
+        print("  ".join(f"{value:>19}" if isinstance(value, str) else f"{value:>19.4g}" for value in values))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
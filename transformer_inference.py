@@ -0,0 +1,296 @@
+import time
+import threading
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from instrumentation import metrics
+from indicators import align_window
+
+LOOK_BACK = 60
+BATCH_SECONDS = metrics.histogram("algotrade_model_batch_seconds", "Model predict time per micro-batch", ("model",))
+BATCH_WINDOWS = metrics.histogram(
+    "algotrade_model_batch_windows", "Windows per micro-batch", ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096),
+)
+
+
+def build_windows(scaled, look_back=LOOK_BACK):
+    """Look-back window preceding every bar after the first `look_back`, shape (n, look_back, 1).
+
+    A strided view over `scaled`: no per-window copies are made.
+    """
+    scaled = np.asarray(scaled).reshape(-1)
+    return sliding_window_view(scaled[:-1], look_back)[..., np.newaxis]
+
+
+def generate_signals(predicted, actual):
+    """BUY when the forecast for a bar is above the previous actual close, SELL when below"""
+    signals = np.full(len(predicted), "HOLD", dtype="<U4")
+    signals[1:][predicted[1:] > actual[:-1]] = "BUY"
+    signals[1:][predicted[1:] < actual[:-1]] = "SELL"
+    return signals
+
+
+class _ForecastState:
+    def __init__(self):
+        self.version = None
+        # The bars covered, to place windows and tell appended bars from rewritten ones
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.close = np.empty(0)
+        self.predicted = np.empty(0)  # one per covered bar after the first look_back
+        self.actual = np.empty(0)
+        self.signals = np.empty(0, dtype="<U4")
+
+
+class TransformerForecaster:
+    """Transformer forecasts per series (symbol and timeframe), shared by every window of it.
+
+    A window inside the covered bars is sliced out of the cached forecasts, and the model only
+    runs on windows of bars after them, so a "most recent N bars" window costs O(new bars).
+    """
+
+    def __init__(self, look_back=LOOK_BACK):
+        self.look_back = look_back
+        self._lock = threading.Lock()
+        self._states = {}
+        self._locks = {}
+        self.cached = 0
+        self.incremental = 0
+        self.full = 0
+
+    def forecast(self, symbol, version, close, predict_fn, scaler, full=False, timestamps=None):
+        """Return (predicted, actual, signals) for every bar of `close` after the look-back period.
+
+        `predict_fn` maps a (n, look_back, 1) window batch to (n, 1) scaled forecasts.
+        `timestamps` place the bars within the series (bar positions when omitted, i.e. `close`
+        is the whole history). With `full=True` every window is re-run instead of only the new ones.
+        """
+        close = np.asarray(close, dtype=np.float64)
+        if len(close) <= self.look_back:
+            raise ValueError(f"Need more than {self.look_back} bars for a forecast, got {len(close)}")
+        timestamps = np.arange(len(close)) if timestamps is None else np.asarray(timestamps, dtype=np.int64)
+
+        with self._lock:
+            state = self._states.setdefault(symbol, _ForecastState())
+            lock = self._locks.setdefault(symbol, threading.Lock())
+
+        with lock:
+            placed = None
+            if not full and state.version == version:
+                # Same data: finding the window's first and last bar is enough
+                offset = int(np.searchsorted(state.timestamps, timestamps[0]))
+                stop = offset + len(close)
+                if stop <= len(state.timestamps) and state.timestamps[offset] == timestamps[0] \
+                        and state.timestamps[stop - 1] == timestamps[-1]:
+                    self.cached += 1
+                    return self._slice(state, offset, len(close))
+            if not full:
+                # Every covered bar of the window must be unchanged; a corrected bar means a full pass
+                placed = align_window(state.timestamps, state.close, timestamps, close)
+
+            if placed is None:
+                self.full += 1
+                offset = 0
+                scaled = scaler.transform(close.reshape(-1, 1))
+                state.predicted, state.actual = self._run(scaled, predict_fn, scaler)
+                state.timestamps, state.close = timestamps.copy(), close.copy()
+                state.signals = generate_signals(state.predicted, state.actual)
+            else:
+                offset, overlap = placed
+                if overlap < len(close):
+                    self.incremental += 1
+                    # The last look_back covered closes feed the first new window
+                    tail = np.concatenate([state.close[-self.look_back:], close[overlap:]])
+                    new_predicted, new_actual = self._run(scaler.transform(tail.reshape(-1, 1)), predict_fn, scaler)
+                    state.predicted = np.concatenate([state.predicted, new_predicted])
+                    state.actual = np.concatenate([state.actual, new_actual])
+                    state.timestamps = np.concatenate([state.timestamps, timestamps[overlap:]])
+                    state.close = np.concatenate([state.close, close[overlap:]])
+                    state.signals = generate_signals(state.predicted, state.actual)
+                else:
+                    self.cached += 1
+            for values in (state.predicted, state.actual, state.signals):
+                values.flags.writeable = False
+            state.version = version
+            return self._slice(state, offset, len(close))
+
+    def _run(self, scaled, predict_fn, scaler):
+        predicted = scaler.inverse_transform(predict_fn(build_windows(scaled, self.look_back))).flatten()
+        actual = scaler.inverse_transform(scaled[self.look_back:]).flatten()
+        return predicted, actual
+
+    def _slice(self, state, offset, bars):
+        # Forecast i belongs to covered bar i + look_back
+        stop = offset + bars - self.look_back
+        signals = state.signals[offset:stop]
+        if offset:
+            # A window's first forecast has no earlier one in the window to compare with
+            signals = signals.copy()
+            signals[0] = "HOLD"
+            signals.flags.writeable = False
+        return state.predicted[offset:stop], state.actual[offset:stop], signals
+
+    def clear(self):
+        """Forget every cached forecast (e.g. after the model weights changed)"""
+        with self._lock:
+            self._states.clear()
+            self._locks.clear()
+
+    def stats(self):
+        return {"cached": self.cached, "incremental": self.incremental, "full": self.full}
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the batcher cannot accept more windows within the caller's timeout"""
+
+
+class _PendingBatch:
+    def __init__(self, windows):
+        self.windows = windows
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.started = False    # taken into a model call
+        self.cancelled = False  # given up by its caller before it was taken
+
+
+class MicroBatcher:
+    """Merges window batches from concurrent callers into one model call.
+
+    The first queued request waits at most `max_latency` seconds for others to
+    join; at most `max_batch` windows go into a single call (a larger request is
+    sent on its own). Callers block while more than `max_queue` windows are
+    waiting, and get InferenceQueueFull if no room frees up within `timeout`.
+    """
+
+    def __init__(self, predict_fn, max_latency=0.005, max_batch=512, max_queue=8192, name="transformer"):
+        self.predict_fn = predict_fn
+        self.name = name
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._queued_windows = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.windows = 0
+        self.max_batch_seen = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def predict(self, windows, timeout=30.0):
+        windows = np.asarray(windows)
+        pending = _PendingBatch(windows)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._worker is None:
+                # Started on first use so forking servers do not inherit a running thread
+                self._worker = threading.Thread(target=self._run, name="transformer-batcher", daemon=True)
+                self._worker.start()
+            while self._queued_windows and self._queued_windows + len(windows) > self.max_queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise InferenceQueueFull(f"{self._queued_windows} windows already queued")
+                self._cond.wait(remaining)
+            self._queue.append(pending)
+            self._queued_windows += len(windows)
+            self._cond.notify_all()
+
+        if not pending.done.wait(max(deadline - time.monotonic(), 0)):
+            with self._cond:
+                self.timed_out += 1
+                if not pending.started:
+                    # Nobody waits for the result any more: free its queue room and let the worker skip it
+                    pending.cancelled = True
+                    self._queued_windows -= len(windows)
+                    self._cond.notify_all()
+            raise TimeoutError("Transformer inference timed out")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _drop_cancelled(self):
+        # Caller holds the condition; cancelled requests already gave their windows back
+        while self._queue and self._queue[0].cancelled:
+            self._queue.popleft()
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                self._drop_cancelled()
+                while not self._queue:
+                    self._cond.wait()
+                    self._drop_cancelled()
+                # Give concurrent callers until the oldest request's latency budget runs out to join
+                flush_at = self._queue[0].enqueued_at + self.max_latency
+                while self._queued_windows < self.max_batch:
+                    remaining = flush_at - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch, size = [], 0
+                while self._queue and (not batch or size + len(self._queue[0].windows) <= self.max_batch):
+                    pending = self._queue.popleft()
+                    if pending.cancelled:
+                        continue
+                    pending.started = True
+                    batch.append(pending)
+                    size += len(pending.windows)
+                if not batch:
+                    continue  # Every waiting request timed out meanwhile
+                self._queued_windows -= size
+                self._cond.notify_all()
+                return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._next_batch()
+            try:
+                merged = batch[0].windows if len(batch) == 1 else np.concatenate([p.windows for p in batch])
+                started = time.perf_counter()
+                output = np.asarray(self.predict_fn(merged))
+                BATCH_SECONDS.observe(time.perf_counter() - started, model=self.name)
+                BATCH_WINDOWS.observe(size, model=self.name)
+                offset = 0
+                for pending in batch:
+                    pending.result = output[offset:offset + len(pending.windows)]
+                    offset += len(pending.windows)
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+
+            finished = time.perf_counter()
+            with self._cond:
+                self.batches += 1
+                self.requests += len(batch)
+                self.windows += size
+                self.max_batch_seen = max(self.max_batch_seen, size)
+                for pending in batch:
+                    latency = finished - pending.enqueued_at
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue),
+                "queued_windows": self._queued_windows,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": self.windows / self.batches if self.batches else 0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_latency_ms": 1000 * self.latency_total / self.requests if self.requests else 0,
+                "max_latency_ms": 1000 * self.latency_max,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
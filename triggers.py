@@ -0,0 +1,245 @@
+import time
+import bisect
+import itertools
+import threading
+from collections import deque
+
+SIDES = ("buy", "sell")
+STOP_LOSS, TAKE_PROFIT = "stop_loss", "take_profit"
+
+
+def thresholds_from_percent(side, entry_price, stop_loss_pct=None, take_profit_pct=None):
+    """Absolute (stop_loss, take_profit) prices from percentages of the entry price"""
+    direction = 1 if side == "buy" else -1
+    stop_loss = entry_price * (1 - direction * stop_loss_pct / 100) if stop_loss_pct is not None else None
+    take_profit = entry_price * (1 + direction * take_profit_pct / 100) if take_profit_pct is not None else None
+    return stop_loss, take_profit
+
+
+def bar_fill_price(side, kind, threshold, open_):
+    """Fill of a trigger a bar reached: the threshold, or the open when the bar gapped through it"""
+    below_entry = (side == "buy") == (kind == STOP_LOSS)
+    # A gap past the threshold fills at the open, which is worse than the threshold
+    return min(open_, threshold) if below_entry else max(open_, threshold)
+
+
+class Position:
+    def __init__(self, position_id, symbol, side, quantity, entry_price, stop_loss, take_profit, metadata):
+        self.id = position_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.entry_price = entry_price
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.metadata = metadata or {}
+        self.opened_at = int(time.time() * 1000)
+
+    def pnl(self, price):
+        return self.quantity * (price - self.entry_price if self.side == "buy" else self.entry_price - price)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "side": self.side,
+            "quantity": self.quantity,
+            "entry_price": self.entry_price,
+            "stop_loss": self.stop_loss,
+            "take_profit": self.take_profit,
+            "opened_at": self.opened_at,
+            "metadata": self.metadata,
+        }
+
+
+class _TriggerBook:
+    """Thresholds of one symbol in two sorted arrays, ordered so that crossed triggers form the tail.
+
+    `falling` fires when the price drops to or below a threshold (long stop-loss, short
+    take-profit) and is sorted ascending by threshold; `rising` fires when the price reaches
+    a threshold from below (long take-profit, short stop-loss) and is sorted by -threshold.
+    A price move therefore costs one binary search per array plus cutting off the k crossed
+    entries: O(log n + k).
+    """
+
+    def __init__(self):
+        self.falling = []  # (threshold, position id, kind)
+        self.rising = []   # (-threshold, position id, kind)
+
+    def __len__(self):
+        return len(self.falling) + len(self.rising)
+
+    def _array(self, side, kind):
+        # Long stops and short targets sit below the entry price
+        return self.falling if (side == "buy") == (kind == STOP_LOSS) else self.rising
+
+    def _entry(self, side, kind, threshold, position_id):
+        array = self._array(side, kind)
+        return array, ((threshold if array is self.falling else -threshold), position_id, kind)
+
+    def add(self, side, kind, threshold, position_id):
+        array, entry = self._entry(side, kind, threshold, position_id)
+        bisect.insort(array, entry)
+
+    def remove(self, side, kind, threshold, position_id):
+        array, entry = self._entry(side, kind, threshold, position_id)
+        index = bisect.bisect_left(array, entry)
+        if index < len(array) and array[index] == entry:
+            del array[index]
+
+    def crossed(self, low, high):
+        """Remove and return (threshold, position id, kind) of every trigger within reach of [low, high]"""
+        fired = []
+        index = bisect.bisect_left(self.falling, (low,))
+        if index < len(self.falling):
+            fired.extend(self.falling[index:])
+            del self.falling[index:]
+        index = bisect.bisect_left(self.rising, (-high,))
+        if index < len(self.rising):
+            fired.extend((-threshold, position_id, kind) for threshold, position_id, kind in self.rising[index:])
+            del self.rising[index:]
+        return fired
+
+
+class TriggerEngine:
+    """Open positions across symbols with stop-loss/take-profit thresholds fired by incoming prices.
+
+    Closes (triggered or manual) are appended to a bounded log with increasing ids, which
+    readers follow with `closed_since` or `wait_for_closed`.
+    """
+
+    def __init__(self, max_closed=10000):
+        self._lock = threading.Lock()
+        self._closed_changed = threading.Condition(self._lock)
+        self._books = {}
+        self._positions = {}
+        self._position_ids = itertools.count(1)
+        self._event_ids = itertools.count(1)
+        self._closed = deque(maxlen=max_closed)
+        self.ticks = 0
+        self.fired = 0
+
+    def open(self, symbol, side, quantity, entry_price, stop_loss=None, take_profit=None, metadata=None):
+        """Register a position; raises ValueError when the thresholds are on the wrong side of the entry"""
+        if side not in SIDES:
+            raise ValueError(f"side must be one of: {', '.join(SIDES)}")
+        if not quantity > 0 or not entry_price > 0:
+            raise ValueError("quantity and entry_price must be positive")
+        below, above = (stop_loss, take_profit) if side == "buy" else (take_profit, stop_loss)
+        if below is not None and not below < entry_price:
+            raise ValueError(f"{'stop_loss' if side == 'buy' else 'take_profit'} must be below the entry price for a {side}")
+        if above is not None and not above > entry_price:
+            raise ValueError(f"{'take_profit' if side == 'buy' else 'stop_loss'} must be above the entry price for a {side}")
+
+        with self._lock:
+            position = Position(next(self._position_ids), symbol, side, quantity, entry_price, stop_loss, take_profit, metadata)
+            self._positions[position.id] = position
+            book = self._books.setdefault(symbol, _TriggerBook())
+            for kind, threshold in ((STOP_LOSS, stop_loss), (TAKE_PROFIT, take_profit)):
+                if threshold is not None:
+                    book.add(side, kind, threshold, position.id)
+            return position.to_dict()
+
+    def _close(self, position, price, reason, threshold=None, timestamp=None):
+        # Caller holds the lock and has already taken the fired trigger out of the book
+        del self._positions[position.id]
+        book = self._books[position.symbol]
+        for kind, level in ((STOP_LOSS, position.stop_loss), (TAKE_PROFIT, position.take_profit)):
+            if level is not None and kind != reason:
+                book.remove(position.side, kind, level, position.id)
+        if not book:
+            del self._books[position.symbol]
+        event = {
+            "id": next(self._event_ids),
+            "position": position.to_dict(),
+            "reason": reason,
+            "threshold": threshold,
+            "exit_price": price,
+            "pnl": position.pnl(price),
+            "closed_at": int(timestamp if timestamp is not None else time.time() * 1000),
+        }
+        self._closed.append(event)
+        return event
+
+    def close(self, position_id, price, reason="manual"):
+        """Close a position by hand; raises KeyError for unknown ids"""
+        with self._lock:
+            position = self._positions[position_id]
+            if reason in (STOP_LOSS, TAKE_PROFIT):
+                raise ValueError("Manual closes cannot use a trigger reason")
+            event = self._close(position, price, reason)
+            self._closed_changed.notify_all()
+            return event
+
+    def on_price(self, symbol, price, timestamp=None):
+        """Fire the triggers crossed by a price tick; fills at the tick price"""
+        return self._on_move(symbol, price, price, None, timestamp)
+
+    def on_bar(self, symbol, open_, high, low, timestamp=None):
+        """Fire the triggers a bar reached; fills at the threshold, or at the open when the bar gapped through it.
+
+        If a bar reached both thresholds of a position the stop-loss is assumed to have come first.
+        """
+        return self._on_move(symbol, low, high, open_, timestamp)
+
+    def _on_move(self, symbol, low, high, open_, timestamp):
+        with self._lock:
+            self.ticks += 1
+            book = self._books.get(symbol)
+            if book is None:
+                return []
+            fired = {}
+            for threshold, position_id, kind in book.crossed(low, high):
+                if position_id not in fired or kind == STOP_LOSS:
+                    fired[position_id] = (threshold, kind)
+            events = []
+            for position_id, (threshold, kind) in fired.items():
+                position = self._positions[position_id]
+                price = low if open_ is None else bar_fill_price(position.side, kind, threshold, open_)
+                events.append(self._close(position, price, kind, threshold, timestamp))
+            self.fired += len(events)
+            if events:
+                self._closed_changed.notify_all()
+            return events
+
+    def has_positions(self, symbol):
+        with self._lock:
+            return symbol in self._books
+
+    def positions(self, symbol=None):
+        with self._lock:
+            return [position.to_dict() for position in self._positions.values() if symbol is None or position.symbol == symbol]
+
+    def closed_since(self, since=0, limit=1000):
+        """Close events with an id above `since`, oldest first"""
+        with self._lock:
+            return self._closed_since(since, limit)
+
+    def _closed_since(self, since, limit):
+        if not self._closed:
+            return []
+        # Ids are consecutive, so the first wanted event is found by offset
+        start = max(0, since - self._closed[0]["id"] + 1)
+        return list(itertools.islice(self._closed, start, start + limit))
+
+    def last_closed_id(self):
+        """Id of the newest close event (0 before the first), a `since` cursor that skips every earlier close"""
+        with self._lock:
+            return self._closed[-1]["id"] if self._closed else 0
+
+    def wait_for_closed(self, since, timeout):
+        """Like closed_since, but blocks up to `timeout` seconds until there is something to return"""
+        with self._lock:
+            self._closed_changed.wait_for(lambda: self._closed and self._closed[-1]["id"] > since, timeout)
+            return self._closed_since(since, 1000)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_positions": len(self._positions),
+                "symbols": len(self._books),
+                "triggers": sum(len(book) for book in self._books.values()),
+                "ticks": self.ticks,
+                "fired": self.fired,
+                "closed_logged": len(self._closed),
+            }